@@ -1,11 +1,29 @@
-from channels.routing import ProtocolTypeRouter, URLRouter
+"""
+ASGI config for QApp project: HTTP, WebSockets (Channels) and the lifespan
+protocol (warmup and shutdown, see app/serving.py).
+
+Serve with an ASGI server, e.g.
+    gunicorn QApp.asgi:application -k uvicorn_worker.UvicornWorker
+"""
+
+import os
+
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
-import app.routing
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'QApp.settings')
+
+# Sets up Django; must run before anything importing models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+import app.routing  # noqa: E402
+from app.serving import lifespan  # noqa: E402
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(app.routing.websocket_urlpatterns)
     ),
+    "lifespan": lifespan,
 })
@@ -45,7 +45,7 @@ INSTALLED_APPS = [
     'channels',
 ]
 
-ASGI_APPLICATION = "app.asgi.application"
+ASGI_APPLICATION = "QApp.asgi.application"
 
 CHANNEL_LAYERS = {
     "default": {
@@ -54,6 +54,16 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared by all worker processes: the object cache and its fill locks,
+# live counters, throttle counters and cached row counts. A per-process
+# backend (LocMem) would make each of those per process.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+    },
+}
+
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -89,13 +99,64 @@ WSGI_APPLICATION = 'QApp.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'app.renderers.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'app.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Scopes used by app.throttling.KeyedRateThrottle.
+    'DEFAULT_THROTTLE_RATES': {
+        'post_create': '10/min',
+        'react': '60/min',
+        'save': '60/min',
+        'story_like': '30/min',
+        'anon_login': '20/hour',
+    },
 }
 
+# The browsable API is a development aid only; keep it out of production
+# content negotiation.
+if DEBUG:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
+
+# JSON backend used by the REST renderer/parser and the chat consumer:
+# "orjson", "stdlib", or None to pick orjson when it is installed.
+FAST_JSON_BACKEND = None
+
+# Run background jobs (app/jobs.py) right after the enqueuing transaction
+# commits instead of leaving them to `manage.py run_jobs`. Deployments run
+# the worker as its own container (see Jenkinsfile); turn this on where
+# nothing runs it.
+JOBS_RUN_EAGERLY = False
+
+# Paginated lists and admin changelists report an estimated row count
+# (planner statistics) above this many rows; counts are cached for TTL seconds.
+ESTIMATED_COUNT_THRESHOLD = 10000
+ESTIMATED_COUNT_TTL = 30
+
+# Throttle counters: "cache" shares them through CACHES (Redis), "local"
+# keeps them per process.
+THROTTLE_BACKEND = "cache"
+
+# ASGI lifespan (app/serving.py): warm up before accepting traffic.
+ASGI_WARMUP = True
+
+# Near-duplicate post index written by `manage.py build_duplicate_index`
+# and memory-mapped by every worker (app/duplicates.py).
+DUPLICATE_INDEX_PATH = BASE_DIR / "var" / "duplicates.idx"
+
+# Threads that run the items of one /api/batch/ request concurrently
+# (app/batch.py); 1 runs them one after another in the request thread.
+BATCH_THREADS = 4
+
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Your API',
@@ -1,11 +1,16 @@
 from django.contrib import admin
-from .models import User, Profile, TemporaryUser, Tag, Post, Reply, Reaction, ReplyReaction
+from .models import User, Profile, TemporaryUser, Tag, Post, Reply, Reaction, ReplyReaction, ImportJob, BackgroundJob
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from .jobs import enqueue
+from .counting import EstimatedCountPaginator
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'display_name', 'is_anonymous_by_default', 'created_at')
-    search_fields = ('user__username', 'display_name')
+    search_fields = ('user__email', 'display_name')
     list_filter = ('is_anonymous_by_default',)
 
 @admin.register(TemporaryUser)
@@ -18,37 +23,115 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+class LargeTableAdmin(admin.ModelAdmin):
+    # Planner estimate instead of COUNT(*) once a changelist is large.
+    paginator = EstimatedCountPaginator
+    # Skips the unfiltered COUNT(*) behind "x results (y total)".
+    show_full_result_count = False
+
 class ReplyInline(admin.TabularInline):
     model = Reply
     extra = 0
-    readonly_fields = ('content', 'created_at')
+    fields = ('content', 'author', 'temp_author', 'hide_identity', 'helpful_count', 'not_satisfied_count', 'created_at')
+    readonly_fields = ('content', 'author', 'temp_author', 'helpful_count', 'not_satisfied_count', 'created_at')
+    show_change_link = True
+    # Only the newest replies are inlined; PostAdmin.all_replies links to the rest.
+    max_shown = 20
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author', 'temp_author')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        max_shown = self.max_shown
+
+        class NewestRepliesFormSet(formset):
+            def get_queryset(self):
+                if not hasattr(self, '_newest'):
+                    queryset = super().get_queryset()
+                    if self.is_bound:
+                        # Save exactly the replies the form showed (their
+                        # pks come back in the hidden id fields), even if
+                        # newer ones were posted in between.
+                        pk_name = self.model._meta.pk.name
+                        shown = [self.data.get(f'{self.add_prefix(i)}-{pk_name}', '') for i in range(self.initial_form_count())]
+                        newest = [pk for pk in shown if pk.isdigit()]
+                    else:
+                        newest = list(queryset.order_by('-created_at').values_list('pk', flat=True)[:max_shown])
+                    self._newest = queryset.filter(pk__in=newest)
+                return self._newest
+
+        return NewestRepliesFormSet
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ('title', 'post_type', 'author_display_name', 'created_at', 'hide_identity')
     list_filter = ('post_type', 'hide_identity', 'created_at')
+    list_select_related = ('author__profile', 'temp_author')
     search_fields = ('title', 'description')
-    autocomplete_fields = ('author', 'temp_author', 'tags', 'saved_by')
+    autocomplete_fields = ('author', 'temp_author', 'tags')
+    readonly_fields = ('all_replies',)
     inlines = [ReplyInline]
 
+    @admin.display(description="Replies")
+    def all_replies(self, obj):
+        if obj.pk is None:
+            return "-"
+        url = reverse('admin:app_reply_changelist') + f'?post__id__exact={obj.pk}'
+        return format_html('<a href="{}">{} replies</a> (newest {} shown below)', url, obj.replies.count(), ReplyInline.max_shown)
+
 @admin.register(Reply)
-class ReplyAdmin(admin.ModelAdmin):
+class ReplyAdmin(LargeTableAdmin):
     list_display = ('post', 'author_display_name', 'created_at', 'hide_identity')
     search_fields = ('content',)
     list_filter = ('hide_identity', 'created_at')
+    list_select_related = ('post', 'author__profile', 'temp_author')
     autocomplete_fields = ('post', 'author', 'temp_author')
 
 @admin.register(Reaction)
-class ReactionAdmin(admin.ModelAdmin):
+class ReactionAdmin(LargeTableAdmin):
     list_display = ('post', 'user', 'temp_user', 'created_at')
     list_filter = ('created_at',)
-    search_fields = ('post__title', 'user__username', 'temp_user__display_name')
+    list_select_related = ('post', 'user', 'temp_user')
+    search_fields = ('post__title', 'user__email', 'temp_user__display_name')
+    raw_id_fields = ('post', 'user', 'temp_user')
 
 @admin.register(ReplyReaction)
-class ReplyReactionAdmin(admin.ModelAdmin):
+class ReplyReactionAdmin(LargeTableAdmin):
     list_display = ('reply', 'reaction', 'user', 'temp_user', 'created_at')
     list_filter = ('reaction', 'created_at')
-    search_fields = ('reply__content', 'user__username', 'temp_user__display_name')
+    list_select_related = ('reply', 'user', 'temp_user')
+    search_fields = ('reply__content', 'user__email', 'temp_user__display_name')
+    raw_id_fields = ('reply', 'user', 'temp_user')
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('source', 'status', 'lines_done', 'posts_created', 'replies_created', 'stories_created', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'lines_done', 'posts_created', 'replies_created', 'stories_created', 'tags_created', 'error', 'created_at', 'updated_at')
+    actions = ['run_import']
+
+    @admin.action(description="Run / resume selected imports")
+    def run_import(self, request, queryset):
+        # Imports run on the job worker (run_jobs), not in this request.
+        queued = 0
+        for job in queryset.filter(status__in=['pending', 'failed']):
+            enqueue('run_import', import_job_id=job.pk)
+            queued += 1
+        self.message_user(request, f"{queued} imports queued")
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'duration_ms', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('name', 'payload', 'attempts', 'locked_by', 'locked_at', 'last_error', 'duration_ms', 'created_at', 'finished_at')
+    actions = ['retry']
+
+    @admin.action(description="Retry selected jobs")
+    def retry(self, request, queryset):
+        count = queryset.exclude(status='running').update(status='pending', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"{count} jobs queued again")
 
 
 class UserAdmin(BaseUserAdmin):
@@ -68,3 +151,4 @@ class UserAdmin(BaseUserAdmin):
     )
 
 admin.site.register(User, UserAdmin)
+
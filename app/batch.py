@@ -0,0 +1,110 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from . import fastjson
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Batched GET requests
+# -------------------------------
+#
+# /api/batch/ runs several internal GETs in one round trip. Sub-requests
+# are dispatched straight to the resolved views, skipping middleware, and
+# reuse the batch request's authentication (DRF's forced-auth hook) and
+# temp user, so those are resolved once. With BATCH_THREADS > 1 items run
+# on a shared thread pool, which pays off when views wait on the database
+# rather than on the CPU; each pool thread keeps its own connection.
+
+MAX_REQUESTS = 10
+# Headers that describe the batch request itself, not its items.
+SKIPPED_META = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+FORWARDED_HEADERS = ('ETag', 'Last-Modified', 'Retry-After')
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.BATCH_THREADS, thread_name_prefix='batch')
+    return _pool
+
+
+def sub_request(request, url, temp_token=None, temp_user_id=None):
+    """An internal GET for ``url`` made on behalf of the DRF ``request``."""
+    parts = urlsplit(url)
+    outer = request._request
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = parts.path
+    sub.GET = QueryDict(parts.query)
+    sub.META = {key: value for key, value in outer.META.items() if key not in SKIPPED_META}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=parts.path, QUERY_STRING=parts.query)
+    if temp_token:
+        sub.META['HTTP_X_TEMP_TOKEN'] = str(temp_token)
+    sub.COOKIES = outer.COOKIES
+    for name in ('session', 'user'):
+        if hasattr(outer, name):
+            setattr(sub, name, getattr(outer, name))
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    sub.temp_user_id = temp_user_id
+    return sub
+
+
+def render(response):
+    if response.streaming:
+        return 400, {'detail': 'Streaming responses cannot be batched.'}
+    if hasattr(response, 'data'):
+        return response.status_code, response.data
+    if response.get('Content-Type', '').startswith('application/json') and response.content:
+        return response.status_code, fastjson.loads(response.content)
+    return response.status_code, response.content.decode(response.charset or 'utf-8', 'replace')
+
+
+def run_one(sub):
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return 404, {}, {'detail': 'Not found.'}
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+        status, body = render(response)
+        headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+        return status, headers, body
+    except Exception:
+        logger.exception("Batched request to %s failed", sub.get_full_path())
+        return 500, {}, {'detail': 'Internal server error.'}
+
+
+def run_pooled(sub):
+    try:
+        return run_one(sub)
+    finally:
+        # Pool threads never see request_finished; honour CONN_MAX_AGE here.
+        close_old_connections()
+
+
+def run_batch(request, items, temp_token=None, temp_user_id=None):
+    """Run ``items`` ({'path', 'id'?}) and return their results in order."""
+    subs = [sub_request(request, item['path'], temp_token, temp_user_id) for item in items]
+    if len(subs) == 1 or getattr(settings, 'BATCH_THREADS', 1) <= 1:
+        results = [run_one(sub) for sub in subs]
+    else:
+        results = list(get_pool().map(run_pooled, subs))
+    responses = []
+    for item, (status, headers, body) in zip(items, results):
+        entry = {'path': item['path'], 'status': status, 'headers': headers, 'body': body}
+        if 'id' in item:
+            entry = {'id': item['id'], **entry}
+        responses.append(entry)
+    return responses
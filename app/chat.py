@@ -0,0 +1,112 @@
+from collections import OrderedDict, deque
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+
+from .models import DiscussionRoom, DiscussionMessage
+
+
+# -------------------------------
+# Room messages and resumable delivery
+# -------------------------------
+#
+# Every message gets the next per-room sequence number (DiscussionRoom.
+# last_seq, bumped under the row lock of the insert's transaction). Each
+# worker process keeps the last BUFFER_SIZE events of the rooms its
+# sockets are in, so a client reconnecting with ?since=<seq> is normally
+# caught up from memory; only the part of the gap the buffer doesn't hold
+# is read from the database, at most REPLAY_LIMIT messages.
+
+BUFFER_SIZE = 256
+MAX_ROOMS = 1000
+REPLAY_LIMIT = 1000
+
+
+def room_group(room_id):
+    return f"discussion_{room_id}"
+
+
+def message_event(message):
+    return {
+        "type": "chat_message",
+        "id": message.id,
+        "seq": message.seq,
+        "message": message.message,
+        "user": str(message.sender),
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+def post_message(room_id, sender, message, reply_to=None):
+    """Store a message with the room's next sequence number; returns the saved message."""
+    with transaction.atomic():
+        # The UPDATE holds the room row until commit, so numbers are gapless.
+        if not DiscussionRoom.objects.filter(pk=room_id).update(last_seq=F('last_seq') + 1):
+            raise DiscussionRoom.DoesNotExist
+        seq = DiscussionRoom.objects.filter(pk=room_id).values_list('last_seq', flat=True).get()
+        return DiscussionMessage.objects.create(room_id=room_id, sender=sender, message=message, reply_to=reply_to, seq=seq)
+
+
+def broadcast(room_id, event):
+    layer = get_channel_layer()
+    if layer is not None:
+        async_to_sync(layer.group_send)(room_group(room_id), event)
+
+
+def load_events(room_id, after, until):
+    """Events with after < seq <= until from the database, the newest REPLAY_LIMIT of them."""
+    messages = (
+        DiscussionMessage.objects.filter(room_id=room_id, seq__gt=max(after, until - REPLAY_LIMIT), seq__lte=until)
+        .select_related('sender').order_by('seq')
+    )
+    return [message_event(message) for message in messages]
+
+
+class RingBuffer:
+    """The most recent events of one room, contiguous in seq."""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.events = deque(maxlen=size)
+
+    @property
+    def last_seq(self):
+        return self.events[-1]["seq"] if self.events else None
+
+    def append(self, event):
+        last = self.last_seq
+        if last is not None:
+            if event["seq"] <= last:
+                # Already seen (every local socket in the room delivers it).
+                return
+            if event["seq"] != last + 1:
+                # Missed some; a buffer with holes can't answer since().
+                self.events.clear()
+        self.events.append(event)
+
+    def since(self, seq):
+        """Buffered events after ``seq``, or None when the buffer starts too late."""
+        if not self.events or self.events[0]["seq"] > seq + 1:
+            return None
+        return [event for event in self.events if event["seq"] > seq]
+
+
+class RoomBuffers:
+    # Per-process; only touched from the event loop, so no locking.
+
+    def __init__(self, max_rooms=MAX_ROOMS):
+        self.max_rooms = max_rooms
+        self.rooms = OrderedDict()
+
+    def get(self, room_id):
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            buffer = self.rooms[room_id] = RingBuffer()
+            while len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+        self.rooms.move_to_end(room_id)
+        return buffer
+
+
+room_buffers = RoomBuffers()
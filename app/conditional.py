@@ -0,0 +1,120 @@
+import datetime
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def deletion_marker(model):
+    # Changes whenever a row of ``model`` is deleted (see signals.py).
+    return cache.get_or_set(f'deleted:{model._meta.label_lower}', time.time_ns, None)
+
+
+def mark_deleted(model):
+    cache.set(f'deleted:{model._meta.label_lower}', time.time_ns(), None)
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for list and retrieve actions.
+
+    Validators come from the ``version_field`` timestamp (and, for lists,
+    the table's deletion marker) so a 304 is answered without loading or
+    serializing objects. The ETag also covers the query string and the negotiated
+    media type, since ?fields= and renderers change the body.
+
+    Responses with ?expand= embed related rows (replies, messages) whose
+    changes don't move the parent's version, so they are served without
+    validators.
+    """
+    version_field = 'changed_at'
+    weak_etag = False
+
+    def get_validators(self, *parts):
+        request = self.request
+        key = '|'.join(str(part) for part in (request.get_full_path(), request.accepted_media_type, *parts))
+        etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+        if self.weak_etag:
+            etag = 'W/' + etag
+        return etag
+
+    def conditional_response(self, request, etag, last_modified):
+        # Returns a 304/412 when the request's preconditions allow it.
+        validators = HttpResponse()
+        validators['ETag'] = etag
+        if last_modified is not None:
+            validators['Last-Modified'] = http_date(last_modified.timestamp())
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+            response=validators,
+        )
+        return None if response is validators else response
+
+    def with_validators(self, response, etag, last_modified):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def uses_validators(self):
+        return not self.request.query_params.get('expand')
+
+    def list(self, request, *args, **kwargs):
+        if not self.uses_validators():
+            return super().list(request, *args, **kwargs)
+        last_modified, deleted = self.get_list_version()
+        etag = self.get_validators(last_modified, deleted)
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = super().list(request, *args, **kwargs)
+        return self.with_validators(response, etag, last_modified)
+
+    def get_list_version(self):
+        # Newest change in the whole table (an index lookup, no COUNT over
+        # the filtered rows) and the last deletion. Rows entering or leaving
+        # a filter move the former, deleted rows the latter. A deletion
+        # doesn't move Max(changed_at), so Last-Modified covers both or
+        # If-Modified-Since would keep answering 304 with the deleted row.
+        model = self.get_queryset().model
+        last_modified = model._default_manager.order_by().aggregate(last_modified=Max(self.version_field))['last_modified']
+        deleted = deletion_marker(model)
+        deleted_at = datetime.datetime.fromtimestamp(deleted / 1e9, tz=datetime.timezone.utc)
+        return max(last_modified or deleted_at, deleted_at), deleted
+
+    def get_object_version(self, lookup_value):
+        # (pk, version) of the object being retrieved, or None.
+        try:
+            return self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: lookup_value}
+            ).values_list('pk', self.version_field).first()
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def retrieve_response(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.uses_validators():
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = self.get_object_version(kwargs[lookup_url_kwarg])
+        if row is None:
+            # Let the normal path raise the 404.
+            return super().retrieve(request, *args, **kwargs)
+
+        pk, last_modified = row
+        etag = self.get_validators(pk, last_modified)
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = self.retrieve_response(request, *args, **kwargs)
+        return self.with_validators(response, etag, last_modified)
@@ -1,40 +1,94 @@
-import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import DiscussionRoom, DiscussionMessage
+from .models import DiscussionRoom
 from channels.db import database_sync_to_async
+from . import fastjson
+from .chat import room_buffers, room_group, message_event, post_message, load_events
+from .scheduler import user_group
 
 class ChatConsumer(AsyncWebsocketConsumer):
 
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group = f"discussion_{self.room_id}"
+        self.room_group = room_group(self.room_id)
+        self.buffer = room_buffers.get(self.room_id)
+        # Live events up to here were already sent by the resume.
+        self.replayed_seq = 0
 
         await self.channel_layer.group_add(self.room_group, self.channel_name)
         await self.accept()
 
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since')
+        if since and since[0].isdigit():
+            await self.resume(int(since[0]))
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group, self.channel_name)
 
+    async def resume(self, since):
+        # Joined the group first, so nothing after `latest` can be missed.
+        latest = await self.get_last_seq()
+        # A seq past the room's last one can't be trusted; don't let it
+        # hide the next live messages.
+        since = min(since, latest)
+        events = self.buffer.since(since) or []
+        sent_until = events[-1]["seq"] if events else since
+        if latest > sent_until:
+            loaded = await database_sync_to_async(load_events)(self.room_id, sent_until, latest)
+            if loaded and loaded[0]["seq"] > sent_until + 1:
+                await self.send(text_data=fastjson.dumps_str({"type": "history_gap", "from_seq": sent_until + 1, "to_seq": loaded[0]["seq"] - 1}))
+            for event in loaded:
+                self.buffer.append(event)
+            events += loaded
+        for event in events:
+            await self.send(text_data=fastjson.dumps_str(event))
+        self.replayed_seq = max(latest, sent_until)
+
     async def receive(self, text_data):
-        data = json.loads(text_data)
+        data = fastjson.loads(text_data)
         message = data["message"]
         user = self.scope["user"]
 
-        await self.save_message(user, message)
+        event = await self.save_message(user, message)
 
-        await self.channel_layer.group_send(
-            self.room_group,
-            {
-                "type": "chat_message",
-                "message": message,
-                "user": str(user),
-            }
-        )
+        await self.channel_layer.group_send(self.room_group, event)
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        seq = event.get("seq")
+        if seq is not None:
+            self.buffer.append(event)
+            if seq <= self.replayed_seq:
+                return
+        await self.send(text_data=fastjson.dumps_str(event))
+
+    async def room_status(self, event):
+        await self.send(text_data=fastjson.dumps_str(event))
 
     @database_sync_to_async
     def save_message(self, user, message):
-        room = DiscussionRoom.objects.get(id=self.room_id)
-        return DiscussionMessage.objects.create(room=room, sender=user, message=message)
+        return message_event(post_message(self.room_id, user, message))
+
+    @database_sync_to_async
+    def get_last_seq(self):
+        return DiscussionRoom.objects.filter(pk=self.room_id).values_list('last_seq', flat=True).first() or 0
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    # Per-user events, e.g. room_status for rooms the user asked to be notified about.
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+        self.user_group = user_group(user.pk)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "user_group"):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+
+    async def room_status(self, event):
+        await self.send(text_data=fastjson.dumps_str(event))
@@ -0,0 +1,112 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import F
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Write-behind counters
+# -------------------------------
+
+class CounterBuffer:
+    """
+    Hot counters such as Story.reads_count. An increment bumps a counter in
+    the shared cache (what readers see) and a per-process pending delta.
+    A background thread writes the deltas to the database every
+    ``flush_interval`` seconds, one UPDATE per row, instead of one UPDATE
+    per request.
+
+    Deltas not yet flushed are lost if the process dies; only use this for
+    counts where that is acceptable.
+    """
+    flush_interval = 1.0
+    timeout = 3600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)   # (model, pk, field) -> delta
+        self.thread = None
+
+    def key(self, model, pk, field):
+        return f'counter:{model._meta.label_lower}:{pk}:{field}'
+
+    def bump(self, model, pk, field, delta=1):
+        # Shared counter only, for changes already written to the database.
+        try:
+            cache.incr(self.key(model, pk, field), delta)
+        except ValueError:
+            # Not seeded yet; seed() on the next cache fill picks up the
+            # database value.
+            pass
+
+    def incr(self, model, pk, field, delta=1):
+        self.bump(model, pk, field, delta)
+        with self.lock:
+            self.pending[(model, pk, field)] += delta
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.flush_loop, name='counter-flush', daemon=True)
+                self.thread.start()
+
+    def flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if not self.pending:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Counter flush failed")
+            finally:
+                close_old_connections()
+
+    def seed(self, model, pk, values):
+        # Start shared counters from the database unless they already run.
+        # Deltas this process has not flushed yet are not in the database.
+        with self.lock:
+            values = {field: value + self.pending.get((model, pk, field), 0) for field, value in values.items()}
+        for field, value in values.items():
+            cache.add(self.key(model, pk, field), value, self.timeout)
+
+    def overlay(self, model, pk, data, fields):
+        """Replace ``fields`` in ``data`` by their live counter values."""
+        keys = {self.key(model, pk, field): field for field in fields}
+        live = cache.get_many(keys)
+        missing = {key: data[field] for key, field in keys.items() if key not in live}
+        if missing:
+            cache.set_many(missing, self.timeout)
+        for key, value in live.items():
+            data[keys[key]] = value
+        return data
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+        rows = defaultdict(dict)
+        for (model, pk, field), delta in pending.items():
+            rows[(model, pk)][field] = delta
+        rows = list(rows.items())
+        for position, ((model, pk), deltas) in enumerate(rows):
+            try:
+                model.objects.filter(pk=pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+            except Exception:
+                # Keep what wasn't written for the next flush.
+                self.restore(rows[position:])
+                raise
+
+    def restore(self, rows):
+        with self.lock:
+            for (model, pk), deltas in rows:
+                for field, delta in deltas.items():
+                    self.pending[(model, pk, field)] += delta
+
+
+counters = CounterBuffer()
+atexit.register(counters.flush)
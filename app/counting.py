@@ -0,0 +1,129 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+# -------------------------------
+# Row counts for big tables
+# -------------------------------
+#
+# COUNT(*) on PostgreSQL reads every visible row. Above a threshold an
+# estimate is good enough for "page x of about y": pg_class.reltuples for a
+# whole table, the planner's estimate (built from the column statistics
+# ANALYZE keeps, e.g. per post_type or category) for a filtered one.
+# Either way the result is cached for a few seconds.
+
+DEFAULT_THRESHOLD = 10000
+DEFAULT_TTL = 30
+
+
+def table_estimate(queryset):
+    """pg_class.reltuples for the table behind an unfiltered queryset, else None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where or queryset.query.distinct:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table has been vacuumed or analyzed.
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def planner_estimate(queryset):
+    """The planner's row estimate for ``queryset`` on PostgreSQL, else None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode(), usedforsecurity=False).hexdigest()
+    return f'rowcount:{digest}'
+
+
+def count_or_estimate(queryset, threshold=None, ttl=None):
+    """
+    Return ``(count, estimated)``: an exact count below ``threshold``,
+    otherwise a catalog or planner estimate. Cached for ``ttl`` seconds.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', DEFAULT_THRESHOLD)
+    if ttl is None:
+        ttl = getattr(settings, 'ESTIMATED_COUNT_TTL', DEFAULT_TTL)
+
+    key = count_cache_key(queryset)
+    if ttl:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached)
+
+    estimate = table_estimate(queryset)
+    if estimate is None:
+        estimate = planner_estimate(queryset)
+    if estimate is None or estimate < threshold:
+        result = (queryset.count(), False)
+    else:
+        result = (estimate, True)
+
+    if ttl:
+        cache.set(key, result, ttl)
+    return result
+
+
+class EstimatedPage(Page):
+    def has_next(self):
+        if not self.paginator.estimated:
+            return super().has_next()
+        return len(self.object_list) >= self.paginator.per_page
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose ``count`` comes from count_or_estimate(). While the
+    count is estimated, pages past the estimate can still be requested and
+    a page is taken to have a successor when it is full.
+    """
+    threshold = None
+    estimated = False
+
+    @cached_property
+    def count(self):
+        count, self.estimated = count_or_estimate(self.object_list, self.threshold)
+        return count
+
+    def validate_number(self, number):
+        self.count
+        if not self.estimated:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
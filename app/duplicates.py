@@ -0,0 +1,324 @@
+import bisect
+import datetime
+import hashlib
+import logging
+import mmap
+import operator
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exports import chunked
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Near-duplicate questions
+# -------------------------------
+#
+# Posts are compared by the Jaccard similarity of their character
+# shingles, estimated with MinHash signatures and found through LSH
+# buckets. Signatures use one-permutation hashing: every shingle is hashed
+# once and lands in one of NUM_PERM bins, keeping each bin's minimum
+# (empty bins borrow from their right neighbour), which is far cheaper in
+# Python than NUM_PERM hash functions.
+#
+# `manage.py build_duplicate_index` writes a snapshot file that workers
+# memory-map; posts created or edited since the snapshot was built are kept
+# in an in-memory delta, picked up by changed_at from the database. A
+# worker without a usable snapshot never indexes all posts itself: until
+# the builder writes one, it only suggests posts changed after it started.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+# Estimated Jaccard similarity from which a post is suggested.
+THRESHOLD = 0.5
+MAX_SUGGESTIONS = 5
+# Huge buckets (boilerplate text) are only partially scanned, and only
+# the candidates sharing the most bands are scored.
+MAX_BUCKET = 200
+MAX_CANDIDATES = 100
+
+BIN_SHIFT = 64 - 6          # top 6 bits pick one of the 64 bins
+VALUE_MASK = (1 << BIN_SHIFT) - 1
+EMPTY = 1 << 64
+
+WORD_RE = re.compile(r"\w+")
+
+# File layout, native byte order:
+#   header | band keys u64[entries] (sorted) | band post ids u64[entries]
+#   | doc post ids u64[docs] (sorted) | doc signatures u16[docs * NUM_PERM]
+MAGIC = b'QDUP'
+HEADER = struct.Struct('=4sIHHQQq')   # magic, version, num_perm, bands, docs, entries, built_at (epoch µs)
+HEADER_SIZE = 40
+VERSION = 2
+
+
+def shingles(title, description):
+    text = " ".join(WORD_RE.findall(f"{title} {description}".lower()))
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def signature(title, description):
+    """NUM_PERM 16-bit MinHash values (b-bit MinHash), or None for empty text."""
+    bins = [EMPTY] * NUM_PERM
+    for shingle in shingles(title, description):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+        slot = value >> BIN_SHIFT
+        value &= VALUE_MASK
+        if value < bins[slot]:
+            bins[slot] = value
+    if all(value == EMPTY for value in bins):
+        return None
+    # Densify by rotation: an empty bin takes the next non-empty bin's value
+    # to the right, offset by the distance so copies don't collide.
+    filled = list(bins)
+    for slot in range(NUM_PERM):
+        distance = 1
+        while filled[slot] == EMPTY:
+            source = bins[(slot + distance) % NUM_PERM]
+            if source != EMPTY:
+                filled[slot] = source + distance * 0x9E3779B1
+            distance += 1
+    return array('H', [value & 0xFFFF for value in filled])
+
+
+def band_keys(sig):
+    keys = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+        keys.append(int.from_bytes(hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest(), 'little'))
+    return keys
+
+
+def similarity(sig, other):
+    return sum(map(operator.eq, sig, other)) / NUM_PERM
+
+
+class Snapshot:
+    """A memory-mapped index file; lookups are binary searches over its arrays."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.built_at = None
+        self.map = self.view = None
+        self.keys = self.posts = self.doc_ids = self.sigs = ()
+        if path is None or not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+                raise ValueError(f"{path} is truncated")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_perm, bands, docs, entries, built_at = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or num_perm != NUM_PERM or bands != BANDS:
+            self.map.close()
+            raise ValueError(f"{path} is not a compatible duplicate index")
+        if len(self.map) != HEADER_SIZE + entries * 16 + docs * (8 + NUM_PERM * 2):
+            self.map.close()
+            raise ValueError(f"{path} is truncated")
+        self.built_at = datetime.datetime.fromtimestamp(built_at / 1e6, datetime.timezone.utc)
+        view = self.view = memoryview(self.map)
+        offset = HEADER_SIZE
+        self.keys = view[offset:offset + entries * 8].cast('Q')
+        offset += entries * 8
+        self.posts = view[offset:offset + entries * 8].cast('Q')
+        offset += entries * 8
+        self.doc_ids = view[offset:offset + docs * 8].cast('Q')
+        offset += docs * 8
+        self.sigs = view[offset:offset + docs * NUM_PERM * 2].cast('H')
+
+    def bucket(self, key):
+        start = bisect.bisect_left(self.keys, key)
+        end = start
+        while end < len(self.keys) and self.keys[end] == key and end - start < MAX_BUCKET:
+            end += 1
+        return self.posts[start:end]
+
+    def signature(self, post_id):
+        i = bisect.bisect_left(self.doc_ids, post_id)
+        if i < len(self.doc_ids) and self.doc_ids[i] == post_id:
+            return self.sigs[i * NUM_PERM:(i + 1) * NUM_PERM]
+        return None
+
+    def close(self):
+        if self.map is None:
+            return
+        for view in (self.keys, self.posts, self.doc_ids, self.sigs, self.view):
+            view.release()
+        self.keys = self.posts = self.doc_ids = self.sigs = ()
+        try:
+            self.map.close()
+        except BufferError:
+            # A slice is still referenced somewhere; the map goes with it.
+            logger.warning("Duplicate index %s still in use; leaving it to be unmapped later", self.path)
+        self.map = self.view = None
+
+
+def write_snapshot(path, rows, built_at):
+    """
+    Write the index of ``rows`` ((post_id, title, description), by id) to
+    ``path`` atomically. ``built_at`` is when reading ``rows`` began; posts
+    changed since are picked up from the database.
+    """
+    doc_ids, sigs, entries = array('Q'), array('H'), []
+    for post_id, title, description in rows:
+        sig = signature(title, description)
+        if sig is None:
+            continue
+        doc_ids.append(post_id)
+        sigs.extend(sig)
+        entries.extend((key, post_id) for key in band_keys(sig))
+    entries.sort()
+    keys = array('Q', (key for key, _ in entries))
+    posts = array('Q', (post_id for _, post_id in entries))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, NUM_PERM, BANDS, len(doc_ids), len(keys), int(built_at.timestamp() * 1e6)).ljust(HEADER_SIZE, b'\0'))
+        for part in (keys, posts, doc_ids, sigs):
+            part.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(doc_ids)
+
+
+class DuplicateIndex:
+    """
+    Snapshot plus the posts created or edited after it. At most every
+    ``refresh_interval`` seconds a query checks for a newer snapshot file
+    and for posts whose changed_at falls in the window since the last
+    check. The window overlaps the previous one by ``sync_overlap``
+    seconds, so rows committed after others with a later changed_at (or a
+    higher id) are still seen.
+    """
+    refresh_interval = 2.0
+    sync_overlap = 30.0
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.snapshot = None
+        self.file_mtime = None
+        self.buckets = defaultdict(list)   # band key -> post ids (delta)
+        self.sigs = {}                     # post_id -> signature, None for no text (delta)
+        self.seen = {}                     # post_id -> changed_at last indexed (delta)
+        self.synced_at = None
+        self.checked_at = None
+
+    def get_path(self):
+        return self.path or getattr(settings, 'DUPLICATE_INDEX_PATH', None)
+
+    def load(self):
+        with self.lock:
+            path = self.get_path()
+            self.file_mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+            if self.snapshot is not None:
+                self.snapshot.close()
+            try:
+                self.snapshot = Snapshot(path)
+            except (OSError, ValueError):
+                logger.exception("Could not load duplicate index %s", path)
+                self.snapshot = Snapshot()
+            self.buckets = defaultdict(list)
+            self.sigs = {}
+            self.seen = {}
+            self.synced_at = self.snapshot.built_at
+            if self.synced_at is None:
+                # Indexing every post here would stall each worker; wait for
+                # the builder's file and index only what changes meanwhile.
+                logger.warning("No duplicate index at %s; suggesting only posts changed from now on", path)
+                self.synced_at = timezone.now()
+            self.checked_at = None
+            self.sync()
+
+    def add(self, post_id, title, description):
+        sig = signature(title, description)
+        with self.lock:
+            old = self.sigs.get(post_id)
+            if old is not None:
+                if sig is not None and old == sig:
+                    return
+                for key in band_keys(old):
+                    self.buckets[key].remove(post_id)
+            # Kept even when None, so an emptied post hides its snapshot entry.
+            self.sigs[post_id] = sig
+            if sig is not None:
+                for key in band_keys(sig):
+                    self.buckets[key].append(post_id)
+
+    def sync(self):
+        with self.lock:
+            if self.snapshot is None:
+                self.load()
+                return
+            if self.checked_at is not None and time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            self.checked_at = time.monotonic()
+            path = self.get_path()
+            if (os.path.getmtime(path) if path and os.path.exists(path) else None) != self.file_mtime:
+                self.load()
+                return
+            posts = Post.objects.filter(changed_at__gte=self.synced_at - datetime.timedelta(seconds=self.sync_overlap))
+            self.synced_at = timezone.now()
+            changed = [
+                post_id for post_id, changed_at in posts.values_list('id', 'changed_at').iterator(chunk_size=2000)
+                if self.seen.get(post_id) != changed_at
+            ]
+            for ids in chunked(changed, 1000):
+                for post_id, title, description, changed_at in Post.objects.filter(pk__in=ids).values_list('id', 'title', 'description', 'changed_at'):
+                    self.add(post_id, title, description)
+                    self.seen[post_id] = changed_at
+
+    def candidates(self, sig):
+        """[(similarity, post_id)] at or above THRESHOLD, best first."""
+        hits = Counter()
+        with self.lock:
+            for key in band_keys(sig):
+                hits.update(self.snapshot.bucket(key))
+                hits.update(self.buckets.get(key, ())[:MAX_BUCKET])
+            scored = []
+            for post_id, _ in hits.most_common(MAX_CANDIDATES):
+                if post_id in self.sigs:
+                    other = self.sigs[post_id]
+                else:
+                    other = self.snapshot.signature(post_id)
+                if other is not None:
+                    score = similarity(sig, other)
+                    if score >= THRESHOLD:
+                        scored.append((score, post_id))
+        scored.sort(reverse=True)
+        return scored
+
+    def query(self, title, description, limit=MAX_SUGGESTIONS):
+        self.sync()
+        sig = signature(title, description)
+        return self.candidates(sig)[:limit] if sig is not None else []
+
+
+duplicate_index = DuplicateIndex()
+
+
+def suggest_duplicates(title, description, exclude=None, limit=MAX_SUGGESTIONS):
+    """Existing posts that look like the same question: [{'id', 'title', 'similarity'}]."""
+    scored = [(score, post_id) for score, post_id in duplicate_index.query(title, description, limit + 1) if post_id != exclude]
+    titles = dict(Post.objects.filter(pk__in=[post_id for _, post_id in scored]).values_list('id', 'title'))
+    return [
+        {'id': post_id, 'title': titles[post_id], 'similarity': round(score, 2)}
+        for score, post_id in scored if post_id in titles
+    ][:limit]
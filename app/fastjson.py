@@ -0,0 +1,135 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+# -------------------------------
+# Type handling shared by both backends
+# -------------------------------
+
+def _default(obj):
+    # Mirrors rest_framework.utils.encoders.JSONEncoder so both backends
+    # produce the same output, except that Decimal stays a string.
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if representation.endswith('+00:00'):
+            representation = representation[:-6] + 'Z'
+        return representation
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, datetime.time):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, decimal.Decimal):
+        # A float would lose precision; match COERCE_DECIMAL_TO_STRING.
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__getitem__'):
+        try:
+            return dict(obj)
+        except (TypeError, ValueError):
+            pass
+    if hasattr(obj, '__iter__'):
+        return tuple(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _StdlibEncoder(json.JSONEncoder):
+    def default(self, obj):
+        return _default(obj)
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+
+class StdlibBackend:
+    name = 'stdlib'
+
+    def dumps(self, obj):
+        return json.dumps(
+            obj, cls=_StdlibEncoder, ensure_ascii=False,
+            allow_nan=False, separators=(',', ':'),
+        ).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = 'orjson'
+    # orjson handles datetime and UUID natively; Z suffix matches DRF.
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=_default, option=self.options)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+BACKENDS = {
+    'stdlib': StdlibBackend,
+    'orjson': OrjsonBackend,
+}
+
+
+def get_backend(name=None):
+    name = name or getattr(settings, 'FAST_JSON_BACKEND', None)
+    if name is None:
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        name = 'stdlib'
+    return BACKENDS[name]()
+
+
+_backend = None
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        _backend = get_backend()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'FAST_JSON_BACKEND':
+        _backend = None
+
+
+def dumps(obj):
+    """Encode ``obj`` to compact UTF-8 JSON bytes."""
+    return backend().dumps(obj)
+
+
+def dumps_str(obj):
+    return dumps(obj).decode('utf-8')
+
+
+def loads(data):
+    return backend().loads(data)
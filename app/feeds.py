@@ -0,0 +1,144 @@
+import datetime
+
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .exports import chunked
+from .models import Post, Reaction, TagAffinity, FeedEntry
+
+
+# -------------------------------
+# Materialized home feed
+# -------------------------------
+#
+# Fan-out on write: when a post gets tags, it is pushed (by a background
+# job) into the FeedEntry rows of every recently active user or temp user
+# with an affinity for one of them. Reading a feed is then one range scan
+# of the (owner, -ranked_at) index. Owners are identified by the field
+# they are stored under, 'user_id' or 'temp_user_id'.
+
+FEED_LENGTH = 200
+FAN_OUT_BATCH = 1000
+# Owners whose affinities haven't changed for this long are not fanned out
+# to; their feed is rebuilt when they come back.
+ACTIVE_DAYS = 30
+STALE_DAYS = 7
+# Tagging an older post does not push it into feeds.
+FRESH_POST_DAYS = 2
+TOP_TAGS = 20
+
+
+def record_affinity(post_id, user_id=None, temp_user_id=None):
+    owner = {'user_id': user_id} if user_id else {'temp_user_id': temp_user_id}
+    tag_ids = list(Post.tags.through.objects.filter(post_id=post_id).values_list('tag_id', flat=True))
+    known = set(TagAffinity.objects.filter(**owner, tag_id__in=tag_ids).values_list('tag_id', flat=True))
+    if known:
+        TagAffinity.objects.filter(**owner, tag_id__in=known).update(weight=F('weight') + 1, updated_at=timezone.now())
+    TagAffinity.objects.bulk_create(
+        [TagAffinity(**owner, tag_id=tag_id, weight=1) for tag_id in tag_ids if tag_id not in known],
+        ignore_conflicts=True,
+    )
+
+
+def trim(field, owner_ids):
+    """Drop all but the newest FEED_LENGTH entries of each owner."""
+    if not owner_ids:
+        return
+    ranked = FeedEntry.objects.filter(**{f'{field}__in': owner_ids}).annotate(
+        position=Window(RowNumber(), partition_by=F(field), order_by=[F('ranked_at').desc(), F('id').desc()]),
+    )
+    stale = list(ranked.filter(position__gt=FEED_LENGTH).values_list('id', flat=True))
+    if stale:
+        FeedEntry.objects.filter(id__in=stale).delete()
+
+
+def push(post_id, ranked_at, owners):
+    # owners: (field, owner_id) pairs.
+    by_field = {'user_id': [], 'temp_user_id': []}
+    for field, owner_id in owners:
+        by_field[field].append(owner_id)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(**{field: owner_id}, post_id=post_id, ranked_at=ranked_at) for field, owner_id in owners],
+        ignore_conflicts=True,
+    )
+    for field, owner_ids in by_field.items():
+        trim(field, owner_ids)
+
+
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).values('created_at', 'author_id', 'temp_author_id').first()
+    if post is None or post['created_at'] < timezone.now() - datetime.timedelta(days=FRESH_POST_DAYS):
+        return 0
+    tag_ids = list(Post.tags.through.objects.filter(post_id=post_id).values_list('tag_id', flat=True))
+    active_since = timezone.now() - datetime.timedelta(days=ACTIVE_DAYS)
+    owners = TagAffinity.objects.filter(tag_id__in=tag_ids, updated_at__gte=active_since).order_by().values_list('user_id', 'temp_user_id').distinct()
+
+    pushed = 0
+    for chunk in chunked(owners.iterator(), FAN_OUT_BATCH):
+        targets = []
+        for user_id, temp_user_id in chunk:
+            if user_id and user_id != post['author_id']:
+                targets.append(('user_id', user_id))
+            elif temp_user_id and temp_user_id != post['temp_author_id']:
+                targets.append(('temp_user_id', temp_user_id))
+        push(post_id, post['created_at'], targets)
+        pushed += len(targets)
+    return pushed
+
+
+def build_feed(field, owner_id):
+    """(Re)fill an owner's feed from their top tags; used for cold starts and backfills."""
+    tag_ids = list(
+        TagAffinity.objects.filter(**{field: owner_id}).order_by('-weight', '-updated_at').values_list('tag_id', flat=True)[:TOP_TAGS]
+    )
+    if not tag_ids:
+        return 0
+    author_field = 'author_id' if field == 'user_id' else 'temp_author_id'
+    reacted = Reaction.objects.filter(**{field: owner_id}).values('post_id')
+    posts = list(
+        Post.objects.filter(tags__in=tag_ids).exclude(id__in=reacted).exclude(**{author_field: owner_id})
+        .order_by('-created_at').values_list('id', 'created_at').distinct()[:FEED_LENGTH]
+    )
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(**{field: owner_id}, post_id=post_id, ranked_at=created_at) for post_id, created_at in posts],
+        ignore_conflicts=True,
+    )
+    trim(field, [owner_id])
+    return len(posts)
+
+
+def read_feed(field, owner_id, limit=20):
+    """
+    Newest post ids of a materialized feed, or None when the feed is cold
+    (empty, or nothing has been pushed to it for STALE_DAYS).
+    """
+    rows = list(FeedEntry.objects.filter(**{field: owner_id}).order_by('-ranked_at').values_list('post_id', 'created_at')[:limit])
+    if not rows:
+        return None
+    if max(created_at for _, created_at in rows) < timezone.now() - datetime.timedelta(days=STALE_DAYS):
+        return None
+    return [post_id for post_id, _ in rows]
+
+
+def rebuild_affinities(batch_size=1000):
+    """Recreate TagAffinity from all reactions (first deployment, repairs)."""
+    TagAffinity.objects.all().delete()
+    rows = (
+        Reaction.objects.filter(post__tags__isnull=False).order_by()
+        .values_list('user_id', 'temp_user_id', 'post__tags')
+        .annotate(weight=Count('id'), last=Max('created_at'))
+    )
+    created = 0
+    for chunk in chunked(rows.iterator(), batch_size):
+        affinities = [
+            TagAffinity(user_id=user_id, temp_user_id=temp_user_id, tag_id=tag_id, weight=weight, updated_at=last)
+            for user_id, temp_user_id, tag_id, weight, last in chunk
+        ]
+        TagAffinity.objects.bulk_create(affinities)
+        # bulk_create() applies auto_now; keep the last reaction time.
+        for affinity, row in zip(affinities, chunk):
+            affinity.updated_at = row[4]
+        TagAffinity.objects.bulk_update(affinities, ['updated_at'])
+        created += len(affinities)
+    return created
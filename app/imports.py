@@ -0,0 +1,334 @@
+import gzip
+import itertools
+import time
+
+from django.db import DataError, IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import User, Tag, Post, Reply, Story, ImportJob
+from . import fastjson
+from .tag_index import recount_posts
+from .jobs import enqueue
+
+
+# -------------------------------
+# Bulk JSONL import
+# -------------------------------
+#
+# One JSON object per line, selected by "type":
+#   {"type": "tag", "name": "anxiety"}
+#   {"type": "post", "title": ..., "description": ..., "post_type": "problem",
+#    "tags": ["anxiety"], "author_email": ..., "hide_identity": false,
+#    "created_at": "2019-04-01T10:00:00Z", "replies": [{"content": ..., ...}]}
+#   {"type": "reply", "post": <existing post id>, "content": ..., ...}
+#   {"type": "story", "title": ..., "description": ..., "category": "growth", ...}
+#
+# Story likes_count is not imported: likes are backed by per-story liker
+# sets (likes.py) the file can't provide, so imported stories start at 0.
+
+
+REQUIRED_FIELDS = {
+    'tag': ('name',),
+    'post': ('title',),
+    'reply': ('post', 'content'),
+    'story': ('title', 'category'),
+}
+
+# Text fields checked against their model field (type and max_length), so
+# a bad record is reported by line instead of failing the batch's INSERT.
+TEXT_FIELDS = {
+    'tag': (Tag, ('name',)),
+    'post': (Post, ('title', 'description', 'post_type')),
+    'reply': (Reply, ('content',)),
+    'story': (Story, ('title', 'description', 'category')),
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class TagResolver:
+    # name -> id cache; unknown names are created with one upsert per batch.
+    def __init__(self):
+        self.ids = {}
+        self.created = 0
+
+    def resolve(self, names):
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            self.ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+            missing -= set(self.ids)
+        if missing:
+            tags = Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            # Rows another writer inserted first are skipped by the upsert;
+            # ours are the ones carrying the changed_at stamped here.
+            stamped = {tag.name: tag.changed_at for tag in tags}
+            for name, tag_id, changed_at in Tag.objects.filter(name__in=missing).values_list('name', 'id', 'changed_at'):
+                self.ids[name] = tag_id
+                self.created += changed_at == stamped[name]
+        return [self.ids[name] for name in names]
+
+
+class UserResolver:
+    def __init__(self):
+        self.ids = {}
+
+    def prefetch(self, emails):
+        missing = {email for email in emails if email and email not in self.ids}
+        if missing:
+            found = dict(User.objects.filter(email__in=missing).values_list('email', 'id'))
+            for email in missing:
+                self.ids[email] = found.get(email)
+
+    def get(self, email):
+        return self.ids.get(email) if email else None
+
+
+def open_source(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _timestamp(value, line_no):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ImportFormatError(f"line {line_no}: invalid datetime {value!r}")
+    return parsed
+
+
+def check_text(kind, record, line_no, label=None):
+    model, fields = TEXT_FIELDS[kind]
+    for field in fields:
+        if field not in record:
+            continue
+        value = record[field]
+        name = label or field
+        if not isinstance(value, str):
+            raise ImportFormatError(f"line {line_no}: {name} must be a string, not {value!r}")
+        max_length = model._meta.get_field(field).max_length
+        if max_length and len(value) > max_length:
+            raise ImportFormatError(f"line {line_no}: {name} longer than {max_length} characters")
+
+
+class JsonlImporter:
+    """
+    Import a JSONL file in batches. Each batch, and the job's
+    ``lines_done`` checkpoint, commit in one transaction, so a failed run
+    resumes exactly after the last committed batch.
+    """
+
+    def __init__(self, job, batch_size=500, progress=None):
+        self.job = job
+        self.batch_size = batch_size
+        self.progress = progress
+        self.tags = TagResolver()
+        self.users = UserResolver()
+
+    def run(self):
+        job = self.job
+        job.status = 'running'
+        job.error = ''
+        job.save(update_fields=['status', 'error', 'updated_at'])
+
+        start = time.perf_counter()
+        rows = 0
+        try:
+            with open_source(job.source) as stream:
+                lines = enumerate(stream, start=1)
+                for line_no, _ in itertools.islice(lines, job.lines_done):
+                    pass
+                while True:
+                    batch = list(itertools.islice(lines, self.batch_size))
+                    if not batch:
+                        break
+                    rows += self.import_batch(batch)
+                    if self.progress:
+                        elapsed = time.perf_counter() - start
+                        self.progress(job.lines_done, rows, rows / elapsed if elapsed else 0)
+        except Exception as exc:
+            job.status = 'failed'
+            job.error = str(exc)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+
+        job.status = 'done'
+        job.save(update_fields=['status', 'updated_at'])
+        elapsed = time.perf_counter() - start
+        return rows, rows / elapsed if elapsed else 0
+
+    def parse(self, batch):
+        records = []
+        for line_no, line in batch:
+            if not line.strip():
+                continue
+            try:
+                record = fastjson.loads(line)
+            except ValueError as exc:
+                raise ImportFormatError(f"line {line_no}: {exc}")
+            if not isinstance(record, dict):
+                raise ImportFormatError(f"line {line_no}: expected an object")
+            required = REQUIRED_FIELDS.get(record.get('type'))
+            if required is None:
+                raise ImportFormatError(f"line {line_no}: unknown type {record.get('type')!r}")
+            missing = [field for field in required if field not in record]
+            if missing:
+                raise ImportFormatError(f"line {line_no}: missing {', '.join(missing)}")
+            check_text(record['type'], record, line_no)
+            if record['type'] == 'reply' and type(record['post']) is not int:
+                raise ImportFormatError(f"line {line_no}: invalid post id {record['post']!r}")
+            if record['type'] == 'post':
+                tags = record.get('tags', [])
+                if not isinstance(tags, list):
+                    raise ImportFormatError(f"line {line_no}: tags must be a list of names")
+                for name in tags:
+                    check_text('tag', {'name': name}, line_no, 'tag name')
+                    if not name.strip():
+                        raise ImportFormatError(f"line {line_no}: empty tag name")
+                replies = record.get('replies', [])
+                if not isinstance(replies, list):
+                    raise ImportFormatError(f"line {line_no}: replies must be a list")
+                for reply in replies:
+                    if not isinstance(reply, dict) or 'content' not in reply:
+                        raise ImportFormatError(f"line {line_no}: reply missing content")
+                    check_text('reply', reply, line_no, 'reply content')
+            records.append((line_no, record))
+        return records
+
+    def import_batch(self, batch):
+        records = self.parse(batch)
+        by_type = {'tag': [], 'post': [], 'reply': [], 'story': []}
+        for line_no, record in records:
+            by_type[record['type']].append((line_no, record))
+
+        self.users.prefetch(
+            [record.get('author_email') for _, record in records]
+            + [reply.get('author_email') for _, record in by_type['post'] for reply in record.get('replies', [])]
+        )
+
+        self.check_reply_posts(by_type['reply'])
+
+        tags_before = self.tags.created
+        try:
+            with transaction.atomic():
+                # Every tag name in the batch is resolved up front, in one go.
+                self.tags.resolve(
+                    [record['name'] for _, record in by_type['tag']]
+                    + [name for _, record in by_type['post'] for name in record.get('tags', [])]
+                )
+                posts, replies = self.import_posts(by_type['post'])
+                replies += self.import_replies(by_type['reply'])
+                stories = self.import_stories(by_type['story'])
+
+                job = self.job
+                job.lines_done = batch[-1][0]
+                job.posts_created += posts
+                job.replies_created += replies
+                job.stories_created += stories
+                job.tags_created += self.tags.created - tags_before
+                job.save(update_fields=[
+                    'lines_done', 'posts_created', 'replies_created',
+                    'stories_created', 'tags_created', 'updated_at',
+                ])
+        except (IntegrityError, DataError) as exc:
+            raise ImportFormatError(f"lines {batch[0][0]}-{batch[-1][0]}: {exc}")
+        return len(records)
+
+    def check_reply_posts(self, records):
+        post_ids = {record['post'] for _, record in records}
+        if not post_ids:
+            return
+        existing = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+        for line_no, record in records:
+            if record['post'] not in existing:
+                raise ImportFormatError(f"line {line_no}: post {record['post']} does not exist")
+
+    def restore_created_at(self, model, objs, timestamps):
+        # bulk_create() always applies auto_now_add; keep source timestamps.
+        dated = []
+        for obj, created_at in zip(objs, timestamps):
+            if created_at is not None:
+                obj.created_at = created_at
+                dated.append(obj)
+        if dated:
+            model.objects.bulk_update(dated, ['created_at'], batch_size=self.batch_size)
+
+    def import_posts(self, records):
+        if not records:
+            return 0, 0
+        posts = [
+            Post(
+                title=record['title'],
+                description=record.get('description', ''),
+                post_type=record.get('post_type', 'problem'),
+                hide_identity=record.get('hide_identity', False),
+                author_id=self.users.get(record.get('author_email')),
+            )
+            for _, record in records
+        ]
+        Post.objects.bulk_create(posts)
+        self.restore_created_at(Post, posts, [_timestamp(record.get('created_at'), line_no) for line_no, record in records])
+        # bulk_create() sends no post_save, which queues this per post.
+        enqueue('refresh_related_batch', post_ids=[post.id for post in posts])
+
+        links = [
+            Post.tags.through(post_id=post.id, tag_id=self.tags.ids[name])
+            for post, (_, record) in zip(posts, records)
+            for name in record.get('tags', [])
+        ]
+        Post.tags.through.objects.bulk_create(links, ignore_conflicts=True)
+        if links:
+            recount_posts({link.tag_id for link in links})
+
+        nested = [
+            (line_no, dict(reply, post=post.id))
+            for post, (line_no, record) in zip(posts, records)
+            for reply in record.get('replies', [])
+        ]
+        return len(posts), self.import_replies(nested)
+
+    def import_replies(self, records):
+        if not records:
+            return 0
+        replies = [
+            Reply(
+                post_id=record['post'],
+                content=record['content'],
+                hide_identity=record.get('hide_identity', False),
+                author_id=self.users.get(record.get('author_email')),
+            )
+            for _, record in records
+        ]
+        Reply.objects.bulk_create(replies, batch_size=self.batch_size)
+        self.restore_created_at(Reply, replies, [_timestamp(record.get('created_at'), line_no) for line_no, record in records])
+        return len(replies)
+
+    def import_stories(self, records):
+        if not records:
+            return 0
+        stories = [
+            Story(
+                title=record['title'],
+                description=record.get('description', ''),
+                category=record['category'],
+                anonymous=record.get('anonymous', False),
+                user_id=self.users.get(record.get('author_email')),
+                reads_count=record.get('reads_count', 0),
+            )
+            for _, record in records
+        ]
+        Story.objects.bulk_create(stories)
+        self.restore_created_at(Story, stories, [_timestamp(record.get('created_at'), line_no) for line_no, record in records])
+        return len(stories)
+
+
+def run_import(source, batch_size=500, restart=False, progress=None):
+    job, _ = ImportJob.objects.get_or_create(source=source)
+    if restart:
+        job.lines_done = 0
+        job.posts_created = job.replies_created = job.stories_created = job.tags_created = 0
+        job.save()
+    return job, JsonlImporter(job, batch_size, progress).run()
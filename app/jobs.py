@@ -0,0 +1,235 @@
+import datetime
+import logging
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+
+from .models import BackgroundJob, ImportJob
+from .tag_index import recount_posts
+from . import feeds, related
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Background jobs
+# -------------------------------
+#
+# Side effects that don't have to finish before the response is sent are
+# queued as BackgroundJob rows and run by `manage.py run_jobs`. The row is
+# inserted in the caller's transaction, so a rolled back request never
+# leaves a job behind. Handlers take JSON-serializable keyword arguments
+# and must be safe to run more than once.
+
+HANDLERS = {}
+
+
+def register(name=None, max_attempts=3):
+    def decorator(func):
+        func.job_name = name or func.__name__
+        func.max_attempts = max_attempts
+        HANDLERS[func.job_name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=None, **payload):
+    """Queue handler ``name`` to run with ``payload``, after ``delay`` seconds if given."""
+    handler = HANDLERS[name]
+    job = BackgroundJob(name=name, payload=payload, max_attempts=handler.max_attempts)
+    if delay:
+        job.run_after = timezone.now() + datetime.timedelta(seconds=delay)
+    job.save()
+    if getattr(settings, 'JOBS_RUN_EAGERLY', False):
+        # No worker (tests, local development): run once the caller commits.
+        transaction.on_commit(lambda: run_eagerly(job.pk))
+    return job
+
+
+def run_eagerly(job_id):
+    jobs = claim('eager', ids=[job_id])
+    for job in jobs:
+        execute(job)
+
+
+def retry_delay(attempts):
+    # 10s, 40s, 90s, ... capped at an hour.
+    return min(10 * attempts * attempts, 3600)
+
+
+# -------------------------------
+# Claiming and running
+# -------------------------------
+
+def claim(worker_id, limit=20, ids=None):
+    """
+    Mark up to ``limit`` due jobs as running for ``worker_id`` and return
+    them. Uses SELECT ... FOR UPDATE SKIP LOCKED where the database has it
+    (PostgreSQL), so concurrent workers pick disjoint rows without waiting.
+    Elsewhere (SQLite) the status check in the UPDATE keeps two workers
+    from both taking a job.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = BackgroundJob.objects.filter(status='pending', run_after__lte=now)
+        if ids is not None:
+            due = due.filter(id__in=ids)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        picked = list(due.order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+        if not picked:
+            return []
+        BackgroundJob.objects.filter(id__in=picked, status='pending').update(
+            status='running', locked_by=worker_id, locked_at=now,
+        )
+    return list(BackgroundJob.objects.filter(id__in=picked, status='running', locked_by=worker_id, locked_at=now).order_by('id'))
+
+
+def execute(job):
+    job.attempts += 1
+    start = time.perf_counter()
+    try:
+        handler = HANDLERS.get(job.name)
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job.name!r}")
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        else:
+            job.status = 'pending'
+            job.run_after = timezone.now() + datetime.timedelta(seconds=retry_delay(job.attempts))
+        logger.warning("Job %s #%s failed (attempt %s/%s)", job.name, job.pk, job.attempts, job.max_attempts, exc_info=True)
+    else:
+        job.status = 'done'
+        job.finished_at = timezone.now()
+    job.duration_ms = (time.perf_counter() - start) * 1000
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=[
+        'status', 'attempts', 'run_after', 'locked_by', 'locked_at',
+        'last_error', 'duration_ms', 'finished_at',
+    ])
+    return job
+
+
+def release_stale(older_than=600):
+    """Put jobs back in the queue whose worker died mid-run."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=older_than)
+    return BackgroundJob.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='pending', locked_by='', locked_at=None,
+    )
+
+
+def job_stats(since=None):
+    jobs = BackgroundJob.objects.all()
+    if since is not None:
+        jobs = jobs.filter(created_at__gte=since)
+    return list(
+        jobs.order_by().values('name', 'status').annotate(
+            count=Count('id'), avg_ms=Avg('duration_ms'), max_ms=Max('duration_ms'),
+        ).order_by('name', 'status')
+    )
+
+
+class Worker:
+    """
+    Claims jobs in batches and runs them on a thread pool. Each thread has
+    its own database connection, so ``threads`` should stay well below the
+    database's connection limit.
+    """
+
+    def __init__(self, threads=4, batch_size=20, poll_interval=1.0, stale_after=600):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run_job(self, job):
+        try:
+            return execute(job)
+        finally:
+            close_old_connections()
+
+    def run(self, once=False, on_batch=None):
+        """Run until stop() is called, or until the queue is empty when ``once``."""
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job') as pool:
+            checked_stale = None
+            while not self.stopping:
+                if checked_stale is None or time.monotonic() - checked_stale > self.stale_after / 2:
+                    release_stale(self.stale_after)
+                    checked_stale = time.monotonic()
+
+                jobs = claim(self.worker_id, self.batch_size)
+                if not jobs:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+
+                start = time.perf_counter()
+                done = list(pool.map(self.run_job, jobs))
+                if on_batch:
+                    on_batch(done, time.perf_counter() - start)
+        close_old_connections()
+
+
+# -------------------------------
+# Handlers
+# -------------------------------
+
+@register()
+def recount_tag_posts(tag_ids):
+    recount_posts(tag_ids)
+
+
+@register()
+def record_affinity(post_id, user_id=None, temp_user_id=None):
+    feeds.record_affinity(post_id, user_id, temp_user_id)
+
+
+@register()
+def fan_out_post(post_id):
+    feeds.fan_out_post(post_id)
+
+
+@register()
+def build_feed(field, owner_id):
+    feeds.build_feed(field, owner_id)
+
+
+@register()
+def refresh_related_posts(post_id):
+    related.refresh_post(post_id)
+
+
+@register()
+def refresh_related_batch(post_ids):
+    # Posts created with bulk_create (imports.py), which sends no post_save.
+    for post_id in post_ids:
+        related.refresh_post(post_id)
+
+
+@register(max_attempts=1)
+def run_import(import_job_id):
+    # Queued from the ImportJob admin. Not retried: a failed import keeps
+    # its checkpoint and error, and is resumed from the admin again.
+    from .imports import JsonlImporter  # imports.py imports this module
+
+    if ImportJob.objects.filter(pk=import_job_id, status__in=['pending', 'failed']).update(status='running'):
+        JsonlImporter(ImportJob.objects.get(pk=import_job_id)).run()
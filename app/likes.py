@@ -0,0 +1,111 @@
+from array import array
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Story, StoryLikeChunk
+from .objectcache import LocalLRU, story_cache
+from .counters import counters
+
+
+# -------------------------------
+# Story liker sets
+# -------------------------------
+#
+# Who liked a story is kept as a compressed id set per kind (user / temp
+# user) in StoryLikeChunk rows instead of a row per like. A toggle locks
+# and rewrites only the chunk the id falls in (at most 8 KiB). Decoded
+# chunks are cached per process as Python sets for O(1) membership checks;
+# toggles always re-read the locked row, so a stale cached chunk can only
+# make a read briefly out of date.
+
+BITMAP_BYTES = 65536 // 8
+
+chunk_cache = LocalLRU(size=10000, ttl=5.0)
+
+
+def split_id(member_id):
+    return member_id >> 16, member_id & 0xFFFF
+
+
+def decode(data, cardinality):
+    data = bytes(data)
+    if cardinality > StoryLikeChunk.ARRAY_MAX:
+        return {
+            byte_index * 8 + bit
+            for byte_index, byte in enumerate(data) if byte
+            for bit in range(8) if byte >> bit & 1
+        }
+    values = array('H')
+    values.frombytes(data)
+    return set(values)
+
+
+def encode(members):
+    if len(members) > StoryLikeChunk.ARRAY_MAX:
+        bitmap = bytearray(BITMAP_BYTES)
+        for low in members:
+            bitmap[low >> 3] |= 1 << (low & 7)
+        return bytes(bitmap)
+    return array('H', sorted(members)).tobytes()
+
+
+def get_members(story_id, kind, bucket):
+    key = (story_id, kind, bucket)
+    members = chunk_cache.get(key)
+    if members is None:
+        row = StoryLikeChunk.objects.filter(story_id=story_id, kind=kind, bucket=bucket).values_list('data', 'cardinality').first()
+        members = frozenset(decode(*row)) if row else frozenset()
+        chunk_cache.set(key, members)
+    return members
+
+
+def has_liked(story_id, kind, member_id):
+    bucket, low = split_id(member_id)
+    return low in get_members(story_id, kind, bucket)
+
+
+def toggle_like(story_id, kind, member_id):
+    """Add or remove ``member_id``'s like; returns (liked, likes_count)."""
+    bucket, low = split_id(member_id)
+    with transaction.atomic():
+        chunk, _ = StoryLikeChunk.objects.select_for_update().get_or_create(story_id=story_id, kind=kind, bucket=bucket)
+        members = decode(chunk.data, chunk.cardinality)
+        liked = low not in members
+        if liked:
+            members.add(low)
+        else:
+            members.discard(low)
+        chunk.data = encode(members)
+        chunk.cardinality = len(members)
+        chunk.save(update_fields=['data', 'cardinality'])
+
+        delta = 1 if liked else -1
+        Story.objects.filter(pk=story_id).update(likes_count=F('likes_count') + delta, changed_at=timezone.now())
+        likes_count = Story.objects.filter(pk=story_id).values_list('likes_count', flat=True).first()
+
+        frozen = frozenset(members)
+        transaction.on_commit(lambda: chunk_cache.set((story_id, kind, bucket), frozen))
+        transaction.on_commit(lambda: counters.bump(Story, story_id, 'likes_count', delta))
+        story_cache.invalidate(story_id)
+    return liked, likes_count
+
+
+def count_likes(story_id):
+    # likes_count as derived from the liker sets.
+    return StoryLikeChunk.objects.filter(story_id=story_id).aggregate(n=Sum('cardinality'))['n'] or 0
+
+
+def members_with_likes(kind, member_ids):
+    """The ids among ``member_ids`` that are in some story's liker set."""
+    lows = defaultdict(set)
+    for member_id in member_ids:
+        bucket, low = split_id(member_id)
+        lows[bucket].add(low)
+    found = set()
+    chunks = StoryLikeChunk.objects.filter(kind=kind, bucket__in=lows, cardinality__gt=0).values_list('bucket', 'data', 'cardinality')
+    for bucket, data, cardinality in chunks.iterator():
+        found.update(bucket << 16 | low for low in lows[bucket] & decode(data, cardinality))
+    return found
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app import feeds
+from app.models import TagAffinity
+
+
+class Command(BaseCommand):
+    help = "Build the materialized home feed of every recently active user and temp user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-affinity', action='store_true', help="Recompute tag affinities from reactions first")
+        parser.add_argument('--active-days', type=int, default=feeds.ACTIVE_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['rebuild_affinity']:
+            created = feeds.rebuild_affinities(options['batch_size'])
+            self.stdout.write(f"Rebuilt {created} tag affinities")
+
+        active_since = timezone.now() - datetime.timedelta(days=options['active_days'])
+        active = TagAffinity.objects.filter(updated_at__gte=active_since).order_by()
+        built = entries = 0
+        for field in ('user_id', 'temp_user_id'):
+            owner_ids = active.filter(**{f'{field}__isnull': False}).values_list(field, flat=True).distinct()
+            for owner_id in owner_ids.iterator(chunk_size=options['batch_size']):
+                entries += feeds.build_feed(field, owner_id)
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built {built} feeds ({entries} entries)"))
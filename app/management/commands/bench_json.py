@@ -0,0 +1,76 @@
+import datetime
+import decimal
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from app import fastjson
+from app.renderers import FastJSONRenderer
+
+
+def feed_payload(size):
+    # Same shape as PostListSerializer output for mixed_feed / list.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        {
+            'id': i,
+            'title': f"How do I stop overthinking everything? #{i}",
+            'post_type': 'problem' if i % 2 else 'journey',
+            'author_display': 'Anonymous' if i % 3 else f"user{i}@example.com",
+            'hide_identity': bool(i % 3),
+            'tags': [{'id': t, 'name': f"tag-{t}"} for t in range(i % 4 + 1)],
+            'reaction_count': i * 7 % 113,
+            'created_at': (now - datetime.timedelta(minutes=i)).isoformat(),
+            'token': uuid.uuid4(),
+            'score': decimal.Decimal('0.8125'),
+        }
+        for i in range(size)
+    ]
+
+
+def timeit(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Benchmark the stock DRF JSON renderer against app.renderers.FastJSONRenderer on feed payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20, help="Posts per payload (mixed_feed returns 20).")
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        data = feed_payload(options['size'])
+        iterations = options['iterations']
+        stock, fast = JSONRenderer(), FastJSONRenderer()
+        body = stock.render(data)
+
+        cases = [
+            ('render stdlib', lambda: [stock.render(data) for _ in range(iterations)]),
+            (f'render {fastjson.backend().name}', lambda: [fast.render(data) for _ in range(iterations)]),
+            ('parse stdlib', lambda: [json.loads(body) for _ in range(iterations)]),
+            (f'parse {fastjson.backend().name}', lambda: [fastjson.loads(body) for _ in range(iterations)]),
+        ]
+
+        self.stdout.write(f"payload: {options['size']} posts, {len(body)} bytes, {iterations} iterations")
+        results = {}
+        for name, fn in cases:
+            results[name] = timeit(fn, options['repeat'])
+            per_call = results[name] / iterations * 1e6
+            self.stdout.write(f"{name:<16} {per_call:9.1f} us/payload")
+
+        names = list(results)
+        self.stdout.write(self.style.SUCCESS(
+            f"render speedup {results[names[0]] / results[names[1]]:.1f}x, "
+            f"parse speedup {results[names[2]] / results[names[3]]:.1f}x"
+        ))
@@ -0,0 +1,42 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from app.duplicates import write_snapshot
+from app.models import Post
+
+
+class Command(BaseCommand):
+    help = "Write the near-duplicate post index snapshot that workers memory-map (run periodically, e.g. hourly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Defaults to settings.DUPLICATE_INDEX_PATH.")
+        parser.add_argument('--every', type=float, default=None, help="Rewrite the snapshot every this many seconds until stopped.")
+
+    def handle(self, *args, **options):
+        path = str(options['path'] or settings.DUPLICATE_INDEX_PATH)
+        self.stopping = False
+        if options['every'] is not None:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        while True:
+            start = time.perf_counter()
+            built_at = timezone.now()
+            rows = Post.objects.order_by('id').values_list('id', 'title', 'description').iterator(chunk_size=2000)
+            indexed = write_snapshot(path, rows, built_at)
+            close_old_connections()
+            self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} posts into {path} in {time.perf_counter() - start:.1f}s"))
+            if options['every'] is None:
+                return
+            deadline = time.monotonic() + options['every']
+            while not self.stopping and time.monotonic() < deadline:
+                time.sleep(1)
+            if self.stopping:
+                return
+
+    def stop(self, *args):
+        self.stopping = True
@@ -0,0 +1,48 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.exports import SINCE_FIELDS, iter_ndjson, iter_post_records, parse_since
+
+
+class Command(BaseCommand):
+    help = "Stream posts with their tags, replies and reactions as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="File to write, or - for stdout.")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output.")
+        parser.add_argument('--since', help="Only export posts with since-field >= this ISO datetime.")
+        parser.add_argument('--since-field', default='updated_at', choices=SINCE_FIELDS)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        if options['output'] == '-':
+            raw = sys.stdout.buffer
+        else:
+            raw = open(options['output'], 'wb')
+        out = gzip.GzipFile(fileobj=raw, mode='wb') if options['gzip'] else raw
+
+        start = time.perf_counter()
+        count = 0
+        try:
+            records = iter_post_records(since, options['since_field'], options['chunk_size'])
+            for line in iter_ndjson(records):
+                out.write(line)
+                count += 1
+        finally:
+            if out is not raw:
+                out.close()
+            if raw is not sys.stdout.buffer:
+                raw.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} posts in {elapsed:.1f}s"))
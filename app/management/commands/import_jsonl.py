@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.imports import ImportFormatError, run_import
+
+
+class Command(BaseCommand):
+    help = "Bulk import posts, replies, stories and tags from a JSONL (or .jsonl.gz) file. Re-running resumes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--restart', action='store_true', help="Ignore the saved checkpoint and start from line 1.")
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['path'])
+        if not os.path.exists(source):
+            raise CommandError(f"No such file: {source}")
+
+        def progress(lines_done, rows, rate):
+            self.stdout.write(f"line {lines_done}: {rows} rows, {rate:.0f} rows/s")
+
+        try:
+            job, (rows, rate) = run_import(source, options['batch_size'], options['restart'], progress)
+        except ImportFormatError as exc:
+            raise CommandError(f"{exc} (re-run to resume after the last committed batch)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {rows} rows at {rate:.0f} rows/s: {job.posts_created} posts, "
+            f"{job.replies_created} replies, {job.stories_created} stories, {job.tags_created} new tags"
+        ))
@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import fastjson
+from app.provisioning import Provisioner, read_records
+
+
+class Command(BaseCommand):
+    help = "Create many users (and their profiles) from a CSV or JSONL file of email, full_name, password, display_name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--processes', type=int, default=None, help="Password hashing processes (default: CPU count).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--tokens-out', help="Write a JSONL file of {id, email, tokens} for the created users.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+
+        with open(path, 'rb') as stream:
+            try:
+                records = read_records(stream, fmt)
+            except ValueError as exc:
+                raise CommandError(f"Could not parse {path}: {exc}")
+
+        provisioner = Provisioner(options['batch_size'], options['processes'], with_tokens=bool(options['tokens_out']))
+        result = provisioner.run(records)
+
+        for skipped in result['skipped']:
+            self.stdout.write(f"skipped {skipped['email'] or '(row ' + str(skipped['row']) + ')'}: {skipped['reason']}")
+
+        if options['tokens_out']:
+            with open(options['tokens_out'], 'wb') as out:
+                for user in result['created']:
+                    out.write(fastjson.dumps(user) + b'\n')
+
+        stats = result['stats']
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['created']} users, skipped {stats['skipped']} in {stats['seconds']}s "
+            f"({stats['users_per_second']} users/s, {stats['hash_seconds']}s hashing)"
+        ))
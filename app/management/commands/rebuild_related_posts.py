@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import related
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored related posts of every post."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = related.rebuild(options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} neighbours for {len(related.related_index.docs)} posts in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from app.exports import chunked
+from app.models import Reply, ReplyReaction
+
+
+class Command(BaseCommand):
+    help = "Recompute Reply helpful/not_satisfied counts and Wilson scores from ReplyReaction rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Reply.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        updated = 0
+        for batch in chunked(ids, batch_size):
+            counts = {}
+            tallies = ReplyReaction.objects.filter(reply_id__in=batch).order_by().values_list('reply_id', 'reaction').annotate(n=Count('pk'))
+            for reply_id, reaction, n in tallies:
+                counts[(reply_id, reaction)] = n
+
+            with transaction.atomic():
+                replies = list(Reply.objects.select_for_update().filter(pk__in=batch).only('pk'))
+                for reply in replies:
+                    reply.helpful_count = counts.get((reply.pk, 'helpful'), 0)
+                    reply.not_satisfied_count = counts.get((reply.pk, 'not_satisfied'), 0)
+                    reply.refresh_score()
+                Reply.objects.bulk_update(replies, ['helpful_count', 'not_satisfied_count', 'score'])
+            updated += len(replies)
+            self.stdout.write(f"{updated} replies rescored")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt scores for {updated} replies"))
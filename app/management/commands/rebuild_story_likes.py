@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from app.models import Story, StoryLikeChunk
+
+
+class Command(BaseCommand):
+    help = "Recompute Story.likes_count from the stored liker sets (drops likes recorded before likes were deduplicated)."
+
+    def handle(self, *args, **options):
+        likes = StoryLikeChunk.objects.filter(story=OuterRef('pk')).order_by().values('story').annotate(n=Sum('cardinality')).values('n')
+        updated = Story.objects.update(likes_count=Coalesce(Subquery(likes), 0))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt likes_count for {updated} stories"))
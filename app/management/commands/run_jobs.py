@@ -0,0 +1,38 @@
+import signal
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from app.jobs import Worker, job_stats
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs on a thread pool until stopped (SIGTERM/SIGINT finish the current batch)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=20, help="Jobs claimed per round trip.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due.")
+        parser.add_argument('--stats', action='store_true', help="Print per-job counts and timings, then exit.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for row in job_stats():
+                avg = f"{row['avg_ms']:.1f}" if row['avg_ms'] is not None else "-"
+                peak = f"{row['max_ms']:.1f}" if row['max_ms'] is not None else "-"
+                self.stdout.write(f"{row['name']:<30} {row['status']:<8} {row['count']:>8}  avg {avg} ms  max {peak} ms")
+            return
+
+        worker = Worker(options['threads'], options['batch_size'], options['poll'])
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+
+        def on_batch(jobs, elapsed):
+            statuses = Counter(job.status for job in jobs)
+            summary = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+            self.stdout.write(f"{len(jobs)} jobs in {elapsed * 1000:.0f} ms ({summary})")
+
+        self.stdout.write(f"Worker {worker.worker_id} started with {options['threads']} threads")
+        worker.run(once=options['once'], on_batch=on_batch if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS("Worker stopped"))
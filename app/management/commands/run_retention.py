@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.retention import archive_room_messages, purge_temporary_users
+
+
+class Command(BaseCommand):
+    help = "Delete stale anonymous users and archive messages of long-ended discussion rooms, in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['temp-users', 'messages'], help="Run a single job.")
+        parser.add_argument('--temp-user-days', type=int, default=30, help="Minimum age of content-less temp users to delete.")
+        parser.add_argument('--room-days', type=int, default=90, help="Archive messages of rooms ended this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.1, help="Seconds to pause between batches.")
+
+    def handle(self, *args, **options):
+        jobs = []
+        if options['only'] in (None, 'temp-users'):
+            jobs.append(('temp users deleted', purge_temporary_users(
+                options['temp_user_days'], options['batch_size'], options['sleep'],
+            )))
+        if options['only'] in (None, 'messages'):
+            jobs.append(('messages archived', archive_room_messages(
+                options['room_days'], options['batch_size'], options['sleep'],
+            )))
+
+        for label, batches in jobs:
+            start = time.perf_counter()
+            total = 0
+            for count in batches:
+                total += count
+                self.stdout.write(f"{label}: {total}")
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(f"{total} {label} in {elapsed:.1f}s"))
@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from app.scheduler import RoomScheduler
+
+
+class Command(BaseCommand):
+    help = "Activate scheduled discussion rooms at their start time and notify their subscribers (runs until stopped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=3600, help="Seconds ahead to keep upcoming rooms in memory.")
+        parser.add_argument('--refresh', type=float, default=30.0, help="Seconds between scans for new and changed rooms.")
+        parser.add_argument('--once', action='store_true', help="Activate rooms that are due now, then exit.")
+
+    def handle(self, *args, **options):
+        scheduler = RoomScheduler(options['horizon'], options['refresh'])
+        signal.signal(signal.SIGTERM, scheduler.stop)
+        signal.signal(signal.SIGINT, scheduler.stop)
+
+        def on_activate(room_ids):
+            self.stdout.write(f"Activated rooms {', '.join(map(str, room_ids))}")
+
+        self.stdout.write("Room scheduler started")
+        scheduler.run(once=options['once'], on_activate=on_activate)
+        self.stdout.write(self.style.SUCCESS("Room scheduler stopped"))
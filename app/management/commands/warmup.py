@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.serving import warm_up
+
+
+class Command(BaseCommand):
+    help = "Run the ASGI startup warmup once and print how long each phase takes."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        timings = warm_up()
+        for name, seconds in timings.items():
+            self.stdout.write(f"{name:<12} {seconds * 1000:8.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Warmup done in {(time.perf_counter() - start) * 1000:.1f} ms"))
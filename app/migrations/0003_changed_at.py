@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_story'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discussionroom',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_post_counts(apps, schema_editor):
+    Tag = apps.get_model('app', 'Tag')
+    Post = apps.get_model('app', 'Post')
+    counts = Post.tags.through.objects.filter(tag_id=OuterRef('pk')).order_by().values('tag_id').annotate(c=Count('pk')).values('c')
+    Tag.objects.update(post_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_post_counts, migrations.RunPython.noop),
+    ]
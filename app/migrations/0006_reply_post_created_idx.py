@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_tag_post_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['post', 'created_at'], name='reply_post_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_reply_post_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='helpful_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='not_satisfied_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['post', '-score'], name='reply_post_score_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_ended_at(apps, schema_editor):
+    # Best available estimate for rooms ended before ended_at existed.
+    DiscussionRoom = apps.get_model('app', 'DiscussionRoom')
+    DiscussionRoom.objects.filter(status='ended', ended_at__isnull=True).update(ended_at=F('changed_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_savedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDiscussionMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.TextField()),
+                ('reply_to_id', models.BigIntegerField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='discussionroom',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='discussionroom',
+            index=models.Index(fields=['status', 'ended_at'], name='room_status_ended_idx'),
+        ),
+        migrations.AddField(
+            model_name='archiveddiscussionmessage',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='app.discussionroom'),
+        ),
+        migrations.AddField(
+            model_name='archiveddiscussionmessage',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_ended_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at'], name='post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['post_type', '-created_at'], name='post_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['created_at'], name='reaction_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['created_at'], name='reply_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='replyreaction',
+            index=models.Index(fields=['created_at'], name='replyreaction_created_idx'),
+        ),
+    ]
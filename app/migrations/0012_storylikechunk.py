@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_admin_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryLikeChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('temp', 'Temporary user')], max_length=4)),
+                ('bucket', models.PositiveIntegerField()),
+                ('cardinality', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField(default=b'')),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_chunks', to='app.story')),
+            ],
+            options={
+                'unique_together': {('story', 'kind', 'bucket')},
+            },
+        ),
+    ]
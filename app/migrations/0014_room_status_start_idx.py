@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_home_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discussionroom',
+            index=models.Index(fields=['status', 'start_datetime'], name='room_status_start_idx'),
+        ),
+    ]
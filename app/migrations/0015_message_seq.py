@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    # Existing messages are numbered in id order, room by room.
+    DiscussionRoom = apps.get_model('app', 'DiscussionRoom')
+    DiscussionMessage = apps.get_model('app', 'DiscussionMessage')
+    room_ids = DiscussionMessage.objects.order_by().values_list('room_id', flat=True).distinct()
+    for room_id in room_ids.iterator():
+        messages = list(DiscussionMessage.objects.filter(room_id=room_id).order_by('id').only('id'))
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        DiscussionMessage.objects.bulk_update(messages, ['seq'], batch_size=1000)
+        DiscussionRoom.objects.filter(pk=room_id).update(last_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_room_status_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archiveddiscussionmessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='discussionmessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='discussionroom',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='discussionmessage',
+            constraint=models.UniqueConstraint(fields=('room', 'seq'), name='unique_room_message_seq'),
+        ),
+    ]
@@ -2,6 +2,8 @@
 
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.db import models
+from django.utils import timezone
+import math
 import uuid
 
 
@@ -82,6 +84,9 @@ class TemporaryUser(models.Model):
 
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # Number of posts carrying the tag, maintained by signals.py.
+    post_count = models.PositiveIntegerField(default=0)
+    changed_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -103,13 +108,20 @@ class Post(models.Model):
     post_type = models.CharField(max_length=20, choices=POST_TYPE_CHOICES, default="problem")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on any change visible through the API, including reactions and
+    # tag links (see signals.py); validator for conditional GETs.
+    changed_at = models.DateTimeField(auto_now=True, db_index=True)
 
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     hide_identity = models.BooleanField(default=False)
-    saved_by = models.ManyToManyField(User, blank=True, related_name='saved_posts')
+    saved_by = models.ManyToManyField(User, blank=True, related_name='saved_posts', through='SavedPost')
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='post_created_idx'),
+            models.Index(fields=['post_type', '-created_at'], name='post_type_created_idx'),
+        ]
 
     def author_display_name(self):
         if self.hide_identity:
@@ -124,10 +136,37 @@ class Post(models.Model):
         return f"{self.title[:40]} - {self.post_type}"
 
 
+# -------------------------------
+# Saved Post (Post.saved_by through table)
+# -------------------------------
+
+class SavedPost(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    saved_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Keeps the table Django created for the original auto through model.
+        db_table = 'app_post_saved_by'
+        unique_together = (('post', 'user'),)
+        indexes = [
+            models.Index(fields=['user', '-saved_at'], name='savedpost_user_saved_idx'),
+        ]
+
+
 # -------------------------------
 # Reply Model
 # -------------------------------
 
+def wilson_lower_bound(positive, negative, z=1.96):
+    # Lower bound of the 95% Wilson score interval for the helpful ratio.
+    n = positive + negative
+    if n == 0:
+        return 0.0
+    phat = positive / n
+    return (phat + z * z / (2 * n) - z * math.sqrt((phat * (1 - phat) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+
 class Reply(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='replies')
     content = models.TextField()
@@ -138,8 +177,22 @@ class Reply(models.Model):
     hide_identity = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # ReplyReaction tallies and their Wilson score, kept in step by
+    # ReplyViewSet.react (rebuild with `manage.py rebuild_reply_scores`).
+    helpful_count = models.PositiveIntegerField(default=0)
+    not_satisfied_count = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0.0)
+
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='reply_post_created_idx'),
+            models.Index(fields=['post', '-score'], name='reply_post_score_idx'),
+            models.Index(fields=['created_at'], name='reply_created_idx'),
+        ]
+
+    def refresh_score(self):
+        self.score = wilson_lower_bound(self.helpful_count, self.not_satisfied_count)
 
     def author_display_name(self):
         if self.hide_identity:
@@ -169,6 +222,9 @@ class Reaction(models.Model):
             ('post', 'user'),
             ('post', 'temp_user'),
         )
+        indexes = [
+            models.Index(fields=['created_at'], name='reaction_created_idx'),
+        ]
 
 
 # -------------------------------
@@ -190,6 +246,71 @@ class ReplyReaction(models.Model):
             ('reply', 'user'),
             ('reply', 'temp_user', 'reaction'),
         )
+        indexes = [
+            models.Index(fields=['created_at'], name='replyreaction_created_idx'),
+        ]
+
+
+# -------------------------------
+# Related Posts
+# -------------------------------
+
+class RelatedPost(models.Model):
+    # The TOP_K most similar posts of each post, maintained by related.py.
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [
+            models.Index(fields=['post', '-score'], name='related_post_score_idx'),
+        ]
+
+
+# -------------------------------
+# Home Feed
+# -------------------------------
+
+class TagAffinity(models.Model):
+    # How often a user (or temp user) reacted to posts with a tag; who a
+    # new post is fanned out to (see app/feeds.py).
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='tag_affinities')
+    temp_user = models.ForeignKey(TemporaryUser, null=True, blank=True, on_delete=models.CASCADE, related_name='tag_affinities')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='affinities')
+    weight = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (
+            ('user', 'tag'),
+            ('temp_user', 'tag'),
+        )
+        indexes = [
+            models.Index(fields=['tag', '-updated_at'], name='affinity_tag_updated_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    # Materialized home feed, newest post first, trimmed to FEED_LENGTH.
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='feed_entries')
+    temp_user = models.ForeignKey(TemporaryUser, null=True, blank=True, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries')
+    # The post's created_at, copied so the feed reads off one index.
+    ranked_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (
+            ('user', 'post'),
+            ('temp_user', 'post'),
+        )
+        indexes = [
+            models.Index(fields=['user', '-ranked_at'], name='feed_user_ranked_idx'),
+            models.Index(fields=['temp_user', '-ranked_at'], name='feed_temp_ranked_idx'),
+        ]
 
 
 # -------------------------------
@@ -213,6 +334,16 @@ class DiscussionRoom(models.Model):
     notify_users = models.ManyToManyField(User, related_name="notify_rooms", blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    changed_at = models.DateTimeField(auto_now=True, db_index=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    # Sequence number of the room's latest message (see chat.py).
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'ended_at'], name='room_status_ended_idx'),
+            models.Index(fields=['status', 'start_datetime'], name='room_status_start_idx'),
+        ]
 
     def __str__(self):
         return self.topic
@@ -224,11 +355,33 @@ class DiscussionMessage(models.Model):
     message = models.TextField()
     reply_to = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL)
     timestamp = models.DateTimeField(auto_now_add=True)
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'seq'], name='unique_room_message_seq'),
+        ]
 
     def __str__(self):
         return f"{self.sender} - {self.room.topic}"
 
 
+class ArchivedDiscussionMessage(models.Model):
+    # DiscussionMessage rows moved out of long-ended rooms by
+    # `manage.py run_retention`; ids are kept from the original table.
+    id = models.BigIntegerField(primary_key=True)
+    room = models.ForeignKey(DiscussionRoom, on_delete=models.CASCADE, related_name="archived_messages")
+    sender = models.ForeignKey(User, on_delete=models.CASCADE)
+    message = models.TextField()
+    reply_to_id = models.BigIntegerField(null=True, blank=True)
+    timestamp = models.DateTimeField()
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sender} - {self.room.topic} (archived)"
+
+
 
 from django.db import models
 from django.contrib.auth import get_user_model
@@ -266,9 +419,13 @@ class Story(models.Model):
     reads_count = models.PositiveIntegerField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    # Not bumped by reads_count, so story validators are weak ETags.
+    changed_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    SNIPPET_LENGTH = 150
 
     def snippet(self):
-        return Truncator(self.description).chars(150)
+        return Truncator(self.description).chars(self.SNIPPET_LENGTH)
 
     def author_name(self):
         if self.anonymous or not self.user:
@@ -277,3 +434,93 @@ class Story(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class StoryLikeChunk(models.Model):
+    """
+    One container of a story's liker set, roaring-bitmap style: ids are
+    split into buckets by their high 16 bits and each bucket stores the low
+    16 bits, as a sorted uint16 array while sparse and as a 65536-bit map
+    once it holds more than ARRAY_MAX ids (see app/likes.py).
+    """
+    KIND_CHOICES = (('user', 'User'), ('temp', 'Temporary user'))
+    ARRAY_MAX = 4096
+
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='like_chunks')
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    bucket = models.PositiveIntegerField()
+    cardinality = models.PositiveIntegerField(default=0)
+    data = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = (('story', 'kind', 'bucket'),)
+
+
+# -------------------------------
+# Bulk Import Job
+# -------------------------------
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    # Server-side path of the JSONL (or .jsonl.gz) file being imported.
+    source = models.CharField(max_length=500, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    # Input lines committed so far; a resumed run skips this many lines.
+    lines_done = models.PositiveBigIntegerField(default=0)
+    posts_created = models.PositiveIntegerField(default=0)
+    replies_created = models.PositiveIntegerField(default=0)
+    stories_created = models.PositiveIntegerField(default=0)
+    tags_created = models.PositiveIntegerField(default=0)
+
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.status})"
+
+
+# -------------------------------
+# Background Job Queue
+# -------------------------------
+
+class BackgroundJob(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    # Handler name registered with app.jobs.register; payload is its kwargs.
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Wall time of the last attempt.
+    duration_ms = models.FloatField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
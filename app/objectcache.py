@@ -0,0 +1,185 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Post, Story
+from .serializers import PostDetailSerializer, StorySerializer
+from .counters import counters
+
+
+# -------------------------------
+# Two-tier object cache
+# -------------------------------
+#
+# Serialized detail representations are cached in the shared Django cache
+# and, for a couple of seconds, in a small per-process LRU in front of it.
+# Invalidation deletes both tiers in this process and bumps a per-object
+# generation that in-flight fills check before caching what they read;
+# other processes drop their local copy when its TTL runs out.
+
+class LocalLRU:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (expires, value)
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class ObjectCache:
+    """
+    Read-through cache of ``{'pk', 'version', 'data'}`` entries, where
+    ``data`` is the full serializer output and ``version`` the object's
+    changed_at. Misses are single-flight: one thread per process (striped
+    locks) and one process overall (a cache.add() lock) loads the row while
+    the others wait briefly for the result.
+    """
+    timeout = 300
+    lock_timeout = 10
+    lock_wait = 2.0
+    poll_interval = 0.02
+    stripes = 64
+
+    def __init__(self, name, model, serializer_class, select_related=(), prefetch_related=(),
+                 counter_fields=(), local_size=1000, local_ttl=2.0):
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+        self.counter_fields = counter_fields
+        self.local = LocalLRU(local_size, local_ttl)
+        self.locks = [threading.Lock() for _ in range(self.stripes)]
+
+    def key(self, pk):
+        return f'obj:{self.name}:{pk}'
+
+    def generation_key(self, pk):
+        return f'obj:{self.name}:{pk}:gen'
+
+    def load(self, pk):
+        queryset = self.model.objects.select_related(*self.select_related).prefetch_related(*self.prefetch_related)
+        instance = queryset.filter(pk=pk).first()
+        if instance is None:
+            return None
+        if self.counter_fields:
+            counters.seed(self.model, pk, {field: getattr(instance, field) for field in self.counter_fields})
+        return {
+            'pk': pk,
+            'version': instance.changed_at,
+            'data': dict(self.serializer_class(instance).data),
+        }
+
+    def store(self, pk, entry, generation):
+        # invalidate() bumps the generation. A fill that read the row before
+        # the writer committed must not cache it after the invalidation ran,
+        # so the generation is checked before and after the write.
+        key, generation_key = self.key(pk), self.generation_key(pk)
+        if cache.get(generation_key) != generation:
+            return
+        cache.set(key, entry, self.timeout)
+        if cache.get(generation_key) != generation:
+            cache.delete(key)
+            return
+        self.local.set(pk, entry)
+
+    def fill(self, pk):
+        key = self.key(pk)
+        lock_key = key + ':lock'
+        token = uuid.uuid4().hex
+        generation = cache.get(self.generation_key(pk))
+        if cache.add(lock_key, token, self.lock_timeout):
+            try:
+                entry = self.load(pk)
+                if entry is not None:
+                    self.store(pk, entry, generation)
+                return entry
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Another process is loading it.
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            if cache.get(lock_key) is None:
+                break
+        return self.load(pk)
+
+    def get(self, pk):
+        """The cached entry for ``pk``, or None when the object does not exist."""
+        entry = self.local.get(pk)
+        if entry is not None:
+            return entry
+        entry = cache.get(self.key(pk))
+        if entry is None:
+            with self.locks[hash(pk) % self.stripes]:
+                entry = self.local.get(pk) or cache.get(self.key(pk))
+                if entry is None:
+                    # fill() keeps the entry locally when it cached it.
+                    return self.fill(pk)
+        self.local.set(pk, entry)
+        return entry
+
+    def representation(self, entry, fields=None):
+        data = dict(entry['data'])
+        if self.counter_fields:
+            counters.overlay(self.model, entry['pk'], data, self.counter_fields)
+        if fields is not None:
+            data = {name: value for name, value in data.items() if name in fields}
+        return data
+
+    def invalidate(self, *pks):
+        # After commit, so a miss after it reads the new row; the generation
+        # bump stops fills that read the old row from caching it.
+        def delete():
+            for pk in pks:
+                try:
+                    cache.incr(self.generation_key(pk))
+                except ValueError:
+                    cache.add(self.generation_key(pk), 1, self.timeout)
+            cache.delete_many([self.key(pk) for pk in pks])
+            for pk in pks:
+                self.local.delete(pk)
+        transaction.on_commit(delete)
+
+
+post_cache = ObjectCache(
+    'post', Post, PostDetailSerializer,
+    select_related=('author__profile', 'temp_author'),
+    prefetch_related=('tags',),
+)
+
+story_cache = ObjectCache(
+    'story', Story, StorySerializer,
+    select_related=('user',),
+    counter_fields=('reads_count', 'likes_count'),
+)
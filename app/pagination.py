@@ -0,0 +1,50 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from .counting import EstimatedCountPaginator
+
+
+class ReplyPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SavedPostPagination(CursorPagination):
+    # Keyset pagination over the (user, -saved_at) index.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-saved_at'
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    Opt-in page-number pagination for large lists: responses stay plain
+    lists unless ``?page`` or ``?page_size`` is given. ``count`` is exact
+    below ESTIMATED_COUNT_THRESHOLD and an estimate above it, flagged by
+    ``count_estimated``.
+    """
+    django_paginator_class = EstimatedCountPaginator
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_estimated': self.page.paginator.estimated,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count_estimated'] = {'type': 'boolean', 'example': False}
+        return response
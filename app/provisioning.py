@@ -0,0 +1,173 @@
+import csv
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User, Profile
+from . import fastjson
+
+
+# -------------------------------
+# Bulk user provisioning
+# -------------------------------
+#
+# Creating accounts one by one through SignupView costs a password hash,
+# a User insert and a Profile insert (post_save signal) per row. Here the
+# hashes are computed in a process pool (PBKDF2 holds the GIL) and both
+# tables are filled with bulk_create, which skips the signal; the Profile
+# rows it would have made are created alongside.
+
+# Hashing is deliberately slow (~0.3s per password). The HTTP endpoint
+# hashes in the request thread, never in a pool forked from a web worker,
+# so it takes small batches; larger files go through
+# `manage.py provision_users`.
+MAX_REQUEST_USERS = 50
+
+
+def _setup_worker():
+    # Child processes started with "spawn" have not loaded the app registry.
+    django.setup()
+
+
+def _hash_chunk(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def hash_passwords(passwords, processes=None, chunk_size=50):
+    """make_password() for each item (None gives an unusable password), in a process pool."""
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    if processes == 1 or len(chunks) <= 1:
+        return [hashed for chunk in chunks for hashed in _hash_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_setup_worker) as pool:
+        return [hashed for chunk in pool.map(_hash_chunk, chunks) for hashed in chunk]
+
+
+def read_records(stream, fmt):
+    """Parse a CSV (header row) or JSONL binary stream into user dicts."""
+    if fmt == 'csv':
+        return list(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig')))
+    return [fastjson.loads(line) for line in stream if line.strip()]
+
+
+def issue_tokens(user):
+    refresh = RefreshToken.for_user(user)
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class Provisioner:
+    """
+    Validate, deduplicate and create users from dicts with ``email``,
+    ``full_name`` and optional ``password`` and ``display_name``. Existing
+    emails and invalid rows are skipped and reported, not raised.
+    """
+
+    def __init__(self, batch_size=1000, processes=None, with_tokens=False):
+        self.batch_size = batch_size
+        self.processes = processes
+        self.with_tokens = with_tokens
+
+    def validate(self, records):
+        valid, skipped, seen = [], [], set()
+        for index, record in enumerate(records):
+            email = User.objects.normalize_email((record.get('email') or '').strip())
+            full_name = (record.get('full_name') or '').strip()
+            try:
+                validate_email(email)
+            except ValidationError:
+                skipped.append({'row': index, 'email': email, 'reason': 'invalid email'})
+                continue
+            if not full_name or len(full_name) > User._meta.get_field('full_name').max_length:
+                skipped.append({'row': index, 'email': email, 'reason': 'invalid full_name'})
+                continue
+            if email.lower() in seen:
+                skipped.append({'row': index, 'email': email, 'reason': 'duplicate in input'})
+                continue
+            seen.add(email.lower())
+            valid.append({
+                'email': email,
+                'full_name': full_name,
+                'password': record.get('password') or None,
+                'display_name': (record.get('display_name') or '')[:150],
+            })
+
+        # Emails are unique case-sensitively in the database; compare
+        # lowercased so A@x.com doesn't get a second account next to a@x.com.
+        existing = set()
+        emails = [record['email'].lower() for record in valid]
+        for i in range(0, len(emails), self.batch_size):
+            existing.update(
+                User.objects.annotate(email_lower=Lower('email'))
+                .filter(email_lower__in=emails[i:i + self.batch_size])
+                .values_list('email_lower', flat=True)
+            )
+        fresh = []
+        for record in valid:
+            if record['email'].lower() in existing:
+                skipped.append({'row': None, 'email': record['email'], 'reason': 'already exists'})
+            else:
+                fresh.append(record)
+        return fresh, skipped
+
+    def insert(self, rows):
+        """Create users and profiles for [(record, password hash)] in one transaction."""
+        users = [
+            User(email=record['email'], full_name=record['full_name'], password=hashed)
+            for record, hashed in rows
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            Profile.objects.bulk_create([
+                Profile(user=user, display_name=record['display_name'])
+                for user, (record, _) in zip(users, rows)
+            ])
+        return users
+
+    def run(self, records):
+        start = time.perf_counter()
+        records, skipped = self.validate(records)
+
+        hash_start = time.perf_counter()
+        hashes = hash_passwords([record['password'] for record in records], self.processes)
+        hash_seconds = time.perf_counter() - hash_start
+
+        created = []
+        for i in range(0, len(records), self.batch_size):
+            batch = list(zip(records[i:i + self.batch_size], hashes[i:i + self.batch_size]))
+            try:
+                created.extend(self.insert(batch))
+            except IntegrityError:
+                # An email was taken since validate() (a concurrent signup);
+                # retry the batch row by row and skip the ones that clash.
+                for row in batch:
+                    try:
+                        created.extend(self.insert([row]))
+                    except IntegrityError:
+                        skipped.append({'row': None, 'email': row[0]['email'], 'reason': 'already exists'})
+
+        results = []
+        for user in created:
+            result = {'id': user.id, 'email': user.email, 'full_name': user.full_name}
+            if self.with_tokens:
+                result['tokens'] = issue_tokens(user)
+            results.append(result)
+
+        elapsed = time.perf_counter() - start
+        return {
+            'created': results,
+            'skipped': skipped,
+            'stats': {
+                'created': len(results),
+                'skipped': len(skipped),
+                'seconds': round(elapsed, 3),
+                'hash_seconds': round(hash_seconds, 3),
+                'users_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+            },
+        }
@@ -0,0 +1,223 @@
+import datetime
+import heapq
+import math
+import re
+import threading
+import zlib
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .exports import chunked
+from .models import Post, RelatedPost
+
+
+# -------------------------------
+# Related posts
+# -------------------------------
+#
+# Posts are compared as TF-IDF vectors over hashed words of the title
+# (counted twice) and description, by cosine similarity. The vectors live
+# in an inverted index in the job worker; the result, the TOP_K neighbours
+# of every post, is stored in RelatedPost so the API reads it with one
+# index range scan. Creating or editing a post recomputes its own list,
+# slots it into the lists of the posts it is now among the closest to and
+# refills the lists it dropped out of.
+
+TOP_K = 10
+HASH_BUCKETS = 1 << 20
+# Terms in more than this share of posts carry little signal and have long
+# posting lists; they are skipped when scoring.
+MAX_DF = 0.2
+MIN_MAX_DF = 50
+# Posts whose lists a new or edited post may enter.
+REVERSE_CANDIDATES = 100
+
+WORD_RE = re.compile(r"\w+")
+STOP_WORDS = frozenset("""
+    a an and are as at be but by can do does for from has have how i if in is it its
+    me my no not of on or so than that the then there this to was we what when where
+    which who why will with you your
+""".split())
+
+
+def term_counts(title, description):
+    counts = Counter()
+    for word in WORD_RE.findall(f"{title} {title} {description}".lower()):
+        if len(word) > 1 and word not in STOP_WORDS:
+            counts[zlib.crc32(word.encode()) % HASH_BUCKETS] += 1
+    return counts
+
+
+class RelatedIndex:
+    """
+    Inverted index of term counts per post. Document norms are computed
+    with the IDF at the time a post is added, so they drift slightly until
+    the next full load. Syncs incrementally from Post.changed_at like
+    TagIndex; deleted posts are dropped when they come up as candidates.
+    """
+    sync_overlap = 30.0
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}                       # post_id -> {term: count}
+        self.norms = {}                      # post_id -> vector norm
+        self.postings = defaultdict(dict)    # term -> {post_id: count}
+        self.synced_at = None
+
+    def idf(self, term):
+        return math.log((1 + len(self.docs)) / (1 + len(self.postings.get(term, ())))) + 1
+
+    def weight(self, term, count):
+        return (1 + math.log(count)) * self.idf(term)
+
+    def norm(self, counts):
+        return math.sqrt(sum(self.weight(term, count) ** 2 for term, count in counts.items())) or 1.0
+
+    def add(self, post_id, title, description):
+        with self.lock:
+            self.remove(post_id)
+            counts = term_counts(title, description)
+            self.docs[post_id] = counts
+            for term, count in counts.items():
+                self.postings[term][post_id] = count
+            self.norms[post_id] = self.norm(counts)
+
+    def remove(self, post_id):
+        with self.lock:
+            self.norms.pop(post_id, None)
+            for term in self.docs.pop(post_id, ()):
+                posting = self.postings[term]
+                posting.pop(post_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def load(self):
+        with self.lock:
+            self.docs, self.norms, self.postings = {}, {}, defaultdict(dict)
+            self.synced_at = timezone.now()
+            rows = Post.objects.values_list('id', 'title', 'description').iterator(chunk_size=2000)
+            for post_id, title, description in rows:
+                self.add(post_id, title, description)
+            # Recompute norms with the final IDF.
+            for post_id, counts in self.docs.items():
+                self.norms[post_id] = self.norm(counts)
+
+    def sync(self):
+        with self.lock:
+            if self.synced_at is None:
+                self.load()
+                return
+            since = self.synced_at - datetime.timedelta(seconds=self.sync_overlap)
+            self.synced_at = timezone.now()
+            for post_id, title, description in Post.objects.filter(changed_at__gte=since).values_list('id', 'title', 'description'):
+                self.add(post_id, title, description)
+
+    def similar(self, post_id, limit):
+        """[(score, other_id)], best first."""
+        with self.lock:
+            counts = self.docs.get(post_id)
+            if not counts:
+                return []
+            max_df = max(MAX_DF * len(self.docs), MIN_MAX_DF)
+            scores = defaultdict(float)
+            for term, count in counts.items():
+                posting = self.postings[term]
+                if len(posting) > max_df:
+                    continue
+                weight = self.weight(term, count)
+                idf = self.idf(term)
+                for other, other_count in posting.items():
+                    scores[other] += weight * (1 + math.log(other_count)) * idf
+            scores.pop(post_id, None)
+            norm = self.norms[post_id]
+            return heapq.nlargest(limit, ((score / (norm * self.norms[other]), other) for other, score in scores.items()))
+
+
+related_index = RelatedIndex()
+
+
+def trim(post_ids):
+    """Drop all but the best TOP_K neighbours of each post."""
+    if not post_ids:
+        return
+    ranked = RelatedPost.objects.filter(post_id__in=post_ids).annotate(
+        position=Window(RowNumber(), partition_by=F('post_id'), order_by=[F('score').desc(), F('id').desc()]),
+    )
+    stale = list(ranked.filter(position__gt=TOP_K).values_list('id', flat=True))
+    if stale:
+        RelatedPost.objects.filter(id__in=stale).delete()
+
+
+def live_similar(post_id, limit):
+    # related_index.similar() minus posts deleted since the last sync.
+    candidates = related_index.similar(post_id, limit)
+    live = set(Post.objects.filter(pk__in=[other for _, other in candidates]).values_list('id', flat=True))
+    for _, other in candidates:
+        if other not in live:
+            related_index.remove(other)
+    return [(score, other) for score, other in candidates if other in live and score > 0]
+
+
+def refresh_post(post_id):
+    """Recompute ``post_id``'s neighbours after it was created or edited."""
+    related_index.sync()
+    row = Post.objects.filter(pk=post_id).values_list('title', 'description').first()
+    if row is None:
+        related_index.remove(post_id)
+        return 0
+    related_index.add(post_id, *row)
+
+    candidates = live_similar(post_id, max(TOP_K, REVERSE_CANDIDATES))
+
+    with transaction.atomic():
+        # Scores against the old text are gone, in both directions.
+        listed_in = set(RelatedPost.objects.filter(related_id=post_id).values_list('post_id', flat=True))
+        RelatedPost.objects.filter(post_id=post_id).delete()
+        RelatedPost.objects.filter(related_id=post_id).delete()
+        RelatedPost.objects.bulk_create(
+            [RelatedPost(post_id=post_id, related_id=other, score=score) for score, other in candidates[:TOP_K]],
+            ignore_conflicts=True,
+        )
+
+        # Similarity is symmetric: enter the lists where this post now ranks.
+        weakest = {
+            row['post_id']: row
+            for row in RelatedPost.objects.filter(post_id__in=[other for _, other in candidates])
+            .values('post_id').annotate(n=Count('id'), low=Min('score'))
+        }
+        entering = [
+            RelatedPost(post_id=other, related_id=post_id, score=score)
+            for score, other in candidates
+            if other not in weakest or weakest[other]['n'] < TOP_K or score > weakest[other]['low']
+        ]
+        RelatedPost.objects.bulk_create(entering, ignore_conflicts=True)
+        trim([row.post_id for row in entering])
+
+        # Lists the post dropped out of are one short; recompute them.
+        for other in listed_in - {row.post_id for row in entering}:
+            RelatedPost.objects.filter(post_id=other).delete()
+            RelatedPost.objects.bulk_create(
+                [RelatedPost(post_id=other, related_id=related, score=score) for score, related in live_similar(other, TOP_K)],
+                ignore_conflicts=True,
+            )
+    return len(candidates[:TOP_K])
+
+
+def rebuild(batch_size=1000):
+    """Recompute every post's neighbours from scratch."""
+    related_index.load()
+    RelatedPost.objects.all().delete()
+    written = 0
+    for chunk in chunked(list(related_index.docs), batch_size):
+        rows = [
+            RelatedPost(post_id=post_id, related_id=other, score=score)
+            for post_id in chunk
+            for score, other in related_index.similar(post_id, TOP_K) if score > 0
+        ]
+        RelatedPost.objects.bulk_create(rows)
+        written += len(rows)
+    return written
@@ -0,0 +1,87 @@
+import datetime
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import (
+    TemporaryUser, Post, Reply, Reaction, ReplyReaction,
+    DiscussionRoom, DiscussionMessage, ArchivedDiscussionMessage,
+)
+from .likes import members_with_likes
+
+
+# -------------------------------
+# Retention jobs
+# -------------------------------
+#
+# Both jobs walk their table in small keyset-ordered batches, commit each
+# batch on its own and can sleep between batches, so no statement holds
+# locks for long or produces a large burst of WAL.
+
+
+def stale_temporary_users(cutoff):
+    # Temp users older than the cutoff that never left any content behind.
+    # Story likes live in encoded liker sets, not rows; purge_temporary_users
+    # checks those separately.
+    return TemporaryUser.objects.filter(created_at__lt=cutoff).exclude(
+        Exists(Post.objects.filter(temp_author=OuterRef('pk')))
+    ).exclude(
+        Exists(Reply.objects.filter(temp_author=OuterRef('pk')))
+    ).exclude(
+        Exists(Reaction.objects.filter(temp_user=OuterRef('pk')))
+    ).exclude(
+        Exists(ReplyReaction.objects.filter(temp_user=OuterRef('pk')))
+    )
+
+
+def purge_temporary_users(older_than_days=30, batch_size=500, sleep=0.1):
+    """Delete stale temp users; yields the number deleted per batch."""
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    last_id = 0
+    while True:
+        ids = list(
+            stale_temporary_users(cutoff).filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        liked = members_with_likes('temp', ids)
+        ids = [temp_user_id for temp_user_id in ids if temp_user_id not in liked]
+        if not ids:
+            continue
+        # Re-check the conditions at delete time in case one started posting.
+        deleted, _ = stale_temporary_users(cutoff).filter(id__in=ids).delete()
+        yield deleted
+        if sleep:
+            time.sleep(sleep)
+
+
+def archive_room_messages(ended_days=90, batch_size=500, sleep=0.1):
+    """
+    Move messages of rooms ended more than ``ended_days`` ago into
+    ArchivedDiscussionMessage; yields the number moved per batch. Newest
+    messages go first so reply_to links are copied before the message
+    they point at is deleted (and its referrers' reply_to nulled).
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=ended_days)
+    rooms = DiscussionRoom.objects.filter(status='ended', ended_at__lt=cutoff).order_by('id').values_list('id', flat=True)
+    for room_id in rooms.iterator():
+        last_id = None
+        while True:
+            messages = DiscussionMessage.objects.filter(room_id=room_id).order_by('-id')
+            if last_id is not None:
+                messages = messages.filter(id__lt=last_id)
+            rows = list(messages.values('id', 'room_id', 'sender_id', 'message', 'reply_to_id', 'timestamp', 'seq')[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            with transaction.atomic():
+                ArchivedDiscussionMessage.objects.bulk_create(
+                    [ArchivedDiscussionMessage(**row) for row in rows], ignore_conflicts=True,
+                )
+                DiscussionMessage.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            yield len(rows)
+            if sleep:
+                time.sleep(sleep)
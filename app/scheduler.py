@@ -0,0 +1,133 @@
+import datetime
+import heapq
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DiscussionRoom
+from .chat import room_group
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Room lifecycle scheduler
+# -------------------------------
+#
+# `manage.py run_room_scheduler` (its own container, see Jenkinsfile)
+# activates scheduled rooms when their start_datetime passes. Only rooms
+# starting within ``horizon`` are held in memory, in a min-heap; the
+# window is extended and changes (new, rescheduled or started rooms) are
+# picked up with index range scans on (status, start_datetime) and
+# changed_at, never a full scan. Deleted rooms leave no changed_at; their
+# heap entry is dropped when it comes due and matches nothing.
+# Activation is a guarded UPDATE, so running two schedulers, or a creator
+# starting the room by hand, is harmless.
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def publish_status(room_id, status):
+    """
+    Send a room_status event to the room's group and to everyone who asked
+    to be notified. The status change is already committed, so failures
+    (channel layer down) are logged rather than raised.
+    """
+    try:
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        event = {"type": "room_status", "room_id": room_id, "status": status}
+        send = async_to_sync(layer.group_send)
+        send(room_group(room_id), event)
+        subscribers = DiscussionRoom.notify_users.through.objects.filter(discussionroom_id=room_id).values_list('user_id', flat=True)
+        for user_id in subscribers.iterator():
+            send(user_group(user_id), event)
+    except Exception:
+        logger.exception("Could not publish status %r of room %s", status, room_id)
+
+
+class RoomScheduler:
+    # Transactions commit a little after they stamp changed_at, so each
+    # change scan overlaps the previous one by this much.
+    commit_lag = datetime.timedelta(seconds=30)
+    max_sleep = 1.0
+
+    def __init__(self, horizon=3600, refresh_interval=30):
+        self.horizon = datetime.timedelta(seconds=horizon)
+        self.refresh_interval = refresh_interval
+        self.heap = []   # (start_datetime, room_id)
+        self.due = {}    # room_id -> start_datetime of its live heap entry
+        self.loaded_until = None
+        self.changes_since = None
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def schedule(self, room_id, start):
+        if self.due.get(room_id) != start:
+            # An earlier entry for the room is skipped when popped.
+            self.due[room_id] = start
+            heapq.heappush(self.heap, (start, room_id))
+
+    def refresh(self, now):
+        until = now + self.horizon
+        upcoming = DiscussionRoom.objects.filter(status='scheduled', start_datetime__lte=until)
+        if self.loaded_until is not None:
+            upcoming = upcoming.filter(start_datetime__gt=self.loaded_until)
+        for room_id, start in upcoming.order_by('start_datetime').values_list('id', 'start_datetime').iterator():
+            self.schedule(room_id, start)
+        self.loaded_until = until
+
+        if self.changes_since is not None:
+            changed = DiscussionRoom.objects.filter(changed_at__gte=self.changes_since - self.commit_lag)
+            for room_id, status, start in changed.values_list('id', 'status', 'start_datetime').iterator():
+                if status == 'scheduled' and start <= until:
+                    self.schedule(room_id, start)
+                else:
+                    self.due.pop(room_id, None)
+        self.changes_since = now
+
+    def activate_due(self, now):
+        activated = []
+        while self.heap and self.heap[0][0] <= now:
+            start, room_id = heapq.heappop(self.heap)
+            if self.due.get(room_id) != start:
+                continue
+            del self.due[room_id]
+            # Rescheduled rooms the last refresh hasn't seen don't match.
+            updated = DiscussionRoom.objects.filter(
+                pk=room_id, status='scheduled', start_datetime__lte=now,
+            ).update(status='active', changed_at=now)
+            if updated:
+                publish_status(room_id, 'active')
+                activated.append(room_id)
+        return activated
+
+    def run(self, once=False, on_activate=None):
+        """Run until stop() is called; a single refresh and activation pass when ``once``."""
+        refreshed_at = None
+        while not self.stopping:
+            if refreshed_at is None or time.monotonic() - refreshed_at >= self.refresh_interval:
+                self.refresh(timezone.now())
+                refreshed_at = time.monotonic()
+
+            activated = self.activate_due(timezone.now())
+            if activated and on_activate:
+                on_activate(activated)
+            if once:
+                break
+
+            wait = self.refresh_interval - (time.monotonic() - refreshed_at)
+            if self.heap:
+                wait = min(wait, (self.heap[0][0] - timezone.now()).total_seconds())
+            time.sleep(min(max(wait, 0.01), self.max_sleep))
+        close_old_connections()
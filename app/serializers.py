@@ -1,5 +1,171 @@
+from urllib.parse import urlsplit
+
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.utils.serializer_helpers import ReturnList
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
 from .models import Profile, TemporaryUser, Tag, Post, Reply, Reaction, ReplyReaction
+from .provisioning import MAX_REQUEST_USERS
+from .batch import MAX_REQUESTS as BATCH_MAX_REQUESTS
+
+
+# -------------------------------
+# Sparse fieldsets (?fields= / ?expand=)
+# -------------------------------
+
+def requested_fieldset(request):
+    """
+    Parse ``?fields=a,b`` and ``?expand=c`` from a read request into
+    ``(fields, expand)``. ``fields`` is None when not restricted; ``id`` is
+    always kept so clients can address what they got back.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+
+    def split(value):
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    fields = split(fields) | {'id'} if fields else None
+    return fields, split(expand) if expand else set()
+
+
+class DynamicFieldsMixin:
+    """
+    ModelSerializer mixin honouring ``?fields=`` and ``?expand=`` on the
+    top-level serializer. ``prune_queryset`` applies the same selection to
+    the view's queryset: unrequested columns are deferred and unrequested
+    relations are not prefetched.
+    """
+    # name -> (serializer class name, serializer kwargs, prefetch lookups)
+    expandable_fields = {}
+    # name -> model fields read by a field that has no model source
+    field_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = requested_fieldset(self._context.get('request'))
+        expand &= set(self.expandable_fields)
+        for name in expand:
+            serializer_class, serializer_kwargs, _ = self.expandable_fields[name]
+            self.fields[name] = globals()[serializer_class](**serializer_kwargs)
+        if fields is not None:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+
+    @classmethod
+    def prune_queryset(cls, queryset, request):
+        fields, expand = requested_fieldset(request)
+        expand &= set(cls.expandable_fields)
+        prefetches = [lookup for name in expand for lookup in cls.expandable_fields[name][2]]
+        if fields is None:
+            return queryset.prefetch_related(*prefetches) if prefetches else queryset
+
+        model = cls.Meta.model
+        declared = cls().fields
+        sources = []
+        for name in fields & set(declared):
+            if name in cls.field_columns:
+                sources.extend(cls.field_columns[name])
+            elif declared[name].source_attrs:
+                sources.append(declared[name].source_attrs[0])
+
+        columns = {model._meta.pk.name}
+        if isinstance(queryset.query.select_related, dict):
+            # select_related() relations cannot be deferred.
+            columns.update(queryset.query.select_related)
+        for source in sources:
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.many_to_many or model_field.one_to_many:
+                prefetches.append(source)
+            elif model_field.concrete:
+                columns.add(source)
+
+        return queryset.prefetch_related(None).prefetch_related(*prefetches).only(*columns)
+
+
+# -------------------------------
+# Projection serializers
+# -------------------------------
+
+class ProjectionSerializer:
+    """
+    Read-only serializer for list endpoints that works from ``.values()``
+    rows instead of model instances. Subclasses must render exactly what
+    the ModelSerializer they stand in for renders.
+    """
+    model = None
+    # Output field name -> value columns it is built from, in output order.
+    field_columns = {}
+    datetime_fields = ()
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, instance=None, many=True, context=None, **kwargs):
+        self.instance = instance
+        self.context = context or {}
+        fields, _ = requested_fieldset(self.context.get('request'))
+        self.selected = [name for name in self.field_columns if fields is None or name in fields]
+
+    def get_annotations(self):
+        return {}
+
+    def project(self, queryset):
+        columns = {'id'}
+        for name in self.selected:
+            columns.update(self.field_columns[name])
+        annotations = {alias: expr for alias, expr in self.get_annotations().items() if alias in columns}
+        return queryset.annotate(**annotations).values(*columns)
+
+    def hydrate(self, rows):
+        pass
+
+    def to_representation(self, row):
+        ret = {}
+        for name in self.selected:
+            method = getattr(self, f'represent_{name}', None)
+            value = method(row) if method else row[self.field_columns[name][0]]
+            if name in self.datetime_fields and value is not None:
+                value = self.datetime_field.to_representation(value)
+            ret[name] = value
+        return ret
+
+    def fetch(self):
+        if isinstance(self.instance, QuerySet):
+            return list(self.project(self.instance.prefetch_related(None)))
+        # A page (or any list) of model instances or pks: re-select by pk.
+        pks = [getattr(obj, 'pk', obj) for obj in self.instance]
+        rows = {row['id']: row for row in self.project(self.model.objects.filter(pk__in=pks).order_by())}
+        return [rows[pk] for pk in pks if pk in rows]
+
+    @property
+    def data(self):
+        rows = self.fetch()
+        self.hydrate(rows)
+        return ReturnList([self.to_representation(row) for row in rows], serializer=self)
+
+
+def author_display_from_row(row):
+    # Same rules as Post.author_display_name / Reply.author_display_name.
+    if row['hide_identity']:
+        return "Anonymous"
+    if row['author_id']:
+        return row['author__profile__display_name'] or row['author__email']
+    if row['temp_author_id']:
+        return row['temp_author__display_name'] or "Anonymous"
+    return "Anonymous"
+
+
+AUTHOR_DISPLAY_COLUMNS = (
+    'hide_identity', 'author_id', 'author__profile__display_name', 'author__email',
+    'temp_author_id', 'temp_author__display_name',
+)
+
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,41 +182,108 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ['display_name', 'avatar', 'is_anonymous_by_default']
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author_display = serializers.CharField(source='author_display_name', read_only=True)
     reaction_count = serializers.IntegerField(source='reactions.count', read_only=True)
 
+    expandable_fields = {
+        'replies': ('ReplySerializer', {'many': True, 'read_only': True}, ['replies__author__profile', 'replies__temp_author']),
+    }
+    field_columns = {
+        'author_display': ('hide_identity', 'author', 'temp_author'),
+    }
+
     class Meta:
         model = Post
         fields = ['id', 'title', 'post_type', 'author_display', 'hide_identity', 'tags', 'reaction_count', 'created_at']
 
-class PostDetailSerializer(serializers.ModelSerializer):
+class PostListProjectionSerializer(ProjectionSerializer):
+    # Stands in for PostListSerializer on read-only list paths.
+    model = Post
+    field_columns = {
+        'id': ('id',),
+        'title': ('title',),
+        'post_type': ('post_type',),
+        'author_display': AUTHOR_DISPLAY_COLUMNS,
+        'hide_identity': ('hide_identity',),
+        'tags': (),
+        'reaction_count': ('reaction_count',),
+        'created_at': ('created_at',),
+    }
+    datetime_fields = ('created_at',)
+
+    def get_annotations(self):
+        reaction_count = Reaction.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(c=Count('pk')).values('c')
+        return {'reaction_count': Coalesce(Subquery(reaction_count), 0)}
+
+    def hydrate(self, rows):
+        if 'tags' not in self.selected:
+            return
+        tags = {row['id']: [] for row in rows}
+        links = Post.tags.through.objects.filter(post_id__in=tags).order_by('id').values_list('post_id', 'tag_id', 'tag__name')
+        for post_id, tag_id, name in links:
+            tags[post_id].append({'id': tag_id, 'name': name})
+        for row in rows:
+            row['tags'] = tags[row['id']]
+
+    def represent_author_display(self, row):
+        return author_display_from_row(row)
+
+    def represent_tags(self, row):
+        return row['tags']
+
+class PostDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author_display = serializers.CharField(source='author_display_name', read_only=True)
 
+    expandable_fields = PostListSerializer.expandable_fields
+    field_columns = PostListSerializer.field_columns
+
     class Meta:
         model = Post
         fields = ['id', 'title', 'description', 'post_type', 'author_display', 'hide_identity', 'tags', 'created_at', 'updated_at']
 
-class ReplySerializer(serializers.ModelSerializer):
+class ReplySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_display = serializers.CharField(source='author_display_name', read_only=True)
 
+    expandable_fields = {
+        'post': ('PostListSerializer', {'read_only': True}, ['post__tags', 'post__reactions', 'post__author__profile', 'post__temp_author']),
+    }
+    field_columns = {
+        'author_display': ('hide_identity', 'author', 'temp_author'),
+    }
+
     class Meta:
         model = Reply
         fields = ['id', 'post', 'content', 'author_display', 'hide_identity', 'created_at']
 
+class PostReplySerializer(ReplySerializer):
+    # Replies of one post, annotated by PostViewSet.replies.
+    my_reaction = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta(ReplySerializer.Meta):
+        fields = ReplySerializer.Meta.fields + ['helpful_count', 'not_satisfied_count', 'score', 'my_reaction']
+
 from rest_framework import serializers
 from .models import DiscussionRoom, DiscussionMessage
 
-class DiscussionRoomSerializer(serializers.ModelSerializer):
+class DiscussionRoomSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)
     likes_count = serializers.SerializerMethodField()
     notify_count = serializers.SerializerMethodField()
 
+    expandable_fields = {
+        'messages': ('DiscussionMessageSerializer', {'many': True, 'read_only': True}, ['messages__sender']),
+    }
+    field_columns = {
+        'likes_count': ('likes',),
+        'notify_count': ('notify_users',),
+    }
+
     class Meta:
         model = DiscussionRoom
-        fields = "__all__"
+        exclude = ["changed_at", "ended_at", "last_seq"]
 
     def get_likes_count(self, obj):
         return obj.likes.count()
@@ -59,12 +292,56 @@ class DiscussionRoomSerializer(serializers.ModelSerializer):
         return obj.notify_users.count()
 
 
+class DiscussionRoomProjectionSerializer(ProjectionSerializer):
+    # Stands in for DiscussionRoomSerializer on read-only list paths.
+    model = DiscussionRoom
+    field_columns = {
+        'id': ('id',),
+        'created_by': ('created_by__email',),
+        'likes_count': (),
+        'notify_count': (),
+        'topic': ('topic',),
+        'description': ('description',),
+        'start_datetime': ('start_datetime',),
+        'status': ('status',),
+        'created_at': ('created_at',),
+        'likes': (),
+        'notify_users': (),
+    }
+    datetime_fields = ('start_datetime', 'created_at')
+
+    def hydrate(self, rows):
+        ids = [row['id'] for row in rows]
+        for attr, count in (('likes', 'likes_count'), ('notify_users', 'notify_count')):
+            if attr not in self.selected and count not in self.selected:
+                continue
+            members = {room_id: [] for room_id in ids}
+            through = getattr(DiscussionRoom, attr).through
+            for room_id, user_id in through.objects.filter(discussionroom_id__in=ids).order_by('id').values_list('discussionroom_id', 'user_id'):
+                members[room_id].append(user_id)
+            for row in rows:
+                row[attr] = members[row['id']]
+
+    def represent_likes_count(self, row):
+        return len(row['likes'])
+
+    def represent_notify_count(self, row):
+        return len(row['notify_users'])
+
+    def represent_likes(self, row):
+        return row['likes']
+
+    def represent_notify_users(self, row):
+        return row['notify_users']
+
+
 class DiscussionMessageSerializer(serializers.ModelSerializer):
     sender = serializers.StringRelatedField()
 
     class Meta:
         model = DiscussionMessage
         fields = "__all__"
+        read_only_fields = ("seq",)
 
 
 from rest_framework import serializers
@@ -118,14 +395,44 @@ class AnonymousLoginSerializer(serializers.Serializer):
         return temp_user
 
 
+class BulkProvisionSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=MAX_REQUEST_USERS)
+    issue_tokens = serializers.BooleanField(default=False)
+
+
+class BatchItemSerializer(serializers.Serializer):
+    id = serializers.CharField(required=False, max_length=100)
+    # Only reads can be batched; an explicit other method is an error
+    # rather than silently run as a GET.
+    method = serializers.ChoiceField(choices=['GET'], required=False)
+    path = serializers.CharField(max_length=2000)
+
+    def validate_path(self, value):
+        path = urlsplit(value).path
+        if not path.startswith('/api/') or path.rstrip('/') == '/api/batch':
+            raise serializers.ValidationError("Only /api/ paths other than /api/batch/ can be batched.")
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_REQUESTS)
+    temp_token = serializers.UUIDField(required=False)
+
+
 
 from rest_framework import serializers
+from django.utils.text import Truncator
 from .models import Story
 
-class StorySerializer(serializers.ModelSerializer):
+class StorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     snippet = serializers.SerializerMethodField()
     author = serializers.SerializerMethodField()
 
+    field_columns = {
+        'snippet': ('description',),
+        'author': ('anonymous', 'user'),
+    }
+
     class Meta:
         model = Story
         fields = [
@@ -146,3 +453,31 @@ class StorySerializer(serializers.ModelSerializer):
         if request and request.user.is_authenticated:
             validated_data["user"] = request.user
         return super().create(validated_data)
+
+
+class StoryProjectionSerializer(ProjectionSerializer):
+    # Stands in for StorySerializer on read-only list paths. The snippet is
+    # cut from the description with Truncator, like Story.snippet(); a
+    # substring in SQL would count combining marks that Truncator skips.
+    model = Story
+    field_columns = {
+        'id': ('id',),
+        'title': ('title',),
+        'description': ('description',),
+        'snippet': ('description',),
+        'category': ('category',),
+        'anonymous': ('anonymous',),
+        'author': ('anonymous', 'user_id', 'user__email'),
+        'likes_count': ('likes_count',),
+        'reads_count': ('reads_count',),
+        'created_at': ('created_at',),
+    }
+    datetime_fields = ('created_at',)
+
+    def represent_snippet(self, row):
+        return Truncator(row['description']).chars(Story.SNIPPET_LENGTH)
+
+    def represent_author(self, row):
+        if row['anonymous'] or not row['user_id']:
+            return "Anonymous"
+        return row['user__email']
@@ -0,0 +1,118 @@
+import logging
+import pkgutil
+import time
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.urls import URLPattern, URLResolver, get_resolver
+
+import app
+from .counters import counters
+from .tag_index import tag_index
+from .duplicates import duplicate_index
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# ASGI serving: warmup and shutdown
+# -------------------------------
+#
+# QApp/asgi.py routes the ASGI "lifespan" protocol here. The server runs
+# startup before it accepts connections, so the first requests don't pay
+# for imports, URL resolver population, serializer field construction,
+# the first database connection or loading the in-memory indexes.
+# Draining is the server's job: on SIGTERM uvicorn stops accepting,
+# closes WebSockets with code 1012 (clients reconnect elsewhere with
+# ?since=) and waits up to gunicorn's --graceful-timeout for requests in
+# flight; only then does lifespan shutdown run, writing buffered counter
+# deltas.
+
+SKIP_MODULES = ('management', 'migrations', 'tests')
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def serializer_classes(patterns):
+    seen = set()
+    for pattern in iter_patterns(patterns):
+        view = getattr(pattern.callback, 'cls', None) or getattr(pattern.callback, 'view_class', None)
+        serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is not None and serializer_class not in seen:
+            seen.add(serializer_class)
+            yield serializer_class
+
+
+def warm_up():
+    """Run the one-time work of the first requests; returns {phase: seconds}."""
+    timings = {}
+
+    def phase(name, func):
+        start = time.perf_counter()
+        func()
+        timings[name] = time.perf_counter() - start
+
+    def import_modules():
+        for module in pkgutil.iter_modules(app.__path__):
+            if module.name not in SKIP_MODULES:
+                import_module(f'app.{module.name}')
+
+    def resolve_urls():
+        resolver = get_resolver()
+        resolver.reverse_dict
+        for pattern in iter_patterns(resolver.url_patterns):
+            pattern.pattern.regex
+
+    def build_serializers():
+        for serializer_class in serializer_classes(get_resolver().url_patterns):
+            try:
+                serializer_class().fields
+            except Exception:
+                # Serializers needing context or arguments warm up on first use.
+                logger.debug("Skipped %s during warmup", serializer_class.__name__, exc_info=True)
+
+    def open_databases():
+        for alias in connections:
+            connections[alias].ensure_connection()
+
+    phase('imports', import_modules)
+    phase('urls', resolve_urls)
+    phase('serializers', build_serializers)
+    phase('database', open_databases)
+    phase('tag_index', tag_index.start)
+    phase('duplicates', duplicate_index.load)
+    return timings
+
+
+def flush_writes():
+    counters.flush()
+    close_old_connections()
+    connections.close_all()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan protocol handler (the "lifespan" entry of the ProtocolTypeRouter)."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if getattr(settings, 'ASGI_WARMUP', True):
+                try:
+                    timings = await sync_to_async(warm_up)()
+                except Exception as exc:
+                    await send({'type': 'lifespan.startup.failed', 'message': repr(exc)})
+                    return
+                logger.info("Warmup done: %s", ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await sync_to_async(flush_writes)()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
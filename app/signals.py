@@ -1,11 +1,161 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
+from django.utils import timezone
 
-from .models import User, Profile
+from .models import User, Profile, Post, Tag, Reaction, DiscussionRoom, Story
+from .tag_index import add_post_links, tag_index
+from .jobs import enqueue
+from .objectcache import post_cache, story_cache
+from .conditional import mark_deleted
 
 #User = get_user_model()
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+
+# -------------------------------
+# changed_at bumps for conditional GET validators
+# -------------------------------
+
+@receiver(post_save, sender=Reaction)
+@receiver(post_delete, sender=Reaction)
+def touch_reacted_post(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(changed_at=timezone.now())
+    post_cache.invalidate(instance.post_id)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def touch_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a Tag; pk_set holds posts (None on clear).
+        post_ids = list(pk_set) if pk_set else list(Post.objects.filter(tags=instance).values_list('pk', flat=True))
+        Post.objects.filter(pk__in=post_ids).update(changed_at=timezone.now())
+        post_cache.invalidate(*post_ids)
+    else:
+        Post.objects.filter(pk=instance.pk).update(changed_at=timezone.now())
+        post_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_posts_of_tag(sender, instance, created=False, **kwargs):
+    if not created:
+        post_ids = list(Post.objects.filter(tags=instance).values_list('pk', flat=True))
+        Post.objects.filter(pk__in=post_ids).update(changed_at=timezone.now())
+        post_cache.invalidate(*post_ids)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Story)
+@receiver(post_delete, sender=DiscussionRoom)
+def note_list_deletion(sender, instance, **kwargs):
+    mark_deleted(sender)
+
+
+# -------------------------------
+# Object cache invalidation
+# -------------------------------
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def drop_cached_post(sender, instance, **kwargs):
+    post_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def refresh_related_posts(sender, instance, created, update_fields=None, **kwargs):
+    # Neighbours depend on the text only (see related.py).
+    if created or update_fields is None or {'title', 'description'} & set(update_fields):
+        enqueue('refresh_related_posts', post_id=instance.pk)
+
+
+@receiver(post_save, sender=Story)
+@receiver(post_delete, sender=Story)
+def drop_cached_story(sender, instance, **kwargs):
+    story_cache.invalidate(instance.pk)
+
+
+# -------------------------------
+# Tag.post_count maintenance
+# -------------------------------
+
+def recount_later(tag_ids):
+    # Unlinks need a full recount; that runs in the job worker.
+    if tag_ids:
+        enqueue('recount_tag_posts', tag_ids=sorted(tag_ids))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_tag_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Remember what is about to be unlinked; post_clear has no pk_set.
+        if reverse:
+            instance._cleared_tag_ids = [instance.pk]
+        else:
+            instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        recount_later(getattr(instance, '_cleared_tag_ids', []))
+    elif action == 'post_add' and pk_set:
+        # pk_set only holds links that were actually created.
+        if reverse:
+            add_post_links([instance.pk], len(pk_set))
+        else:
+            add_post_links(pk_set)
+    elif action == 'post_remove' and pk_set:
+        recount_later([instance.pk] if reverse else pk_set)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post_tags(sender, instance, **kwargs):
+    recount_later(getattr(instance, '_cleared_tag_ids', []))
+
+
+@receiver(post_save, sender=Tag)
+def refresh_tag_index(sender, instance, **kwargs):
+    tag_index.mark_stale()
+
+
+@receiver(post_delete, sender=Tag)
+def drop_from_tag_index(sender, instance, **kwargs):
+    tag_index.discard(instance.pk)
+
+
+@receiver(m2m_changed, sender=DiscussionRoom.likes.through)
+@receiver(m2m_changed, sender=DiscussionRoom.notify_users.through)
+def touch_room(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        rooms = DiscussionRoom.objects.filter(pk__in=pk_set) if pk_set else DiscussionRoom.objects.none()
+        rooms.update(changed_at=timezone.now())
+    else:
+        DiscussionRoom.objects.filter(pk=instance.pk).update(changed_at=timezone.now())
+
+
+# -------------------------------
+# Home feed (see feeds.py)
+# -------------------------------
+
+@receiver(post_save, sender=Reaction)
+def learn_tag_affinity(sender, instance, created, **kwargs):
+    if created:
+        enqueue('record_affinity', post_id=instance.post_id, user_id=instance.user_id, temp_user_id=instance.temp_user_id)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def fan_out_tagged_post(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    for post_id in (pk_set if reverse else [instance.pk]):
+        enqueue('fan_out_post', post_id=post_id)
@@ -0,0 +1,196 @@
+import bisect
+import datetime
+import heapq
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Tag, Post
+
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Tag post counts
+# -------------------------------
+
+def add_post_links(tag_ids, delta=1):
+    Tag.objects.filter(pk__in=tag_ids).update(post_count=F('post_count') + delta, changed_at=timezone.now())
+    tag_index.mark_stale()
+
+
+def recount_posts(tag_ids):
+    """Recompute Tag.post_count for ``tag_ids`` from the Post.tags table."""
+    counts = Post.tags.through.objects.filter(tag_id=OuterRef('pk')).order_by().values('tag_id').annotate(c=Count('pk')).values('c')
+    Tag.objects.filter(pk__in=tag_ids).update(post_count=Coalesce(Subquery(counts), 0), changed_at=timezone.now())
+    tag_index.mark_stale()
+
+
+# -------------------------------
+# In-memory prefix index
+# -------------------------------
+
+class TagIndex:
+    """
+    Case-insensitive prefix index over Tag names, ranked by post_count.
+
+    Names live in a sorted list, so a prefix is a bisect range. Small
+    ranges are ranked on the fly. Top results for broad prefixes are
+    memoized, and a change only drops the memo entries for prefixes of the
+    changed name. Once loaded, a background thread keeps the index in sync
+    from Tag.changed_at every ``refresh_interval`` seconds (sooner after a
+    local change), so searches never wait on the database. Deleted tags
+    leave no changed_at behind: the deleting process drops them right away
+    and the others on the full reload every ``reload_interval`` seconds.
+    """
+    max_limit = 25
+    scan_limit = 256
+    refresh_interval = 2.0
+    reload_interval = 600.0
+    sync_overlap = 30.0
+
+    def __init__(self):
+        # ``lock`` guards the structures below and is only held for
+        # in-memory work; ``sync_lock`` serializes loads and syncs, which
+        # query the database without holding ``lock``.
+        self.lock = threading.RLock()
+        self.sync_lock = threading.RLock()
+        self.entries = []   # sorted (key, id)
+        self.tags = {}      # id -> (key, name, post_count)
+        self.memo = {}      # prefix -> ids, best first
+        self.discarded = None   # ids discarded while a load reads, or None
+        self.synced_at = None
+        self.loaded_at = 0.0
+        self.loaded = False
+        self.wake = threading.Event()
+        self.thread = None
+
+    # -- database sync --
+
+    def mark_stale(self):
+        self.wake.set()
+
+    def start(self):
+        with self.sync_lock:
+            if not self.loaded:
+                self.load()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.refresh_loop, name='tag-index', daemon=True)
+                self.thread.start()
+
+    def refresh_loop(self):
+        while True:
+            self.wake.wait(self.refresh_interval)
+            self.wake.clear()
+            try:
+                if time.monotonic() - self.loaded_at >= self.reload_interval:
+                    self.load()
+                else:
+                    self.sync()
+            except Exception:
+                logger.exception("Tag index refresh failed")
+            finally:
+                close_old_connections()
+
+    def load(self):
+        with self.sync_lock:
+            with self.lock:
+                self.discarded = set()
+            synced_at = timezone.now()
+            tags = {}
+            entries = []
+            rows = Tag.objects.values_list('id', 'name', 'post_count').iterator(chunk_size=5000)
+            for tag_id, name, post_count in rows:
+                key = name.casefold()
+                tags[tag_id] = (key, name, post_count)
+                entries.append((key, tag_id))
+            entries.sort()
+            with self.lock:
+                # Tags deleted while the rows were read may still be in them.
+                discarded, self.discarded = self.discarded, None
+                if discarded:
+                    entries = [entry for entry in entries if entry[1] not in discarded]
+                    for tag_id in discarded:
+                        tags.pop(tag_id, None)
+                self.entries = entries
+                self.tags = tags
+                self.memo = {}
+                self.synced_at = synced_at
+                self.loaded_at = time.monotonic()
+                self.loaded = True
+
+    def sync(self):
+        with self.sync_lock:
+            # Overlap the window so rows committed late are still seen;
+            # apply() is idempotent. The newest changed_at (an index lookup)
+            # tells whether there is anything to scan at all.
+            since = self.synced_at - datetime.timedelta(seconds=self.sync_overlap)
+            self.synced_at = timezone.now()
+            latest = Tag.objects.aggregate(latest=Max('changed_at'))['latest']
+            if latest is None or latest < since:
+                return
+            changed = list(Tag.objects.filter(changed_at__gte=since).values_list('id', 'name', 'post_count'))
+            with self.lock:
+                for tag_id, name, post_count in changed:
+                    self.apply(tag_id, name, post_count)
+
+    def discard(self, tag_id):
+        with self.lock:
+            if self.discarded is not None:
+                self.discarded.add(tag_id)
+            old = self.tags.pop(tag_id, None)
+            if old is not None:
+                self.entries.pop(bisect.bisect_left(self.entries, (old[0], tag_id)))
+                self.invalidate(old[0])
+
+    def apply(self, tag_id, name, post_count):
+        key = name.casefold()
+        old = self.tags.get(tag_id)
+        if old == (key, name, post_count):
+            return
+        if old is not None:
+            self.invalidate(old[0])
+            if old[0] != key:
+                self.entries.pop(bisect.bisect_left(self.entries, (old[0], tag_id)))
+        if old is None or old[0] != key:
+            bisect.insort(self.entries, (key, tag_id))
+        self.tags[tag_id] = (key, name, post_count)
+        self.invalidate(key)
+
+    def invalidate(self, key):
+        for end in range(len(key) + 1):
+            self.memo.pop(key[:end], None)
+
+    # -- queries --
+
+    def rank(self, ids, limit):
+        tags = self.tags
+        return heapq.nsmallest(limit, ids, key=lambda tag_id: (-tags[tag_id][2], tags[tag_id][0]))
+
+    def search(self, prefix, limit=10):
+        if self.thread is None:
+            self.start()
+        limit = max(1, min(limit, self.max_limit))
+        key = prefix.casefold()
+        with self.lock:
+            ids = self.memo.get(key)
+            if ids is None:
+                lo = bisect.bisect_left(self.entries, (key,))
+                hi = bisect.bisect_left(self.entries, (key + '\U0010ffff',))
+                candidates = (tag_id for _, tag_id in self.entries[lo:hi])
+                ids = self.rank(candidates, self.max_limit)
+                if hi - lo > self.scan_limit:
+                    self.memo[key] = ids
+            return [
+                {'id': tag_id, 'name': self.tags[tag_id][1], 'post_count': self.tags[tag_id][2]}
+                for tag_id in ids[:limit]
+            ]
+
+
+tag_index = TagIndex()
@@ -1,3 +1,1310 @@
-from django.test import TestCase
+import datetime
+import decimal
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zoneinfo
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import DataError, connection
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import batch, chat
+from .admin import ImportJobAdmin, ReplyInline
+from . import fastjson, feeds
+from .duplicates import DuplicateIndex, write_snapshot
+from .imports import ImportFormatError, run_import
+from .jobs import claim, enqueue, execute, register
+from .counters import CounterBuffer
+from . import likes
+from .likes import toggle_like
+from .models import (
+    wilson_lower_bound, BackgroundJob, DiscussionRoom, FeedEntry, ImportJob, Post, Reaction, RelatedPost,
+    Reply, ReplyReaction, SavedPost, Story, StoryLikeChunk, Tag, TagAffinity, TemporaryUser, User,
+)
+from .objectcache import ObjectCache, post_cache, story_cache
+from .provisioning import Provisioner
+from . import related
+from .renderers import FastJSONRenderer
+from . import serving
+from .serializers import DiscussionRoomSerializer, PostDetailSerializer, PostListSerializer, StorySerializer
+from .retention import purge_temporary_users
+from .scheduler import RoomScheduler
+from .tag_index import TagIndex
+from .routing import websocket_urlpatterns
+from .throttling import KeyedRateThrottle
+
+
+
+def clear_caches():
+    # Rolled back tests reuse primary keys; drop entries they cached.
+    cache.clear()
+    for object_cache in (post_cache, story_cache):
+        object_cache.local.entries.clear()
+
+
+class FastJsonTests(SimpleTestCase):
+    VALUES = {
+        'utc': datetime.datetime(2024, 5, 1, 12, 30, 5, 123456, tzinfo=datetime.timezone.utc),
+        'utc_whole_seconds': datetime.datetime(2024, 5, 1, 12, 30, 5, tzinfo=datetime.timezone.utc),
+        'zero_offset_zone': datetime.datetime(2024, 1, 1, 12, tzinfo=zoneinfo.ZoneInfo("Europe/London")),
+        'offset': datetime.datetime(2024, 5, 1, 12, 30, 5, 1, tzinfo=zoneinfo.ZoneInfo("Asia/Kolkata")),
+        'naive': datetime.datetime(2024, 5, 1, 12, 30, 5, 500),
+        'date': datetime.date(2024, 5, 1),
+        'time': datetime.time(1, 2, 3, 4),
+        'uuid': uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        'lazy': gettext_lazy("Helpful"),
+        'text': "caf\u00e9 \u2028",
+        'nested': {1: ["a", None, True, 3]},
+    }
+
+    @skipUnless(fastjson.orjson, "orjson is not installed")
+    def test_backends_agree(self):
+        for name, value in {**self.VALUES, 'decimal': decimal.Decimal("1.10")}.items():
+            with self.subTest(name):
+                self.assertEqual(fastjson.OrjsonBackend().dumps(value), fastjson.StdlibBackend().dumps(value))
+
+    def test_decimals_stay_strings(self):
+        self.assertEqual(fastjson.StdlibBackend().dumps([decimal.Decimal("1E+3")]), b'["1E+3"]')
+
+    def test_renderer_matches_drf(self):
+        expected = JSONRenderer().render(self.VALUES)
+        for backend in ['stdlib', 'orjson'] if fastjson.orjson else ['stdlib']:
+            with self.subTest(backend), override_settings(FAST_JSON_BACKEND=backend):
+                self.assertEqual(fastjson.backend().name, backend)
+                self.assertEqual(FastJSONRenderer().render(self.VALUES), expected)
+
+    def test_backend_setting(self):
+        with override_settings(FAST_JSON_BACKEND='stdlib'):
+            self.assertIsInstance(fastjson.backend(), fastjson.StdlibBackend)
+        with override_settings(FAST_JSON_BACKEND=None):
+            expected = fastjson.OrjsonBackend if fastjson.orjson else fastjson.StdlibBackend
+            self.assertIsInstance(fastjson.backend(), expected)
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertIsInstance(fastjson.get_backend('orjson'), fastjson.StdlibBackend)
+
+
+class ProjectionParityTests(TestCase):
+    # List endpoints render projections; they must match the ModelSerializer.
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("author@example.com", "Author", "pass")
+        self.user.profile.display_name = "Author"
+        self.user.profile.save()
+        other = User.objects.create_user("other@example.com", "Other", "pass")
+        temp_user = TemporaryUser.objects.create(display_name="Guest")
+        tags = [Tag.objects.create(name=name) for name in ("sleep", "work")]
+
+        posts = [
+            Post.objects.create(title="Signed in", description="...", author=self.user),
+            Post.objects.create(title="Hidden", description="...", author=other, hide_identity=True),
+            Post.objects.create(title="Guest", description="...", temp_author=temp_user, post_type="advice"),
+            Post.objects.create(title="Nobody", description="..."),
+        ]
+        posts[0].tags.set(tags)
+        posts[2].tags.set(tags[1:])
+        Reaction.objects.create(post=posts[0], user=other)
+        Reaction.objects.create(post=posts[0], temp_user=temp_user)
+
+        Story.objects.create(title="Long", description="e\u0301" * 200, category="growth", user=self.user, likes_count=2)
+        Story.objects.create(title="Short", description="Short story", category="career", user=self.user, anonymous=True)
+        Story.objects.create(title="No user", description="x" * 150, category="study")
+
+        room = DiscussionRoom.objects.create(created_by=self.user, topic="Topic", description="...", start_datetime=timezone.now())
+        room.likes.set([self.user, other])
+        room.notify_users.set([other])
+        DiscussionRoom.objects.create(created_by=other, topic="Empty", description="...", start_datetime=timezone.now(), status="active")
+        chat.post_message(room.pk, self.user, "Hello")
+
+    def assert_parity(self, url, model, serializer_class):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        if isinstance(results, dict):
+            results = results['results']
+        self.assertTrue(results)
+        instances = [model.objects.get(pk=item['id']) for item in results]
+        request = Request(APIRequestFactory().get(url))
+        expected = serializer_class(instances, many=True, context={'request': request}).data
+        self.assertEqual(results, json.loads(JSONRenderer().render(expected)))
+
+    def test_posts(self):
+        self.assert_parity("/api/posts/", Post, PostListSerializer)
+        self.assert_parity("/api/posts/?fields=title,tags,author_display", Post, PostListSerializer)
+        self.assert_parity("/api/posts/?page_size=2&page=2", Post, PostListSerializer)
+
+    def test_stories(self):
+        self.assert_parity("/api/stories/", Story, StorySerializer)
+        self.assert_parity("/api/stories/?fields=snippet,author", Story, StorySerializer)
+
+    def test_rooms(self):
+        self.assert_parity("/api/rooms/", DiscussionRoom, DiscussionRoomSerializer)
+        self.assert_parity("/api/rooms/?fields=likes_count,notify_users,created_by", DiscussionRoom, DiscussionRoomSerializer)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user = User.objects.create_user("author@example.com", "Author", "pass")
+        self.post = Post.objects.create(title="Conditional", description="GET", author=self.user)
+
+    def test_unchanged_post_is_not_modified(self):
+        url = f"/api/posts/{self.post.pk}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_follows_changes_and_deletions(self):
+        other = Post.objects.create(title="Other", description="...")
+        etag = self.client.get("/api/posts/?post_type=problem")['ETag']
+        self.assertEqual(self.client.get("/api/posts/?post_type=problem", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        other.delete()
+        response = self.client.get("/api/posts/?post_type=problem", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.post.title = "Edited"
+        self.post.save()
+        self.assertEqual(self.client.get("/api/posts/?post_type=problem", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def later(self, seconds):
+        # If-Modified-Since has one-second resolution.
+        return timezone.now() + datetime.timedelta(seconds=seconds)
+
+    def test_list_last_modified_follows_changes_and_deletions(self):
+        url = "/api/posts/?post_type=problem"
+        other = Post.objects.create(title="Other", description="...")
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with mock.patch.object(time, 'time_ns', return_value=int(self.later(2).timestamp() * 10**9)):
+            other.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['title'] for post in response.json()], ["Conditional"])
+        last_modified = response['Last-Modified']
+
+        with mock.patch('django.utils.timezone.now', return_value=self.later(4)):
+            self.post.title = "Edited"
+            self.post.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['title'] for post in response.json()], ["Edited"])
+
+    def test_detail_changes_after_an_edit(self):
+        url = f"/api/posts/{self.post.pk}/"
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with mock.patch('django.utils.timezone.now', return_value=self.later(2)), self.captureOnCommitCallbacks(execute=True):
+            self.post.title = "Edited"
+            self.post.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], "Edited")
+
+    def test_fieldsets_have_their_own_etags(self):
+        for url in ("/api/posts/", f"/api/posts/{self.post.pk}/"):
+            full = self.client.get(url)['ETag']
+            sparse = self.client.get(url, {'fields': 'title'})
+            self.assertNotEqual(sparse['ETag'], full)
+            self.assertEqual(self.client.get(url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=full).status_code, 200)
+            self.assertEqual(self.client.get(url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=sparse['ETag']).status_code, 304)
+
+    def test_paginated_list_does_not_load_instances(self):
+        for i in range(3):
+            Post.objects.create(title=f"Post {i}", description="...")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/posts/?page_size=2")
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertFalse([query for query in queries if 'app_reaction' in query['sql'] and 'COUNT' not in query['sql'].upper()])
+
+    def test_expand_is_served_without_validators(self):
+        url = f"/api/posts/{self.post.pk}/?expand=replies"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+        Reply.objects.create(post=self.post, content="A new reply", author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([reply['content'] for reply in response.json()['replies']], ["A new reply"])
+
+    def test_expanded_list_is_served_without_validators(self):
+        response = self.client.get("/api/rooms/?expand=messages")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class JsonlImportTests(TestCase):
+    def run_lines(self, *records):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.write("\n".join(json.dumps(record) for record in records) + "\n")
+        return run_import(path)
+
+    def test_imports_posts_with_tags_and_replies(self):
+        Tag.objects.create(name="anxiety")
+        job, _ = self.run_lines(
+            {"type": "post", "title": "One", "tags": ["anxiety", "sleep"], "replies": [{"content": "Hi"}]},
+            {"type": "post", "title": "Two", "tags": ["sleep"]},
+        )
+        self.assertEqual((job.posts_created, job.replies_created, job.tags_created), (2, 1, 1))
+        self.assertEqual(Post.objects.get(title="Two").tags.get().name, "sleep")
+
+    @override_settings(JOBS_RUN_EAGERLY=False)
+    def test_imported_posts_queue_a_related_refresh(self):
+        self.run_lines({"type": "post", "title": "Imported"})
+        job = BackgroundJob.objects.get(name='refresh_related_batch')
+        self.assertEqual(job.payload, {'post_ids': [Post.objects.get(title="Imported").pk]})
+
+    def test_nested_reply_without_content(self):
+        with self.assertRaisesMessage(ImportFormatError, "line 1"):
+            self.run_lines({"type": "post", "title": "One", "replies": [{"author_email": "x@example.com"}]})
+
+    def test_reply_to_missing_post(self):
+        with self.assertRaisesMessage(ImportFormatError, "does not exist"):
+            self.run_lines({"type": "reply", "post": 999999, "content": "Orphan"})
+        self.assertFalse(Reply.objects.exists())
+
+    def test_invalid_records_are_reported_by_line(self):
+        cases = [
+            ({"type": "post", "title": "One", "tags": "anxiety"}, "line 2: tags must be a list"),
+            ({"type": "post", "title": "One", "tags": ["ok", 7]}, "line 2: tag name must be a string"),
+            ({"type": "post", "title": "One", "tags": ["x" * 51]}, "line 2: tag name longer than 50"),
+            ({"type": "post", "title": "x" * 256}, "line 2: title longer than 255"),
+            ({"type": "story", "title": "Story", "category": "growth" * 10}, "line 2: category longer than 30"),
+            ({"type": "tag", "name": ["anxiety"]}, "line 2: name must be a string"),
+        ]
+        for record, message in cases:
+            with self.subTest(message), self.assertRaisesMessage(ImportFormatError, message):
+                self.run_lines({"type": "tag", "name": "fine"}, record)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_database_errors_fail_the_batch_by_line(self):
+        with mock.patch.object(Post.objects, 'bulk_create', side_effect=DataError("value too long")), \
+                self.assertRaisesMessage(ImportFormatError, "lines 1-1: value too long"):
+            self.run_lines({"type": "post", "title": "One"})
+
+    def test_story_likes_are_not_imported(self):
+        self.run_lines({"type": "story", "title": "Story", "category": "growth", "likes_count": 40, "reads_count": 7})
+        story = Story.objects.get()
+        self.assertEqual((story.likes_count, story.reads_count), (0, 7))
+        self.assertEqual(toggle_like(story.pk, 'user', 1), (True, 1))
+
+    @override_settings(JOBS_RUN_EAGERLY=False)
+    def test_admin_queues_the_import(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.write(json.dumps({"type": "post", "title": "Queued"}) + "\n")
+        job = ImportJob.objects.create(source=path)
+        request = RequestFactory().post("/")
+        request.user = User.objects.create_superuser("admin@example.com", "Admin", "pass")
+        with mock.patch.object(ImportJobAdmin, 'message_user'):
+            ImportJobAdmin(ImportJob, admin.site).run_import(request, ImportJob.objects.all())
+        self.assertFalse(Post.objects.exists())
+
+        execute(claim('worker-1')[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.posts_created), ('done', 1))
+
+
+class TagIndexTests(TestCase):
+    def setUp(self):
+        self.sleep = Tag.objects.create(name="Sleep", post_count=3)
+        self.index = TagIndex()
+        self.index.load()
+
+    def names(self, prefix):
+        return [tag['name'] for tag in self.index.search(prefix)]
+
+    def test_searches_do_not_wait_for_a_reload(self):
+        reading, release = threading.Event(), threading.Event()
+        rows = [(self.sleep.pk, "Sleep", 3), (self.sleep.pk + 1, "Stress", 5), (self.sleep.pk + 2, "Shame", 1)]
+
+        def slow_rows(queryset, *args, **kwargs):
+            reading.set()
+            release.wait(5)
+            return iter(rows)
+
+        self.index.thread = threading.current_thread()  # no refresh thread
+        with mock.patch.object(QuerySet, 'iterator', slow_rows):
+            reload = threading.Thread(target=self.index.load)
+            reload.start()
+            self.assertTrue(reading.wait(5))
+            self.assertEqual(self.names("s"), ["Sleep"])
+            # Deleted while the reload reads its rows.
+            self.index.discard(self.sleep.pk + 2)
+            release.set()
+            reload.join(5)
+        self.assertEqual(self.names("s"), ["Stress", "Sleep"])
+
+    def test_sync_applies_changes(self):
+        self.index.thread = threading.current_thread()
+        Tag.objects.create(name="Sleepless", post_count=9)
+        Tag.objects.filter(pk=self.sleep.pk).update(name="Rest", changed_at=timezone.now())
+        self.index.sync()
+        self.assertEqual(self.names("sl"), ["Sleepless"])
+        self.assertEqual(self.names("re"), ["Rest"])
+
+
+class ReplyReactionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("author@example.com", "Author", "pass")
+        self.post = Post.objects.create(title="Replies", description="...", author=self.user)
+        self.reply = Reply.objects.create(post=self.post, content="Try this", author=self.user)
+        self.temp_user = TemporaryUser.objects.create()
+        # A signed-in user's reaction has no temp_user.
+        ReplyReaction.objects.create(reply=self.reply, user=self.user, reaction='helpful')
+
+    def my_reaction(self, **params):
+        response = self.client.get(f"/api/posts/{self.post.pk}/replies/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'][0]['my_reaction']
+
+    def test_anonymous_caller_has_no_reaction(self):
+        self.assertIsNone(self.my_reaction())
+
+    def test_unknown_temp_token_has_no_reaction(self):
+        self.assertIsNone(self.my_reaction(temp_token="00000000-0000-0000-0000-000000000000"))
+        self.assertIsNone(self.my_reaction(temp_token="not-a-uuid"))
+
+    def test_temp_user_sees_own_reaction(self):
+        self.assertIsNone(self.my_reaction(temp_token=str(self.temp_user.token)))
+        ReplyReaction.objects.create(reply=self.reply, temp_user=self.temp_user, reaction='not_satisfied')
+        self.assertEqual(self.my_reaction(temp_token=str(self.temp_user.token)), 'not_satisfied')
+
+    def test_user_sees_own_reaction(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.my_reaction(), 'helpful')
+
+
+class ReplyRankingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("reader@example.com", "Reader", "pass")
+        self.reply = Reply.objects.create(post=Post.objects.create(title="Ranked", description="..."), content="Try this")
+
+    def react(self, reaction, **data):
+        response = self.client.post(f"/api/replies/{self.reply.pk}/react/", {'reaction': reaction, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['status']
+
+    def assert_counts(self, helpful, not_satisfied):
+        self.reply.refresh_from_db()
+        self.assertEqual((self.reply.helpful_count, self.reply.not_satisfied_count), (helpful, not_satisfied))
+        self.assertAlmostEqual(self.reply.score, wilson_lower_bound(helpful, not_satisfied))
+        rows = ReplyReaction.objects.filter(reply=self.reply)
+        self.assertEqual(rows.filter(reaction='helpful').count(), helpful)
+        self.assertEqual(rows.filter(reaction='not_satisfied').count(), not_satisfied)
+
+    def test_switching_and_removing_a_reaction(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.react('helpful'), 'added')
+        self.assert_counts(1, 0)
+        self.assertGreater(self.reply.score, 0)
+
+        self.assertEqual(self.react('not_satisfied'), 'added')
+        self.assert_counts(0, 1)
+        self.assertEqual(self.reply.score, 0.0)
+
+        self.assertEqual(self.react('not_satisfied'), 'removed')
+        self.assert_counts(0, 0)
+
+    def test_reactions_from_several_readers(self):
+        temp_user = TemporaryUser.objects.create()
+        self.react('helpful', temp_token=str(temp_user.token))
+        self.react('not_satisfied', temp_token=str(temp_user.token))
+        self.client.force_authenticate(self.user)
+        self.react('helpful')
+        self.assert_counts(2, 1)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.react('helpful', temp_token=str(temp_user.token)), 'removed')
+        self.assert_counts(1, 1)
+
+
+class SavedPostTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("reader@example.com", "Reader", "pass")
+        self.client.force_authenticate(self.user)
+        self.posts = [Post.objects.create(title=f"Post {i}", description="...") for i in range(5)]
+        # Saved in a different order than they were created.
+        now = timezone.now()
+        for minutes, index in enumerate([3, 0, 4, 1, 2]):
+            saved = SavedPost.objects.create(post=self.posts[index], user=self.user)
+            SavedPost.objects.filter(pk=saved.pk).update(saved_at=now - datetime.timedelta(minutes=10 - minutes))
+
+    def test_pages_by_save_time(self):
+        response = self.client.get("/api/posts/saved/", {'page_size': 2})
+        titles = [post['title'] for post in response.json()['results']]
+        next_url = response.json()['next']
+        # A save between pages goes to the front and doesn't shift later pages.
+        SavedPost.objects.create(post=Post.objects.create(title="New", description="..."), user=self.user)
+        while next_url:
+            data = self.client.get(next_url).json()
+            titles += [post['title'] for post in data['results']]
+            next_url = data['next']
+        self.assertEqual(titles, ["Post 2", "Post 1", "Post 4", "Post 0", "Post 3"])
+
+    def test_items_carry_saved_at(self):
+        item = self.client.get("/api/posts/saved/").json()['results'][0]
+        saved = SavedPost.objects.get(post_id=item['id'])
+        self.assertEqual(item['saved_at'], saved.saved_at.isoformat().replace('+00:00', 'Z'))
+
+    def test_requires_a_user(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/posts/saved/").status_code, 401)
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        self.tag = Tag.objects.create(name="sleep")
+        self.author = User.objects.create_user("author@example.com", "Author")
+        self.reader = User.objects.create_user("reader@example.com", "Reader")
+        self.guest = TemporaryUser.objects.create()
+        TagAffinity.objects.create(user=self.reader, tag=self.tag, weight=1)
+        TagAffinity.objects.create(temp_user=self.guest, tag=self.tag, weight=1)
+        TagAffinity.objects.create(user=self.author, tag=self.tag, weight=1)
+
+    def tagged_post(self, title, **kwargs):
+        post = Post.objects.create(title=title, description="...", author=self.author, **kwargs)
+        post.tags.add(self.tag)
+        return post
+
+    def test_fan_out_skips_the_author_and_inactive_owners(self):
+        idle = User.objects.create_user("idle@example.com", "Idle")
+        TagAffinity.objects.create(user=idle, tag=self.tag, weight=1)
+        TagAffinity.objects.filter(user=idle).update(updated_at=timezone.now() - datetime.timedelta(days=feeds.ACTIVE_DAYS + 1))
+        post = self.tagged_post("Fresh")
+        self.assertEqual(feeds.fan_out_post(post.pk), 2)
+        self.assertEqual(feeds.read_feed('user_id', self.reader.pk), [post.pk])
+        self.assertEqual(feeds.read_feed('temp_user_id', self.guest.pk), [post.pk])
+        self.assertIsNone(feeds.read_feed('user_id', self.author.pk))
+        self.assertIsNone(feeds.read_feed('user_id', idle.pk))
+
+    def test_old_posts_are_not_fanned_out(self):
+        post = self.tagged_post("Old")
+        Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - datetime.timedelta(days=feeds.FRESH_POST_DAYS + 1))
+        self.assertEqual(feeds.fan_out_post(post.pk), 0)
+
+    def test_feeds_are_trimmed_newest_first(self):
+        posts = [self.tagged_post(f"Post {i}") for i in range(5)]
+        for i, post in enumerate(posts):
+            Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - datetime.timedelta(minutes=10 - i))
+        with mock.patch.object(feeds, 'FEED_LENGTH', 3):
+            for post in posts:
+                feeds.fan_out_post(post.pk)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(feeds.read_feed('user_id', self.reader.pk), [posts[4].pk, posts[3].pk, posts[2].pk])
+
+    def test_stale_feeds_read_as_cold(self):
+        feeds.fan_out_post(self.tagged_post("Fresh").pk)
+        FeedEntry.objects.update(created_at=timezone.now() - datetime.timedelta(days=feeds.STALE_DAYS + 1))
+        self.assertIsNone(feeds.read_feed('user_id', self.reader.pk))
+
+    def test_mixed_feed_serves_the_materialized_feed(self):
+        post = self.tagged_post("Fresh")
+        feeds.fan_out_post(post.pk)
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual([item['title'] for item in client.get("/api/posts/mixed_feed/").json()], ["Fresh"])
+
+    @override_settings(JOBS_RUN_EAGERLY=False)
+    def test_cold_feed_is_built_in_the_background(self):
+        cache.clear()
+        self.tagged_post("Fresh")
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual(client.get("/api/posts/mixed_feed/").status_code, 200)
+        client.get("/api/posts/mixed_feed/")
+        job = BackgroundJob.objects.get(name='build_feed')
+        self.assertEqual(job.payload, {'field': 'user_id', 'owner_id': self.reader.pk})
+
+        execute(claim('worker-1', ids=[job.pk])[0])
+        self.assertEqual(feeds.read_feed('user_id', self.reader.pk), [Post.objects.get(title="Fresh").pk])
+
+
+@register('test_flaky', max_attempts=2)
+def flaky(fail):
+    if fail:
+        raise RuntimeError("flaky job failed")
+
+
+@override_settings(JOBS_RUN_EAGERLY=False)
+class JobQueueTests(TestCase):
+    def test_claimed_jobs_are_not_claimed_again(self):
+        first = enqueue('test_flaky', fail=False)
+        second = enqueue('test_flaky', fail=False)
+        later = enqueue('test_flaky', delay=60, fail=False)
+
+        claimed = claim('worker-1')
+        self.assertEqual([job.pk for job in claimed], [first.pk, second.pk])
+        self.assertTrue(all(job.status == 'running' and job.locked_by == 'worker-1' for job in claimed))
+        self.assertEqual(claim('worker-2'), [])
+
+        execute(claimed[0])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts, first.locked_by), ('done', 1, ''))
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'pending')
+
+    def test_failed_job_is_retried_then_given_up(self):
+        job = enqueue('test_flaky', fail=True)
+        with self.assertLogs('app.jobs', 'WARNING'):
+            execute(claim('worker-1')[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn("flaky job failed", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(claim('worker-1'), [])
+
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('app.jobs', 'WARNING'):
+            execute(claim('worker-1')[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+
+class ProvisionerTests(TestCase):
+    def test_existing_email_in_other_case_is_skipped(self):
+        User.objects.create_user("taken@example.com", "Taken")
+        result = Provisioner(processes=1).run([
+            {'email': "TAKEN@example.com", 'full_name': "Again"},
+            {'email': "new@example.com", 'full_name': "New"},
+        ])
+        self.assertEqual([user['email'] for user in result['created']], ["new@example.com"])
+        self.assertEqual(result['skipped'][0]['reason'], 'already exists')
+
+    def test_email_taken_during_the_run_is_skipped(self):
+        provisioner = Provisioner(processes=1)
+        validate = provisioner.validate
+
+        def validate_then_signup(records):
+            fresh, skipped = validate(records)
+            User.objects.create_user("race@example.com", "Racer")
+            return fresh, skipped
+
+        provisioner.validate = validate_then_signup
+        result = provisioner.run([
+            {'email': "race@example.com", 'full_name': "Late"},
+            {'email': "other@example.com", 'full_name': "Other"},
+        ])
+        self.assertEqual([user['email'] for user in result['created']], ["other@example.com"])
+        self.assertEqual(result['skipped'], [{'row': None, 'email': "race@example.com", 'reason': 'already exists'}])
+        self.assertTrue(User.objects.get(email="other@example.com").profile)
+
+
+class ReplyInlineTests(TestCase):
+    def test_saves_the_replies_that_were_shown(self):
+        admin_user = User.objects.create_superuser("admin@example.com", "Admin", "pass")
+        post = Post.objects.create(title="Busy", description="...")
+        for i in range(3):
+            Reply.objects.create(post=post, content=f"Reply {i}")
+        request = RequestFactory().get("/")
+        request.user = admin_user
+        inline = ReplyInline(Post, admin.site)
+        inline.max_shown = 2
+        formset_class = inline.get_formset(request, post)
+
+        shown = [form.instance.pk for form in formset_class(instance=post).forms]
+        self.assertEqual(len(shown), 2)
+        # A newer reply arrives while the page is open.
+        Reply.objects.create(post=post, content="Reply 3")
+
+        prefix = formset_class.get_default_prefix()
+        data = {f'{prefix}-TOTAL_FORMS': '2', f'{prefix}-INITIAL_FORMS': '2'}
+        for i, pk in enumerate(shown):
+            data.update({f'{prefix}-{i}-id': str(pk), f'{prefix}-{i}-post': str(post.pk), f'{prefix}-{i}-hide_identity': 'on'})
+        formset = formset_class(data, instance=post)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        formset.save()
+        self.assertEqual(set(Reply.objects.filter(hide_identity=True).values_list('pk', flat=True)), set(shown))
+
+
+class ObjectCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cache = ObjectCache('test', Post, PostDetailSerializer)
+        self.version = 1
+        load = mock.patch.object(self.cache, 'load', side_effect=self.load)
+        self.load_mock = load.start()
+        self.addCleanup(load.stop)
+
+    def load(self, pk):
+        return {'pk': pk, 'version': self.version, 'data': {'id': pk}}
+
+    def invalidate(self, pk):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cache.invalidate(pk)
+
+    def test_misses_load_once(self):
+        self.assertEqual(self.cache.get(1)['version'], 1)
+        self.cache.local.delete(1)
+        self.assertEqual(self.cache.get(1)['version'], 1)
+        self.assertEqual(self.load_mock.call_count, 1)
+
+    def test_concurrent_misses_load_once(self):
+        def slow_load(pk):
+            time.sleep(0.1)
+            return self.load(pk)
+
+        self.load_mock.side_effect = slow_load
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get(1))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([entry['version'] for entry in results], [1] * 5)
+        self.assertEqual(self.load_mock.call_count, 1)
+
+    def test_invalidation_waits_for_commit(self):
+        self.cache.get(1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.cache.invalidate(1)
+        self.version = 2
+        self.assertEqual(self.cache.get(1)['version'], 1)
+        callbacks[0]()
+        self.assertEqual(self.cache.get(1)['version'], 2)
+
+    def test_fill_racing_an_invalidation_is_not_cached(self):
+        def load_then_commit(pk):
+            # The row is read, then the writer commits and invalidates.
+            entry = self.load(pk)
+            self.version = 2
+            self.invalidate(pk)
+            return entry
+
+        self.load_mock.side_effect = load_then_commit
+        self.assertEqual(self.cache.get(1)['version'], 1)
+        self.load_mock.side_effect = self.load
+        self.assertEqual(self.cache.get(1)['version'], 2)
+
+    def test_invalidation_while_storing(self):
+        self.cache.get(1)
+        self.version = 2
+        self.invalidate(1)
+        # The invalidation lands between the write and its re-check.
+        real_set = cache.set
+
+        def set_then_invalidate(*args, **kwargs):
+            real_set(*args, **kwargs)
+            self.version = 3
+            self.invalidate(1)
+
+        with mock.patch.object(cache, 'set', side_effect=set_then_invalidate):
+            self.assertEqual(self.cache.get(1)['version'], 2)
+        self.assertEqual(self.cache.get(1)['version'], 3)
+
+    def test_post_detail_after_an_edit(self):
+        post = Post.objects.create(title="Cached", description="...")
+        client = APIClient()
+        self.assertEqual(client.get(f"/api/posts/{post.pk}/").json()['title'], "Cached")
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = "Edited"
+            post.save()
+        self.assertEqual(client.get(f"/api/posts/{post.pk}/").json()['title'], "Edited")
+
+
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.counters = CounterBuffer()
+        self.story = Story.objects.create(title="Story", description="...", category="growth", reads_count=10)
+        thread = mock.patch('app.counters.threading.Thread')
+        self.thread = thread.start()
+        self.addCleanup(thread.stop)
+
+    def reads(self):
+        return Story.objects.values_list('reads_count', flat=True).get(pk=self.story.pk)
+
+    def test_increments_are_flushed_in_one_update(self):
+        self.counters.seed(Story, self.story.pk, {'reads_count': 10})
+        for _ in range(3):
+            self.counters.incr(Story, self.story.pk, 'reads_count')
+        self.assertEqual(self.counters.overlay(Story, self.story.pk, {'reads_count': 0}, ['reads_count']), {'reads_count': 13})
+        self.assertEqual(self.reads(), 10)
+        self.thread.return_value.start.assert_called_once_with()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.counters.flush()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.reads(), 13)
+        self.counters.flush()
+        self.assertEqual(self.reads(), 13)
+
+    def test_seed_counts_unflushed_deltas(self):
+        self.counters.incr(Story, self.story.pk, 'reads_count', 2)
+        self.counters.seed(Story, self.story.pk, {'reads_count': 10})
+        self.assertEqual(cache.get(self.counters.key(Story, self.story.pk, 'reads_count')), 12)
+
+    def test_failed_flush_keeps_the_deltas(self):
+        self.counters.incr(Story, self.story.pk, 'reads_count', 2)
+        with mock.patch.object(QuerySet, 'update', side_effect=DataError("database down")), self.assertRaises(DataError):
+            self.counters.flush()
+        self.counters.incr(Story, self.story.pk, 'reads_count')
+        self.counters.flush()
+        self.assertEqual(self.reads(), 13)
+
+    def test_flush_loop(self):
+        self.counters.flush_interval = 0.01
+        self.counters.pending[(Story, self.story.pk, 'reads_count')] = 1
+        with mock.patch.object(self.counters, 'flush', side_effect=[None, SystemExit]) as flush, \
+                mock.patch('app.counters.close_old_connections'):
+            with self.assertRaises(SystemExit):
+                self.counters.flush_loop()
+        self.assertEqual(flush.call_count, 2)
+
+
+class ThrottleKeyTests(TestCase):
+    def cache_key(self, scope='react', **headers):
+        request = Request(APIRequestFactory().post("/", REMOTE_ADDR="203.0.113.7", **headers))
+        return KeyedRateThrottle().get_cache_key(request, scope)
+
+    def test_users_are_keyed_by_id(self):
+        user = User.objects.create_user("reader@example.com", "Reader")
+        drf_request = Request(APIRequestFactory().post("/", REMOTE_ADDR="203.0.113.7"))
+        drf_request.user = user
+        self.assertEqual(KeyedRateThrottle().get_cache_key(drf_request, 'react'), f'user:{user.pk}')
+
+    def test_existing_temp_users_are_keyed_by_id(self):
+        temp_user = TemporaryUser.objects.create()
+        self.assertEqual(self.cache_key(HTTP_X_TEMP_TOKEN=str(temp_user.token)), f'temp:{temp_user.pk}')
+
+    def test_unknown_or_malformed_tokens_fall_back_to_ip(self):
+        self.assertEqual(self.cache_key(HTTP_X_TEMP_TOKEN=str(uuid.uuid4())), 'ip:203.0.113.7')
+        self.assertEqual(self.cache_key(HTTP_X_TEMP_TOKEN="not-a-uuid"), 'ip:203.0.113.7')
+        self.assertEqual(self.cache_key(), 'ip:203.0.113.7')
+
+    def test_ip_only_scopes_ignore_tokens(self):
+        temp_user = TemporaryUser.objects.create()
+        self.assertEqual(self.cache_key('anon_login', HTTP_X_TEMP_TOKEN=str(temp_user.token)), 'ip:203.0.113.7')
+
+
+class StoryLikeTests(TestCase):
+    def setUp(self):
+        likes.chunk_cache.entries.clear()
+        self.story = Story.objects.create(title="Story", description="...", category="growth")
+
+    def test_encoding_round_trips(self):
+        cases = {
+            'empty': set(),
+            'sparse': {0, 1, 4095, 65535},
+            'array limit': set(range(0, 2 * StoryLikeChunk.ARRAY_MAX, 2)),
+            'bitmap': set(range(StoryLikeChunk.ARRAY_MAX + 1)),
+            'full': set(range(65536)),
+        }
+        for name, members in cases.items():
+            with self.subTest(name):
+                data = likes.encode(members)
+                self.assertEqual(likes.decode(data, len(members)), members)
+                expected = likes.BITMAP_BYTES if len(members) > StoryLikeChunk.ARRAY_MAX else 2 * len(members)
+                self.assertEqual(len(data), expected)
+
+    def test_ids_across_chunk_boundaries(self):
+        member_ids = [1, 65535, 65536, 131071, 2 ** 31 - 1]
+        for member_id in member_ids:
+            toggle_like(self.story.pk, 'user', member_id)
+        self.assertEqual(
+            sorted(StoryLikeChunk.objects.values_list('bucket', 'cardinality')),
+            [(0, 2), (1, 2), (32767, 1)],
+        )
+        for member_id in member_ids:
+            self.assertTrue(likes.has_liked(self.story.pk, 'user', member_id))
+        self.assertFalse(likes.has_liked(self.story.pk, 'user', 65537))
+        self.assertFalse(likes.has_liked(self.story.pk, 'temp', 1))
+        self.assertEqual(likes.members_with_likes('user', [1, 2, 65536, 65537]), {1, 65536})
+
+    def test_chunks_switch_between_array_and_bitmap(self):
+        with mock.patch.object(StoryLikeChunk, 'ARRAY_MAX', 4):
+            for member_id in range(6):
+                toggle_like(self.story.pk, 'user', member_id)
+            chunk = StoryLikeChunk.objects.get()
+            self.assertEqual((len(chunk.data), chunk.cardinality), (likes.BITMAP_BYTES, 6))
+            for member_id in range(3):
+                toggle_like(self.story.pk, 'user', member_id)
+            chunk.refresh_from_db()
+            self.assertEqual((len(chunk.data), chunk.cardinality), (6, 3))
+            self.assertEqual(likes.decode(chunk.data, chunk.cardinality), {3, 4, 5})
+
+    def test_a_member_is_counted_once(self):
+        before = Story.objects.values_list('changed_at', flat=True).get(pk=self.story.pk)
+        self.assertEqual(toggle_like(self.story.pk, 'user', 7), (True, 1))
+        self.assertEqual(toggle_like(self.story.pk, 'temp', 7), (True, 2))
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.likes_count, 2)
+        self.assertGreater(self.story.changed_at, before)
+
+        # Liking again takes the like back rather than counting it twice.
+        self.assertEqual(toggle_like(self.story.pk, 'user', 7), (False, 1))
+        self.assertEqual(toggle_like(self.story.pk, 'user', 7), (True, 2))
+        self.assertEqual(likes.count_likes(self.story.pk), 2)
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.likes_count, 2)
+
+    def test_like_endpoint(self):
+        user = User.objects.create_user("reader@example.com", "Reader")
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f"/api/stories/{self.story.pk}/like/"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(url).json()['likes_count'], 1)
+        self.assertEqual(client.get(url).json(), {'liked': True})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(url).json(), {'message': "Unliked", 'liked': False, 'likes_count': 0})
+        self.assertEqual(client.get(url).json(), {'liked': False})
+
+
+@mock.patch('app.scheduler.publish_status')
+class RoomSchedulerTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user("host@example.com", "Host")
+        self.now = timezone.now()
+
+    def room(self, seconds):
+        return DiscussionRoom.objects.create(
+            created_by=self.creator, topic="Room", description="...",
+            start_datetime=self.now + datetime.timedelta(seconds=seconds),
+        )
+
+    def at(self, seconds):
+        return self.now + datetime.timedelta(seconds=seconds)
+
+    def test_rooms_start_at_their_start_time(self, publish_status):
+        soon, edge, later = self.room(10), self.room(3600), self.room(3601)
+        scheduler = RoomScheduler(horizon=3600)
+        scheduler.refresh(self.now)
+        self.assertEqual(set(scheduler.due), {soon.pk, edge.pk})
+
+        self.assertEqual(scheduler.activate_due(self.at(9)), [])
+        self.assertEqual(scheduler.activate_due(self.at(10)), [soon.pk])
+        publish_status.assert_called_once_with(soon.pk, 'active')
+        soon.refresh_from_db()
+        self.assertEqual(soon.status, 'active')
+
+        # Extending the horizon picks up rooms past the old one, once.
+        scheduler.refresh(self.at(60))
+        self.assertEqual(set(scheduler.due), {edge.pk, later.pk})
+        self.assertEqual(len(scheduler.heap), 2)
+
+        self.assertEqual(scheduler.activate_due(self.at(3600)), [edge.pk])
+        self.assertEqual(scheduler.activate_due(self.at(3601)), [later.pk])
+        self.assertEqual(scheduler.heap, [])
+        self.assertEqual(DiscussionRoom.objects.filter(status='active').count(), 3)
+
+    def test_changes_are_picked_up(self, publish_status):
+        postponed, brought_forward, started, deleted = self.room(10), self.room(7200), self.room(20), self.room(30)
+        deleted_pk = deleted.pk
+        scheduler = RoomScheduler(horizon=3600)
+        scheduler.refresh(self.now)
+
+        postponed.start_datetime = self.at(5000)
+        postponed.save()
+        brought_forward.start_datetime = self.at(15)
+        brought_forward.save()
+        started.status = 'active'
+        started.save()
+        deleted.delete()
+
+        scheduler.refresh(self.at(1))
+        # Deleted rooms leave no changed_at; their entry expires unmatched.
+        self.assertEqual(set(scheduler.due), {brought_forward.pk, deleted_pk})
+        self.assertEqual(scheduler.activate_due(self.at(100)), [brought_forward.pk])
+        self.assertEqual(scheduler.due, {})
+        publish_status.assert_called_once_with(brought_forward.pk, 'active')
+
+        postponed.refresh_from_db()
+        self.assertEqual(postponed.status, 'scheduled')
+
+    def test_rescheduled_room_is_not_started_early(self, publish_status):
+        room = self.room(10)
+        scheduler = RoomScheduler(horizon=3600)
+        scheduler.refresh(self.now)
+        # Moved after the last refresh: the guarded update doesn't match.
+        DiscussionRoom.objects.filter(pk=room.pk).update(start_datetime=self.at(600))
+
+        self.assertEqual(scheduler.activate_due(self.at(10)), [])
+        publish_status.assert_not_called()
+        room.refresh_from_db()
+        self.assertEqual(room.status, 'scheduled')
+
+
+class LifespanTests(SimpleTestCase):
+    async def run_lifespan(self, *messages):
+        communicator = ApplicationCommunicator(serving.lifespan, {'type': 'lifespan'})
+        sent = []
+        for message in messages:
+            await communicator.send_input({'type': message})
+            sent.append(await communicator.receive_output(timeout=5))
+        if sent[-1]['type'] == 'lifespan.startup.complete':
+            # Still serving; a real server would send lifespan.shutdown.
+            await communicator.wait(timeout=0.1)
+        else:
+            await communicator.wait(timeout=5)
+        return sent
+
+    @mock.patch('app.serving.flush_writes')
+    @mock.patch('app.serving.warm_up', return_value={'imports': 0.01})
+    async def test_startup_and_shutdown(self, warm_up, flush_writes):
+        sent = await self.run_lifespan('lifespan.startup', 'lifespan.shutdown')
+        self.assertEqual(sent, [{'type': 'lifespan.startup.complete'}, {'type': 'lifespan.shutdown.complete'}])
+        warm_up.assert_called_once_with()
+        flush_writes.assert_called_once_with()
+
+    @mock.patch('app.serving.warm_up', side_effect=RuntimeError("no database"))
+    async def test_failed_warmup_fails_startup(self, warm_up):
+        sent = await self.run_lifespan('lifespan.startup')
+        self.assertEqual(sent, [{'type': 'lifespan.startup.failed', 'message': "RuntimeError('no database')"}])
+
+    @override_settings(ASGI_WARMUP=False)
+    @mock.patch('app.serving.warm_up')
+    async def test_warmup_can_be_disabled(self, warm_up):
+        sent = await self.run_lifespan('lifespan.startup')
+        self.assertEqual(sent, [{'type': 'lifespan.startup.complete'}])
+        warm_up.assert_not_called()
+
+    @mock.patch('app.serving.connections')
+    @mock.patch('app.serving.close_old_connections')
+    @mock.patch('app.serving.counters')
+    def test_shutdown_writes_buffered_counters(self, counters, close_old_connections, connections):
+        serving.flush_writes()
+        counters.flush.assert_called_once_with()
+        connections.close_all.assert_called_once_with()
+
+
+@override_settings(BATCH_THREADS=1)
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("reader@example.com", "Reader", "pass")
+        self.post = Post.objects.create(title="Saved", description="...")
+        SavedPost.objects.create(post=self.post, user=self.user)
+        self.story = Story.objects.create(title="Story", description="...", category="growth")
+
+    def batch(self, *paths, **data):
+        return self.client.post("/api/batch/", {'requests': [{'path': path} for path in paths], **data}, format='json')
+
+    def test_items_use_the_batch_authentication(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        toggle_like(self.story.pk, 'user', self.user.pk)
+        with mock.patch.object(JWTAuthentication, 'authenticate', autospec=True, side_effect=JWTAuthentication.authenticate) as authenticate:
+            response = self.batch("/api/posts/saved/", f"/api/stories/{self.story.pk}/like/")
+        self.assertEqual(response.status_code, 200)
+        saved, liked = response.json()['responses']
+        self.assertEqual((saved['status'], [post['id'] for post in saved['body']['results']]), (200, [self.post.pk]))
+        self.assertEqual(liked['body'], {'liked': True})
+        # Authenticated once for the whole batch.
+        self.assertEqual(authenticate.call_count, 1)
+
+    def test_anonymous_items_are_rejected_individually(self):
+        response = self.batch("/api/posts/saved/", "/api/posts/")
+        self.assertEqual([item['status'] for item in response.json()['responses']], [401, 200])
+
+    def test_temp_token_is_forwarded(self):
+        temp_user = TemporaryUser.objects.create()
+        toggle_like(self.story.pk, 'temp', temp_user.pk)
+        path = f"/api/stories/{self.story.pk}/like/"
+        response = self.batch(path, temp_token=str(temp_user.token))
+        self.assertEqual(response.json()['responses'][0]['body'], {'liked': True})
+        response = self.client.post("/api/batch/", {'requests': [{'path': path}]}, format='json', HTTP_X_TEMP_TOKEN=str(temp_user.token))
+        self.assertEqual(response.json()['responses'][0]['body'], {'liked': True})
+        response = self.batch(path)
+        self.assertEqual(response.json()['responses'][0]['status'], 400)
+
+    def test_invalid_batches_are_rejected(self):
+        cases = {
+            'empty': {'requests': []},
+            'too many': {'requests': [{'path': "/api/posts/"}] * (batch.MAX_REQUESTS + 1)},
+            'outside the API': {'requests': [{'path': "/admin/"}]},
+            'nested batch': {'requests': [{'path': "/api/batch/"}]},
+            'not a read': {'requests': [{'path': "/api/posts/", 'method': "POST"}]},
+        }
+        for name, data in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.client.post("/api/batch/", data, format='json').status_code, 400)
+        response = self.client.post("/api/batch/", {'requests': [{'path': "/api/posts/", 'method': "GET"}] * batch.MAX_REQUESTS}, format='json')
+        self.assertEqual(len(response.json()['responses']), batch.MAX_REQUESTS)
+        self.assertEqual(self.client.get("/api/batch/").status_code, 405)
+
+    def test_failed_items_do_not_fail_the_batch(self):
+        items = [
+            {'id': "a", 'path': "/api/tags/"},
+            {'id': "b", 'path': "/api/nowhere/"},
+            {'id': "c", 'path': "/api/posts/?fields=id,title"},
+        ]
+        with mock.patch('app.views.TagViewSet.list', side_effect=RuntimeError("boom")), \
+                self.assertLogs('app.batch', 'ERROR'):
+            response = self.client.post("/api/batch/", {'requests': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        failed, missing, ok = response.json()['responses']
+        self.assertEqual((failed['id'], failed['status'], failed['body']), ("a", 500, {'detail': 'Internal server error.'}))
+        self.assertEqual((missing['id'], missing['status']), ("b", 404))
+        self.assertEqual((ok['id'], ok['status'], ok['body']), ("c", 200, [{'id': self.post.pk, 'title': "Saved"}]))
+        self.assertIn('ETag', ok['headers'])
+
+
+class RetentionTests(TestCase):
+    def test_purge_keeps_temp_users_who_liked_a_story(self):
+        story = Story.objects.create(title="Story", description="...", category="growth")
+        idle, liker = TemporaryUser.objects.create(), TemporaryUser.objects.create()
+        TemporaryUser.objects.update(created_at=timezone.now() - datetime.timedelta(days=60))
+        toggle_like(story.pk, 'temp', liker.pk)
+
+        self.assertEqual(sum(purge_temporary_users(sleep=0)), 1)
+        self.assertEqual(list(TemporaryUser.objects.values_list('pk', flat=True)), [liker.pk])
+
+
+class RoomStatusTests(TestCase):
+    def test_start_succeeds_when_publishing_fails(self):
+        user = User.objects.create_user("host@example.com", "Host")
+        room = DiscussionRoom.objects.create(created_by=user, topic="Topic", description="...", start_datetime=timezone.now())
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch('app.scheduler.get_channel_layer', side_effect=ConnectionError("redis down")), \
+                self.assertLogs('app.scheduler', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = client.post(f"/api/rooms/{room.pk}/start/")
+        self.assertEqual(response.status_code, 200)
+        room.refresh_from_db()
+        self.assertEqual(room.status, 'active')
+
+
+class ChatResumeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("host@example.com", "Host")
+        self.room = DiscussionRoom.objects.create(created_by=self.user, topic="Topic", description="...", start_datetime=timezone.now())
+        self.events = [chat.message_event(chat.post_message(self.room.pk, self.user, f"Message {i}")) for i in range(1, 6)]
+        buffers = mock.patch('app.consumers.room_buffers', chat.RoomBuffers())
+        self.buffers = buffers.start()
+        self.addCleanup(buffers.stop)
+
+    def buffer(self, *seqs):
+        for seq in seqs:
+            self.buffers.get(str(self.room.pk)).append(self.events[seq - 1])
+
+    async def resume(self, since):
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket', 'path': f"/ws/discussion/{self.room.pk}/",
+            'query_string': f"since={since}".encode(), 'headers': [], 'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+        return communicator, await self.drain(communicator)
+
+    async def drain(self, communicator):
+        received = []
+        while not await communicator.receive_nothing(timeout=0.05):
+            received.append(json.loads((await communicator.receive_output())['text']))
+        return received
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait()
+
+    async def send_live(self, event):
+        await get_channel_layer().group_send(chat.room_group(self.room.pk), event)
+
+    def seqs(self, received):
+        return [event['seq'] for event in received if event['type'] == 'chat_message']
+
+    async def test_replays_from_the_buffer(self):
+        self.buffer(1, 2, 3, 4, 5)
+        with mock.patch('app.consumers.load_events') as load_events:
+            communicator, received = await self.resume(2)
+        load_events.assert_not_called()
+        self.assertEqual(self.seqs(received), [3, 4, 5])
+        await self.disconnect(communicator)
+
+    async def test_falls_back_to_the_database(self):
+        # The buffer starts after the client's seq...
+        self.buffer(4, 5)
+        communicator, received = await self.resume(1)
+        self.assertEqual(self.seqs(received), [2, 3, 4, 5])
+        await self.disconnect(communicator)
+
+        # ...or ends before the room's last one.
+        self.buffers.rooms.clear()
+        self.buffer(1, 2, 3)
+        communicator, received = await self.resume(1)
+        self.assertEqual(self.seqs(received), [2, 3, 4, 5])
+        await self.disconnect(communicator)
+
+    async def test_marks_history_beyond_the_replay_limit(self):
+        with mock.patch.object(chat, 'REPLAY_LIMIT', 2):
+            communicator, received = await self.resume(0)
+        self.assertEqual(received[0], {'type': 'history_gap', 'from_seq': 1, 'to_seq': 3})
+        self.assertEqual(self.seqs(received), [4, 5])
+        await self.disconnect(communicator)
+
+    async def test_live_messages_are_not_repeated(self):
+        communicator, received = await self.resume(3)
+        self.assertEqual(self.seqs(received), [4, 5])
+        await self.send_live(self.events[4])
+        await self.send_live({**self.events[4], 'seq': 6})
+        self.assertEqual(self.seqs(await self.drain(communicator)), [6])
+        await self.disconnect(communicator)
+
+    async def test_seq_past_the_last_message(self):
+        communicator, received = await self.resume(99)
+        self.assertEqual(received, [])
+        await self.send_live({**self.events[4], 'seq': 6})
+        self.assertEqual(self.seqs(await self.drain(communicator)), [6])
+        await self.disconnect(communicator)
+
+    def test_rooms_leave_out_last_seq(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertNotIn('last_seq', client.get(f"/api/rooms/{self.room.pk}/").json())
+        response = client.post("/api/create/", {
+            'topic': "New", 'description': "...", 'start_datetime': timezone.now().isoformat(), 'last_seq': 40,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('last_seq', response.json())
+        self.assertEqual(DiscussionRoom.objects.get(pk=response.json()['id']).last_seq, 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser("admin@example.com", "Admin", "pass")
+        for i in range(3):
+            Post.objects.create(title=f"Export {i}", description="...")
+
+    async def test_asgi_export_is_an_async_stream(self):
+        await self.async_client.aforce_login(self.admin_user)
+        response = await self.async_client.get("/api/export/posts/")
+        self.assertTrue(response.is_async)
+        lines = b"".join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ["Export 0", "Export 1", "Export 2"])
+
+    def test_wsgi_export(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get("/api/export/posts/?gzip=1")
+        self.assertFalse(response.is_async)
+        self.assertEqual(len(gzip.decompress(b"".join(response.streaming_content)).splitlines()), 3)
+
+
+class RelatedPostTests(TestCase):
+    def test_edit_refills_the_lists_a_post_leaves(self):
+        posts = [
+            Post.objects.create(title=f"Cannot sleep at night {i}", description=f"insomnia keeps me awake, tried melatonin {i}")
+            for i in range(related.TOP_K + 3)
+        ]
+        related.rebuild()
+        first = posts[0]
+        listing_first = set(RelatedPost.objects.filter(related=first).values_list('post_id', flat=True))
+        self.assertTrue(listing_first)
+
+        Post.objects.filter(pk=first.pk).update(title="Job interview tips", description="salary negotiation for a career change")
+        related.refresh_post(first.pk)
+
+        self.assertFalse(RelatedPost.objects.filter(related=first).exists())
+        for post_id in listing_first:
+            self.assertEqual(RelatedPost.objects.filter(post_id=post_id).count(), related.TOP_K)
+
+
+class DuplicateIndexTests(TestCase):
+    TEXT = ("How do I stop overthinking at night", "My mind races about work every night and I cannot fall asleep.")
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "duplicates.idx")
+        self.index = DuplicateIndex(self.path)
+        self.index.refresh_interval = 0
+
+    def matches(self, title, description):
+        return [post_id for _, post_id in self.index.query(title, description)]
+
+    def write_empty_snapshot(self):
+        write_snapshot(self.path, [], timezone.now() - datetime.timedelta(minutes=5))
+
+    def test_sync_finds_posts_committed_out_of_id_order(self):
+        self.write_empty_snapshot()
+        self.index.load()
+        # This worker indexes its own new post right away...
+        self.index.add(1000, *self.TEXT)
+        # ...while another worker's post with a lower id commits later.
+        late = Post.objects.create(pk=500, title=self.TEXT[0], description=self.TEXT[1])
+        self.assertIn(late.pk, self.matches(*self.TEXT))
+
+    def test_sync_reindexes_edited_posts(self):
+        self.write_empty_snapshot()
+        post = Post.objects.create(title=self.TEXT[0], description=self.TEXT[1])
+        self.index.load()
+        self.assertIn(post.pk, self.matches(*self.TEXT))
+        Post.objects.filter(pk=post.pk).update(title="Best budget laptop", description="Looking for a laptop for programming.", changed_at=timezone.now())
+        self.assertNotIn(post.pk, self.matches(*self.TEXT))
+
+    def test_snapshot_plus_later_posts(self):
+        old = Post.objects.create(title=self.TEXT[0], description=self.TEXT[1])
+        write_snapshot(self.path, [(old.pk, *self.TEXT)], timezone.now())
+        new = Post.objects.create(title=self.TEXT[0] + " again", description=self.TEXT[1])
+        self.index.load()
+        self.assertEqual(set(self.matches(*self.TEXT)), {old.pk, new.pk})
+        self.assertIn(old.pk, self.index.snapshot.doc_ids)
+
+    def test_reload_unmaps_the_old_snapshot(self):
+        write_snapshot(self.path, [], timezone.now())
+        self.index.load()
+        first = self.index.snapshot
+        write_snapshot(self.path, [], timezone.now())
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        self.index.sync()
+        self.assertIsNot(self.index.snapshot, first)
+        self.assertIsNone(first.map)
+
+    def test_missing_snapshot_only_indexes_new_posts(self):
+        old = Post.objects.create(title=self.TEXT[0], description=self.TEXT[1])
+        Post.objects.filter(pk=old.pk).update(changed_at=timezone.now() - datetime.timedelta(hours=1))
+        with self.assertLogs('app.duplicates', 'WARNING'):
+            self.index.load()
+        new = Post.objects.create(title=self.TEXT[0] + " again", description=self.TEXT[1])
+        self.assertEqual(self.matches(*self.TEXT), [new.pk])
+
+        # The builder's snapshot is picked up on the next sync.
+        write_snapshot(self.path, [(old.pk, *self.TEXT)], timezone.now())
+        self.assertEqual(set(self.matches(*self.TEXT)), {old.pk, new.pk})
+
+    def test_corrupt_snapshot_is_not_loaded(self):
+        write_snapshot(self.path, [(1, *self.TEXT)], timezone.now())
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for name, content in [('empty', b''), ('header only', data[:20]), ('truncated', data[:-2]), ('foreign', b'x' * len(data))]:
+            with self.subTest(name):
+                with open(self.path, 'wb') as f:
+                    f.write(content)
+                with self.assertLogs('app.duplicates', 'WARNING'):
+                    self.index.load()
+                self.assertIsNone(self.index.snapshot.built_at)
+                self.assertEqual(self.matches(*self.TEXT), [])
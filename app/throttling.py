@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .models import TemporaryUser
+
+
+# -------------------------------
+# Rate limiting for write endpoints
+# -------------------------------
+#
+# Rates are DRF-style strings ("30/min") in
+# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], one per scope. Both backends
+# keep O(1) state per client: the local one a single GCRA timestamp, the
+# cache one two fixed-window counters combined into a sliding window.
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60)."""
+    count, period = rate.split('/')
+    seconds = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return int(count), seconds
+
+
+class LocalBackend:
+    """
+    Generic cell rate algorithm in process memory: per key only the
+    theoretical arrival time of the next request is stored. Limits apply
+    per process.
+    """
+    max_keys = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = OrderedDict()   # (scope, key) -> theoretical arrival time
+        self.rejected = Counter()
+
+    def hit(self, scope, key, limit, period):
+        """Return (allowed, retry_after_seconds)."""
+        interval = period / limit
+        now = time.monotonic()
+        with self.lock:
+            tat = max(self.tats.get((scope, key), now), now)
+            allow_at = tat + interval - period
+            if now < allow_at:
+                return False, allow_at - now
+            self.tats[(scope, key)] = tat + interval
+            self.tats.move_to_end((scope, key))
+            if len(self.tats) > self.max_keys:
+                # Oldest entries first; a TAT in the past is the same as none.
+                self.tats.popitem(last=False)
+        return True, 0.0
+
+    def record_rejection(self, scope):
+        with self.lock:
+            self.rejected[scope] += 1
+
+    def rejections(self, scopes):
+        with self.lock:
+            return {scope: self.rejected[scope] for scope in scopes}
+
+
+class CacheBackend:
+    """
+    Sliding-window counter in the shared Django cache: the previous
+    window's count, weighted by how much of it still overlaps the window,
+    plus the current one. Needs an atomic incr() (Redis, Memcached) to be
+    exact under concurrency.
+    """
+
+    def key(self, scope, key, window):
+        return f'throttle:{scope}:{key}:{window}'
+
+    def hit(self, scope, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        elapsed = (now % period) / period
+        current_key = self.key(scope, key, window)
+
+        cache.add(current_key, 0, period * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr().
+            cache.set(current_key, 1, period * 2)
+            current = 1
+        previous = cache.get(self.key(scope, key, window - 1), 0)
+
+        if previous * (1 - elapsed) + current <= limit:
+            return True, 0.0
+
+        # Rejected attempts don't count against the window.
+        try:
+            cache.decr(current_key)
+        except ValueError:
+            pass
+        if previous and current <= limit:
+            # Wait until enough of the previous window has slid out.
+            free_at = 1 - (limit - current + 1) / previous
+            return False, max(free_at - elapsed, 0) * period
+        return False, (1 - elapsed) * period
+
+    def record_rejection(self, scope):
+        key = f'throttle:rejected:{scope}'
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+    def rejections(self, scopes):
+        counts = cache.get_many([f'throttle:rejected:{scope}' for scope in scopes])
+        return {scope: counts.get(f'throttle:rejected:{scope}', 0) for scope in scopes}
+
+
+BACKENDS = {'local': LocalBackend, 'cache': CacheBackend}
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[getattr(settings, 'THROTTLE_BACKEND', 'cache')]()
+    return _backend
+
+
+def throttle_stats():
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    rejected = get_backend().rejections(list(rates))
+    return {scope: {'rate': rate, 'rejected': rejected[scope]} for scope, rate in rates.items()}
+
+
+class KeyedRateThrottle(BaseThrottle):
+    """
+    Throttle keyed by user id, else an existing temporary user, else
+    client IP. Tokens nobody was issued go by IP: anyone can make one up
+    per request.
+    The scope comes from the view's ``throttle_scopes`` (action -> scope)
+    or ``throttle_scope``, falling back to the class's ``scope``; views
+    without a scope, or scopes without a rate, are not limited.
+    """
+    scope = None
+    # Anonymous login mints temp tokens, so those scopes go by IP only.
+    ip_only_scopes = ('anon_login',)
+
+    def get_scope(self, view):
+        scopes = getattr(view, 'throttle_scopes', None)
+        if scopes is not None:
+            return scopes.get(getattr(view, 'action', None))
+        return getattr(view, 'throttle_scope', None) or self.scope
+
+    def get_cache_key(self, request, scope):
+        user = getattr(request, 'user', None)
+        if scope not in self.ip_only_scopes:
+            if user is not None and user.is_authenticated:
+                return f'user:{user.pk}'
+            temp_user_id = self.get_temp_user_id(request)
+            if temp_user_id is not None:
+                return f'temp:{temp_user_id}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_temp_user_id(self, request):
+        token = request.headers.get('X-Temp-Token') or request.query_params.get('temp_token')
+        if not token and isinstance(request.data, dict):
+            token = request.data.get('temp_token')
+        try:
+            token = uuid.UUID(str(token)) if token else None
+        except ValueError:
+            return None
+        if token is None:
+            return None
+        return TemporaryUser.objects.filter(token=token).values_list('id', flat=True).first()
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        limit, period = parse_rate(rate)
+        backend = get_backend()
+        allowed, self.retry_after = backend.hit(scope, self.get_cache_key(request, scope), limit, period)
+        if not allowed:
+            backend.record_rejection(scope)
+        return allowed
+
+    def wait(self):
+        return math.ceil(self.retry_after) if self.retry_after else None
@@ -20,9 +20,13 @@ urlpatterns = [
     path("api/signup/", SignupView.as_view(), name="signup"),
     path("api/login/", LoginView.as_view(), name="login"),
     path("api/anonymous-login/", AnonymousLoginView.as_view(), name="anonymous-login"),
+    path("api/users/bulk/", BulkProvisionView.as_view(), name="users-bulk"),
     path("api/stories/", StoryListCreateView.as_view(), name="story-list"),
     path("api/stories/<int:pk>/", StoryDetailView.as_view(), name="story-detail"),
     path("api/stories/<int:story_id>/like/", like_story, name="story-like"),
+    path("api/export/posts/", ExportPostsView.as_view(), name="export-posts"),
+    path("api/throttle/stats/", ThrottleStatsView.as_view(), name="throttle-stats"),
+    path("api/batch/", BatchView.as_view(), name="batch"),
 
 
 ]
\ No newline at end of file
@@ -1,25 +1,144 @@
-from rest_framework import viewsets, mixins, status
+from rest_framework import viewsets, mixins, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Case, CharField, Count, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.http import Http404
 import random
+import uuid
 
-from .models import Post, Reply, Tag, TemporaryUser, Reaction, ReplyReaction
-from .serializers import PostListSerializer, PostDetailSerializer, ReplySerializer, TagSerializer, TemporaryUserSerializer
+from .models import Post, Reply, Tag, TemporaryUser, Reaction, ReplyReaction, SavedPost
+from .serializers import PostListSerializer, PostDetailSerializer, ReplySerializer, TagSerializer, TemporaryUserSerializer, PostListProjectionSerializer, PostReplySerializer, requested_fieldset
 from .permissions import CanPostAnonymous
+from .pagination import ReplyPagination, SavedPostPagination, EstimatedCountPagination
+from .conditional import ConditionalGetMixin
+from .tag_index import tag_index
+from .objectcache import post_cache, story_cache
+from .counters import counters
+from .throttling import KeyedRateThrottle, throttle_stats
+from .jobs import enqueue
+from .duplicates import duplicate_index, suggest_duplicates
+from . import feeds, likes
+
+
+def parse_temp_token(request):
+    # The caller's temp token as a UUID, or None when absent or malformed.
+    token = request.query_params.get('temp_token') or request.headers.get('X-Temp-Token')
+    try:
+        return uuid.UUID(str(token)) if token else None
+    except ValueError:
+        return None
+
+
+def request_temp_user_id(request):
+    # Id of the caller's existing TemporaryUser, looked up once per request
+    # (batched sub-requests arrive with it already set).
+    outer = request._request
+    if not hasattr(outer, 'temp_user_id'):
+        token = parse_temp_token(request)
+        outer.temp_user_id = TemporaryUser.objects.filter(token=token).values_list('id', flat=True).first() if token else None
+    return outer.temp_user_id
+
+
+class SparseFieldsetMixin:
+    # Prunes the queryset to what ?fields= / ?expand= ask for (see
+    # DynamicFieldsMixin.prune_queryset).
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'prune_queryset'):
+            queryset = serializer_class.prune_queryset(queryset, self.request)
+        return queryset
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CachedRetrieveMixin:
+    # Serves retrieve, and ConditionalGetMixin's validators, from
+    # ``object_cache`` (see objectcache.py). ?expand= bypasses it.
+    object_cache = None
+
+    def get_cache_entry(self):
+        if not hasattr(self, '_cache_entry'):
+            self._cache_entry = None
+            if self.request.method in ('GET', 'HEAD') and not requested_fieldset(self.request)[1]:
+                try:
+                    pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+                except (KeyError, TypeError, ValueError):
+                    pk = None
+                if pk is not None:
+                    self._cache_entry = self.object_cache.get(pk)
+        return self._cache_entry
+
+    def get_object_version(self, lookup_value):
+        entry = self.get_cache_entry()
+        if entry is not None:
+            return entry['pk'], entry['version']
+        return super().get_object_version(lookup_value)
+
+    def retrieve_response(self, request, *args, **kwargs):
+        entry = self.get_cache_entry()
+        if entry is None:
+            return super().retrieve_response(request, *args, **kwargs)
+        fields, _ = requested_fieldset(request)
+        return Response(self.object_cache.representation(entry, fields))
+
+
+class ProjectionListMixin:
+    # Serializes many=True results of read-only list actions with a
+    # ProjectionSerializer; single objects and writes use the normal one.
+    # ?expand= needs nested serializers, so it falls back as well.
+    projection_serializer_class = None
+    projection_actions = ('list',)
+
+    def uses_projection(self):
+        action = getattr(self, 'action', None)
+        if action is None:
+            action = 'list' if self.request.method == 'GET' else None
+        return action in self.projection_actions and not requested_fieldset(self.request)[1]
+
+    def paginate_queryset(self, queryset):
+        # The projection re-selects its rows by pk, so a page only needs
+        # the pks, not model instances and their prefetches.
+        if self.projection_serializer_class and self.uses_projection() and isinstance(queryset, QuerySet):
+            queryset = queryset.prefetch_related(None).values_list('pk', flat=True)
+        return super().paginate_queryset(queryset)
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and self.projection_serializer_class and self.uses_projection():
+            kwargs.setdefault('context', self.get_serializer_context())
+            return self.projection_serializer_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
-class PostViewSet(viewsets.ModelViewSet):
+    # -----------------------------
+    # 🔎 Prefix autocomplete, most used tags first
+    # -----------------------------
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        prefix = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(tag_index.search(prefix, limit))
+
+class PostViewSet(CachedRetrieveMixin, ConditionalGetMixin, ProjectionListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Post.objects.prefetch_related('tags', 'reactions').all()
     permission_classes = [CanPostAnonymous]
+    object_cache = post_cache
+    throttle_classes = [KeyedRateThrottle]
+    throttle_scopes = {'create': 'post_create', 'react': 'react', 'save': 'save'}
+    projection_serializer_class = PostListProjectionSerializer
+    projection_actions = ('list', 'recommended', 'random_feed', 'mixed_feed', 'related')
+    pagination_class = EstimatedCountPagination
 
     def get_serializer_class(self):
-        if self.action in ['list', 'recommended', 'random_feed', 'mixed_feed']:
+        if self.action in ['list', 'recommended', 'random_feed', 'mixed_feed', 'related']:
             return PostListSerializer
         return PostDetailSerializer
 
@@ -42,22 +161,34 @@ class PostViewSet(viewsets.ModelViewSet):
             else:
                 temp_user = TemporaryUser.objects.create()
                 serializer.save(temp_author=temp_user, hide_identity=True)
+        post = serializer.instance
+        # Other workers pick the post up on their next index sync.
+        transaction.on_commit(lambda: duplicate_index.add(post.pk, post.title, post.description))
 
     # -----------------------------
     # 🌀 Random Feed for Homepage
     # -----------------------------
     @action(detail=False, methods=['get'])
     def random_feed(self, request):
-        count = Post.objects.count()
-        sample_size = min(10, count)
-        if count == 0:
+        ids = list(Post.objects.order_by().values_list('id', flat=True))
+        if not ids:
             return Response([])
-        random_indices = random.sample(range(count), sample_size)
-        posts = list(Post.objects.all()[0:count])
-        posts = [posts[i] for i in random_indices]
+        sample = random.sample(ids, min(10, len(ids)))
+        posts = Post.objects.filter(id__in=sample).order_by(
+            Case(*[When(id=pk, then=position) for position, pk in enumerate(sample)])
+        )
         serializer = self.get_serializer(posts, many=True)
         return Response(serializer.data)
 
+    feed_build_interval = 300
+
+    def feed_owner(self, request):
+        # ('user_id' | 'temp_user_id', id) of the caller's home feed.
+        if request.user.is_authenticated:
+            return 'user_id', request.user.id
+        temp_user_id = request_temp_user_id(request)
+        return ('temp_user_id', temp_user_id) if temp_user_id else None
+
     # -----------------------------
     # 🤖 Personalized Recommendations
     # -----------------------------
@@ -87,6 +218,19 @@ class PostViewSet(viewsets.ModelViewSet):
     # -----------------------------
     @action(detail=False, methods=['get'])
     def mixed_feed(self, request):
+        owner = self.feed_owner(request)
+        if owner is not None:
+            ids = feeds.read_feed(*owner)
+            if ids:
+                posts = Post.objects.filter(id__in=ids).order_by(
+                    Case(*[When(id=pk, then=position) for position, pk in enumerate(ids)])
+                )
+                return Response(self.get_serializer(posts, many=True).data)
+            # Cold or stale feed: build it in the background, at most once
+            # per feed_build_interval, and serve the sampled feed meanwhile.
+            if cache.add(f'feed:build:{owner[0]}:{owner[1]}', 1, self.feed_build_interval):
+                enqueue('build_feed', field=owner[0], owner_id=owner[1])
+
         random_feed_response = self.random_feed(request)
         recommended_feed_response = self.recommended(request)
 
@@ -98,6 +242,67 @@ class PostViewSet(viewsets.ModelViewSet):
 
         return Response(mixed_posts[:20])
 
+    # -----------------------------
+    # 🪞 Possible duplicates of a question being written
+    # -----------------------------
+    @action(detail=False, methods=['post'])
+    def duplicates(self, request):
+        title = request.data.get('title') or ''
+        description = request.data.get('description') or ''
+        if not isinstance(title, str) or not isinstance(description, str):
+            return Response({'detail': 'title and description must be strings'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(suggest_duplicates(title, description))
+
+    # -----------------------------
+    # 🧭 Similar posts (precomputed, see related.py)
+    # -----------------------------
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        posts = Post.objects.filter(neighbour_of__post_id=pk).order_by('-neighbour_of__score')
+        data = self.get_serializer(posts, many=True).data
+        if not data and not Post.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(data)
+
+    # -----------------------------
+    # 💬 Replies of one post, with helpfulness counts
+    # -----------------------------
+    @action(detail=True, methods=['get'], url_path='replies', url_name='replies')
+    def replies(self, request, pk=None):
+        if not Post.objects.filter(pk=pk).exists():
+            raise Http404
+
+        # Counts are stored on the reply; the caller's own reaction is a
+        # correlated subquery, so each ordering stays an index range scan.
+        if request.user.is_authenticated:
+            mine = ReplyReaction.objects.filter(user=request.user)
+        else:
+            # Callers without a known temporary user have no reactions; a
+            # NULL token lookup would match everyone's temp_user-less rows.
+            temp_user_id = request_temp_user_id(request)
+            mine = ReplyReaction.objects.filter(temp_user_id=temp_user_id) if temp_user_id is not None else None
+        if mine is not None:
+            my_reaction = Subquery(mine.filter(reply=OuterRef('pk')).order_by('reaction').values('reaction')[:1])
+        else:
+            my_reaction = Value(None, output_field=CharField())
+        queryset = Reply.objects.filter(post_id=pk).select_related('author__profile', 'temp_author').annotate(my_reaction=my_reaction)
+
+        sort = request.query_params.get('sort', 'oldest')
+        if sort not in self.REPLY_ORDERINGS:
+            return Response({'detail': f"sort must be one of {', '.join(self.REPLY_ORDERINGS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.order_by(*self.REPLY_ORDERINGS[sort])
+
+        paginator = ReplyPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = PostReplySerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    REPLY_ORDERINGS = {
+        'oldest': ('created_at', 'id'),
+        'newest': ('-created_at', '-id'),
+        'helpful': ('-score', 'created_at', 'id'),
+    }
+
     @action(detail=True, methods=['post'])
     def react(self, request, pk=None):
         post = self.get_object()
@@ -122,16 +327,39 @@ class PostViewSet(viewsets.ModelViewSet):
         post = self.get_object()
         if not request.user.is_authenticated:
             return Response({'detail': 'Authentication required to save posts.'}, status=status.HTTP_401_UNAUTHORIZED)
-        if request.user in post.saved_by.all():
-            post.saved_by.remove(request.user)
+        deleted, _ = SavedPost.objects.filter(post=post, user=request.user).delete()
+        if deleted:
             return Response({'status': 'unsaved'})
-        post.saved_by.add(request.user)
+        SavedPost.objects.get_or_create(post=post, user=request.user)
         return Response({'status': 'saved'})
 
-class ReplyViewSet(viewsets.ModelViewSet):
+    # -----------------------------
+    # 🔖 My saved posts, most recently saved first
+    # -----------------------------
+    @action(detail=False, methods=['get'])
+    def saved(self, request):
+        if not request.user.is_authenticated:
+            return Response({'detail': 'Authentication required to list saved posts.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Page query on the (user, -saved_at) index, then the posts, tags,
+        # authors and reaction counts for the page: three queries in all.
+        paginator = SavedPostPagination()
+        page = paginator.paginate_queryset(
+            SavedPost.objects.filter(user=request.user).only('id', 'post_id', 'saved_at'), request, view=self,
+        )
+        posts = PostListProjectionSerializer([saved.post_id for saved in page], context=self.get_serializer_context()).data
+        saved_at = {saved.post_id: saved.saved_at for saved in page}
+        datetime_field = serializers.DateTimeField()
+        for post in posts:
+            post['saved_at'] = datetime_field.to_representation(saved_at[post['id']])
+        return paginator.get_paginated_response(posts)
+
+class ReplyViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Reply.objects.select_related('post').all()
     serializer_class = ReplySerializer
     permission_classes = [CanPostAnonymous]
+    throttle_classes = [KeyedRateThrottle]
+    throttle_scopes = {'react': 'react'}
 
     def perform_create(self, serializer):
         temp_token = self.request.data.get('temp_token') or self.request.headers.get('X-Temp-Token')
@@ -154,19 +382,45 @@ class ReplyViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'invalid reaction'}, status=status.HTTP_400_BAD_REQUEST)
         temp_token = request.data.get('temp_token') or request.headers.get('X-Temp-Token')
         if request.user.is_authenticated:
-            obj, created = ReplyReaction.objects.get_or_create(reply=reply, user=request.user, reaction=reaction)
-            if not created:
-                obj.delete()
-                return Response({'status': 'removed'})
-            return Response({'status': 'added'})
+            owner = {'user': request.user}
         elif temp_token:
             temp_user, _ = TemporaryUser.objects.get_or_create(token=temp_token)
-            obj, created = ReplyReaction.objects.get_or_create(reply=reply, temp_user=temp_user, reaction=reaction)
-            if not created:
-                obj.delete()
-                return Response({'status': 'removed'})
-            return Response({'status': 'added'})
-        return Response({'detail': 'temp_token required'}, status=status.HTTP_400_BAD_REQUEST)
+            owner = {'temp_user': temp_user}
+        else:
+            return Response({'detail': 'temp_token required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The reaction row and the reply's counts/score change together;
+        # the row lock serialises concurrent reactions to the same reply.
+        with transaction.atomic():
+            reply = Reply.objects.select_for_update().get(pk=reply.pk)
+            result = self.toggle_reaction(reply, reaction, owner)
+            reply.refresh_score()
+            reply.save(update_fields=['helpful_count', 'not_satisfied_count', 'score'])
+        return Response({'status': result})
+
+    def toggle_reaction(self, reply, reaction, owner):
+        counts = {'helpful': 'helpful_count', 'not_satisfied': 'not_satisfied_count'}
+
+        def bump(name, delta):
+            setattr(reply, counts[name], max(getattr(reply, counts[name]) + delta, 0))
+
+        existing = ReplyReaction.objects.filter(reply=reply, reaction=reaction, **owner).first()
+        if existing:
+            existing.delete()
+            bump(reaction, -1)
+            return 'removed'
+        if 'user' in owner:
+            # A user holds one reaction per reply: switching replaces it.
+            previous = ReplyReaction.objects.filter(reply=reply, **owner).first()
+            if previous:
+                bump(previous.reaction, -1)
+                previous.reaction = reaction
+                previous.save(update_fields=['reaction'])
+                bump(reaction, 1)
+                return 'added'
+        ReplyReaction.objects.create(reply=reply, reaction=reaction, **owner)
+        bump(reaction, 1)
+        return 'added'
 
 
 from rest_framework import generics, status
@@ -174,7 +428,9 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from .models import DiscussionRoom, DiscussionMessage
-from .serializers import DiscussionRoomSerializer, DiscussionMessageSerializer
+from .serializers import DiscussionRoomSerializer, DiscussionMessageSerializer, DiscussionRoomProjectionSerializer
+from .scheduler import publish_status
+from .chat import broadcast, message_event, post_message
 
 
 # Create a discussion room
@@ -187,12 +443,14 @@ class CreateRoomView(generics.CreateAPIView):
         serializer.save(created_by=self.request.user)
 
 
-class RoomListView(generics.ListAPIView):
+class RoomListView(ConditionalGetMixin, ProjectionListMixin, SparseFieldsetMixin, generics.ListAPIView):
     queryset = DiscussionRoom.objects.all().order_by('-created_at')
     serializer_class = DiscussionRoomSerializer
+    projection_serializer_class = DiscussionRoomProjectionSerializer
+    pagination_class = EstimatedCountPagination
 
 
-class RoomDetailView(generics.RetrieveAPIView):
+class RoomDetailView(ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
     queryset = DiscussionRoom.objects.all()
     serializer_class = DiscussionRoomSerializer
 
@@ -244,6 +502,7 @@ class StartRoomView(generics.GenericAPIView):
 
         room.status = "active"
         room.save()
+        transaction.on_commit(lambda: publish_status(room.pk, "active"))
 
         return Response({"message": "Room started"})
 
@@ -260,7 +519,9 @@ class EndRoomView(generics.GenericAPIView):
             return Response({"error": "Only creator can end"}, status=403)
 
         room.status = "ended"
+        room.ended_at = timezone.now()
         room.save()
+        transaction.on_commit(lambda: publish_status(room.pk, "ended"))
 
         return Response({"message": "Room ended"})
 
@@ -271,8 +532,11 @@ class SendMessageView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        room = DiscussionRoom.objects.get(id=self.kwargs['room_id'])
-        serializer.save(sender=self.request.user, room=room)
+        room_id = self.kwargs['room_id']
+        message = post_message(room_id, self.request.user, serializer.validated_data['message'], serializer.validated_data.get('reply_to'))
+        serializer.instance = message
+        event = message_event(message)
+        transaction.on_commit(lambda: broadcast(room_id, event))
 
 
 # accounts/views.py
@@ -283,8 +547,10 @@ from rest_framework.permissions import AllowAny
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .serializers import SignupSerializer, LoginSerializer, AnonymousLoginSerializer
+from rest_framework.permissions import IsAdminUser
+from .serializers import SignupSerializer, LoginSerializer, AnonymousLoginSerializer, BulkProvisionSerializer
 from .models import TemporaryUser
+from .provisioning import Provisioner
 
 
 def get_tokens_for_user(user):
@@ -342,6 +608,8 @@ class LoginView(GenericAPIView):
 class AnonymousLoginView(GenericAPIView):
     serializer_class = AnonymousLoginSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [KeyedRateThrottle]
+    throttle_scope = "anon_login"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -365,22 +633,41 @@ class AnonymousLoginView(GenericAPIView):
 
 
 
+# CREATE MANY ACCOUNTS AT ONCE (partner onboarding)
+class BulkProvisionView(GenericAPIView):
+    serializer_class = BulkProvisionSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        provisioner = Provisioner(processes=1, with_tokens=serializer.validated_data["issue_tokens"])
+        result = provisioner.run(serializer.validated_data["users"])
+
+        return Response(result, status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK)
+
+
 
 from rest_framework import generics, permissions
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from django.db.models import F
+from django.utils import timezone
 from .models import Story
-from .serializers import StorySerializer
+from .serializers import StorySerializer, StoryProjectionSerializer
 
 # CREATE + LIST STORIES
-class StoryListCreateView(generics.ListCreateAPIView):
+class StoryListCreateView(ConditionalGetMixin, ProjectionListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Story.objects.all().order_by("-created_at")
     serializer_class = StorySerializer
+    projection_serializer_class = StoryProjectionSerializer
+    pagination_class = EstimatedCountPagination
+    weak_etag = True
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        queryset = Story.objects.all().order_by("-created_at")
+        queryset = super().get_queryset()
         category = self.request.query_params.get("category")
 
         if category:
@@ -390,25 +677,122 @@ class StoryListCreateView(generics.ListCreateAPIView):
 
 
 # RETRIEVE SINGLE STORY + INCREASE READ COUNT
-class StoryDetailView(generics.RetrieveAPIView):
+class StoryDetailView(CachedRetrieveMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
     queryset = Story.objects.all()
     serializer_class = StorySerializer
     permission_classes = [permissions.AllowAny]
+    weak_etag = True
+    object_cache = story_cache
 
     def get(self, request, *args, **kwargs):
-        story = self.get_object()
-        
-        Story.objects.filter(id=story.id).update(reads_count=F('reads_count') + 1)
+        # Reads are counted even when the client revalidates with a 304;
+        # the counter is buffered and written back in batches.
+        counters.incr(Story, kwargs['pk'], 'reads_count')
 
         return super().get(request, *args, **kwargs)
 
 
-# LIKE A STORY
-@api_view(["POST"])
+class StoryLikeThrottle(KeyedRateThrottle):
+    scope = "story_like"
+
+    def allow_request(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return super().allow_request(request, view)
+
+
+# LIKE / UNLIKE A STORY (GET: has the caller liked it?)
+@api_view(["GET", "POST"])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([StoryLikeThrottle])
 def like_story(request, story_id):
-    try:
-        Story.objects.filter(id=story_id).update(likes_count=F("likes_count") + 1)
-        return Response({"message": "Liked"})
-    except Story.DoesNotExist:
+    if not Story.objects.filter(id=story_id).exists():
         return Response({"error": "Story not found"}, status=404)
+
+    if request.user.is_authenticated:
+        kind, member_id = "user", request.user.id
+    else:
+        temp_token = parse_temp_token(request)
+        if temp_token is None and request.method == "POST" and request.data.get("temp_token"):
+            try:
+                temp_token = uuid.UUID(str(request.data["temp_token"]))
+            except ValueError:
+                pass
+        if not temp_token:
+            return Response({"detail": "temp_token required"}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method == "POST":
+            temp_user, _ = TemporaryUser.objects.get_or_create(token=temp_token)
+            member_id = temp_user.id
+        else:
+            member_id = TemporaryUser.objects.filter(token=temp_token).values_list("id", flat=True).first()
+        kind = "temp"
+
+    if request.method == "GET":
+        liked = member_id is not None and likes.has_liked(story_id, kind, member_id)
+        return Response({"liked": liked})
+
+    liked, likes_count = likes.toggle_like(story_id, kind, member_id)
+    return Response({"message": "Liked" if liked else "Unliked", "liked": liked, "likes_count": likes_count})
+
+
+# -------------------------------
+# Export
+# -------------------------------
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
+from .exports import SINCE_FIELDS, aiter_chunks, iter_gzip, iter_ndjson, iter_post_records, parse_since
+from .batch import run_batch
+from .serializers import BatchSerializer
+
+
+# STREAM POSTS WITH REPLIES/REACTIONS/TAGS AS NDJSON (optionally gzipped)
+class ExportPostsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        since = request.query_params.get("since")
+        since_field = request.query_params.get("since_field", "updated_at")
+        if since_field not in SINCE_FIELDS:
+            return Response({"error": f"since_field must be one of {', '.join(SINCE_FIELDS)}"}, status=400)
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError as exc:
+                return Response({"error": str(exc)}, status=400)
+
+        stream = iter_ndjson(iter_post_records(since, since_field))
+        gzipped = request.query_params.get("gzip") in ("1", "true")
+        if gzipped:
+            stream = iter_gzip(stream)
+        if isinstance(request._request, ASGIRequest):
+            stream = aiter_chunks(stream)
+        response = StreamingHttpResponse(stream, content_type="application/gzip" if gzipped else "application/x-ndjson")
+        if gzipped:
+            response["Content-Disposition"] = 'attachment; filename="posts.ndjson.gz"'
+        return response
+
+
+# REJECTED REQUEST COUNTS PER THROTTLE SCOPE
+class ThrottleStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(throttle_stats())
+
+
+# SEVERAL GET REQUESTS IN ONE ROUND TRIP
+class BatchView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        temp_token = serializer.validated_data.get('temp_token') or parse_temp_token(request)
+        temp_user_id = None
+        if temp_token and not request.user.is_authenticated:
+            temp_user_id = TemporaryUser.objects.filter(token=temp_token).values_list('id', flat=True).first()
+        responses = run_batch(request, serializer.validated_data['requests'], temp_token, temp_user_id)
+        return Response({'responses': responses})